@@ -0,0 +1,735 @@
+"""Local stand-in for the Shopify Admin GraphQL API
+
+Serves the queries and mutations shopify-price-manager-cli.py sends, against
+a synthetic catalog held in memory, so the tool can be exercised and
+benchmarked without a real store. It does not parse GraphQL: requests are
+dispatched on their operation name and answered in the shape the CLI selects.
+
+Query cost is estimated the way Shopify does it (a connection costs 2 plus
+first x the cost of one node, every node costs 1, mutations cost 10) and
+charged against a leaky bucket, returning THROTTLED errors and
+extensions.cost.throttleStatus like the real API. Bulk operations, staged
+uploads and their result files are served from the same server.
+
+Run it standalone and point the CLI at it with SHOPIFY_API_URL:
+
+    python benchmarks/mock_shopify_server.py --variants 10000 --port 8787
+    SHOPIFY_API_URL=http://127.0.0.1:8787/admin/api/2025-04/graphql.json python shopify-price-manager-cli.py
+"""
+
+import argparse
+import email.parser
+import email.policy
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+GRAPHQL_PATH = "/admin/api/2025-04/graphql.json"
+
+# Shopify rejects single queries that request more than this many points
+MAX_SINGLE_QUERY_COST = 1000
+
+MUTATION_COST = 10
+
+class Catalog:
+    """Synthetic products, variants, collections and price lists"""
+
+    def __init__(self, variants=1000, variants_per_product=4, price_lists=2, price_list_coverage=0.5,
+                 collections=5, seed=1):
+        rng = random.Random(seed)
+        self.products = []
+        self.variants = {}
+        self.collections = []
+        self.price_lists = []
+
+        product_count = max(1, -(-variants // variants_per_product))
+        variant_number = 0
+        created_at = utc_timestamp()
+        for product_number in range(1, product_count + 1):
+            product = {
+                "id": f"gid://shopify/Product/{product_number}",
+                "title": f"Product {product_number}",
+                "handle": f"product-{product_number}",
+                "tags": [tag for tag, every in (("clearance", 10), ("summer", 3)) if product_number % every == 0],
+                "updatedAt": created_at,
+                "variants": []
+            }
+            for position in range(1, variants_per_product + 1):
+                if variant_number >= variants:
+                    break
+                variant_number += 1
+                price = Decimal(rng.randint(500, 20000)) / 100
+                variant = {
+                    "id": f"gid://shopify/ProductVariant/{variant_number}",
+                    "title": f"Variant {position}",
+                    "sku": f"SKU-{product_number}-{position}",
+                    "price": format_amount(price),
+                    "compareAtPrice": None,
+                    "productId": product["id"]
+                }
+                self.variants[variant["id"]] = variant
+                product["variants"].append(variant["id"])
+            self.products.append(product)
+        self.products_by_id = {product["id"]: product for product in self.products}
+
+        for collection_number in range(1, collections + 1):
+            self.collections.append({
+                "id": f"gid://shopify/Collection/{collection_number}",
+                "title": f"Collection {collection_number}",
+                "products": [product["id"] for product in self.products[collection_number - 1::collections]]
+            })
+        self.collections_by_id = {collection["id"]: collection for collection in self.collections}
+
+        currencies = ["EUR", "GBP", "CAD", "AUD", "JPY", "CHF"]
+        for list_number in range(1, price_lists + 1):
+            currency = currencies[(list_number - 1) % len(currencies)]
+            prices = {}
+            for variant_id, variant in self.variants.items():
+                if rng.random() < price_list_coverage:
+                    prices[variant_id] = {
+                        "price": {"amount": format_amount(Decimal(variant["price"]) * Decimal("0.9")), "currencyCode": currency},
+                        "compareAtPrice": None
+                    }
+            self.price_lists.append({
+                "id": f"gid://shopify/PriceList/{list_number}",
+                "name": f"Market {list_number} ({currency})",
+                "currency": currency,
+                "prices": prices
+            })
+        self.price_lists_by_id = {price_list["id"]: price_list for price_list in self.price_lists}
+
+    def variant_node(self, variant_id):
+        variant = self.variants[variant_id]
+        return {key: variant[key] for key in ("id", "title", "sku", "price", "compareAtPrice")}
+
+    def price_node(self, variant_id, price):
+        return {"price": price["price"], "compareAtPrice": price["compareAtPrice"], "variant": {"id": variant_id}}
+
+    def live_price_node(self, variant_id, price):
+        variant = self.variants[variant_id]
+        node = self.price_node(variant_id, price)
+        node["variant"].update(sku=variant["sku"], product={"id": variant["productId"]})
+        return node
+
+class CostBucket:
+    """Leaky bucket of query cost points, as used by the Admin GraphQL API"""
+
+    def __init__(self, maximum_available=2000.0, restore_rate=100.0):
+        self.maximum_available = maximum_available
+        self.restore_rate = restore_rate
+        self.available = maximum_available
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.maximum_available, self.available + (now - self.updated_at) * self.restore_rate)
+        self.updated_at = now
+
+    def take(self, cost):
+        """Charge cost points, returning False if the bucket can't cover them"""
+        with self.lock:
+            self._refill()
+            if self.available < cost:
+                return False
+            self.available -= cost
+            return True
+
+    def refund(self, points):
+        with self.lock:
+            self._refill()
+            self.available = min(self.maximum_available, self.available + points)
+
+    def status(self):
+        with self.lock:
+            self._refill()
+            return {
+                "maximumAvailable": self.maximum_available,
+                "currentlyAvailable": int(self.available),
+                "restoreRate": self.restore_rate
+            }
+
+class MockShopify:
+    """Answers GraphQL operations against a Catalog and keeps request statistics"""
+
+    def __init__(self, catalog, bucket=None, latency=0.0, jitter=0.0, files_dir=None):
+        self.catalog = catalog
+        self.bucket = bucket or CostBucket()
+        self.latency = latency
+        self.jitter = jitter
+        self.files_dir = files_dir or tempfile.mkdtemp(prefix="mock_shopify_")
+        self.base_url = ""
+        self.lock = threading.Lock()
+        self.bulk_operations = {}
+        self.handlers = {
+            "GetProduct": self.get_product,
+            "GetProductVariants": self.get_product_variants,
+            "GetProductsById": self.get_products_by_id,
+            "GetProductsVariants": self.get_products_variants,
+            "GetProducts": self.get_products,
+            "GetProductIds": self.get_product_ids,
+            "GetProductsByCollection": self.get_products_by_collection,
+            "GetCollections": self.get_collections,
+            "GetCollectionProductIds": self.get_collection_product_ids,
+            "GetPriceLists": self.get_price_lists,
+            "GetPriceListPrices": self.get_price_list_prices,
+            "GetVariantPrices": self.get_variant_prices,
+            "GetLivePriceListPrices": self.get_live_price_list_prices,
+            "GetLiveVariantPrices": self.get_live_variant_prices,
+            "GetBulkOperation": self.get_bulk_operation,
+            "productVariantsBulkUpdate": self.product_variants_bulk_update,
+            "priceListFixedPricesAdd": self.price_list_fixed_prices_add,
+            "bulkOperationRunQuery": self.bulk_operation_run_query,
+            "bulkOperationRunMutation": self.bulk_operation_run_mutation,
+            "stagedUploadsCreate": self.staged_uploads_create,
+        }
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "cost": 0, "throttled": 0, "operations": {}}
+
+    def get_stats(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+    def _count(self, operation, cost=0, throttled=False):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["cost"] += cost
+            self.stats["throttled"] += int(throttled)
+            counts = self.stats["operations"].setdefault(operation, {"requests": 0, "cost": 0, "throttled": 0})
+            counts["requests"] += 1
+            counts["cost"] += cost
+            counts["throttled"] += int(throttled)
+
+    def execute(self, query, variables):
+        """Answer one GraphQL request, returning the response body"""
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        operation = operation_name(query)
+        handler = self.handlers.get(operation)
+        if handler is None:
+            self._count(operation)
+            return {"errors": [{"message": f"Unsupported operation {operation}"}]}
+
+        requested_cost = requested_query_cost(operation, variables)
+        if requested_cost > MAX_SINGLE_QUERY_COST:
+            self._count(operation)
+            return {
+                "errors": [{
+                    "message": f"Query cost is {requested_cost}, which exceeds the single query max cost limit ({MAX_SINGLE_QUERY_COST}).",
+                    "extensions": {"code": "MAX_COST_EXCEEDED", "cost": requested_cost, "maxCost": MAX_SINGLE_QUERY_COST}
+                }]
+            }
+
+        if not self.bucket.take(requested_cost):
+            self._count(operation, throttled=True)
+            return {
+                "errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+                "extensions": {"cost": {
+                    "requestedQueryCost": requested_cost,
+                    "actualQueryCost": None,
+                    "throttleStatus": self.bucket.status()
+                }}
+            }
+
+        data, returned = handler(variables)
+
+        # Like Shopify, charge for what the query returned and refund the rest
+        actual_cost = min(requested_cost, actual_query_cost(operation, variables, returned))
+        self.bucket.refund(requested_cost - actual_cost)
+        self._count(operation, actual_cost)
+
+        return {
+            "data": data,
+            "extensions": {"cost": {
+                "requestedQueryCost": requested_cost,
+                "actualQueryCost": actual_cost,
+                "throttleStatus": self.bucket.status()
+            }}
+        }
+
+    # Queries return (data, nodes returned per connection level) so the
+    # actual cost can be worked out
+
+    def _variants_connection(self, product, variables, size_key="variantsBatchSize", cursor=None):
+        nodes, page_info = page(product["variants"], cursor, variables[size_key])
+        with self.lock:
+            edges = [{"node": self.catalog.variant_node(variant_id)} for variant_id in nodes]
+        return {"pageInfo": page_info, "edges": edges}
+
+    def _product_node(self, product, variables):
+        return {
+            "id": product["id"],
+            "title": product["title"],
+            "handle": product["handle"],
+            "tags": product["tags"],
+            "variants": self._variants_connection(product, variables)
+        }
+
+    def get_product(self, variables):
+        product = self.catalog.products_by_id.get(variables["productId"])
+        if product is None:
+            return {"product": None}, [0]
+        node = self._product_node(product, variables)
+        return {"product": node}, [len(node["variants"]["edges"])]
+
+    def get_product_variants(self, variables):
+        product = self.catalog.products_by_id.get(variables["productId"])
+        if product is None:
+            return {"product": None}, [0]
+        variants = self._variants_connection(product, variables, "batchSize", variables.get("cursor"))
+        return {"product": {"variants": variants}}, [len(variants["edges"])]
+
+    def get_products_by_id(self, variables):
+        nodes = []
+        for product_id in variables["ids"]:
+            product = self.catalog.products_by_id.get(product_id)
+            nodes.append(self._product_node(product, variables) if product else None)
+        return {"nodes": nodes}, [len(nodes), sum(len(node["variants"]["edges"]) for node in nodes if node)]
+
+    def get_products_variants(self, variables):
+        # Aliased query: p<n> is the variants page of $id<n> after $cursor<n>
+        data = {}
+        returned = 0
+        for i in range(aliased_count(variables)):
+            product = self.catalog.products_by_id.get(variables[f"id{i}"])
+            if product is None:
+                data[f"p{i}"] = None
+                continue
+            variants = self._variants_connection(product, variables, "batchSize", variables.get(f"cursor{i}"))
+            data[f"p{i}"] = {"variants": variants}
+            returned += len(variants["edges"])
+        return data, [returned]
+
+    def _products_connection(self, products, variables):
+        nodes, page_info = page(products, variables.get("cursor"), variables["batchSize"])
+        edges = [{"node": self._product_node(self.catalog.products_by_id[product_id], variables)} for product_id in nodes]
+        nested = sum(len(edge["node"]["variants"]["edges"]) for edge in edges)
+        return {"pageInfo": page_info, "edges": edges}, [len(edges), nested]
+
+    def get_products(self, variables):
+        updated_after = updated_since(variables.get("queryString"))
+        with self.lock:
+            product_ids = [
+                product["id"] for product in self.catalog.products
+                if updated_after is None or product["updatedAt"] > updated_after
+            ]
+        connection, returned = self._products_connection(product_ids, variables)
+        return {"products": connection}, returned
+
+    def get_product_ids(self, variables):
+        nodes, page_info = page(self.catalog.products, variables.get("cursor"), variables["batchSize"])
+        return {"products": {"pageInfo": page_info, "nodes": [{"id": product["id"]} for product in nodes]}}, [len(nodes)]
+
+    def get_products_by_collection(self, variables):
+        collection = self.catalog.collections_by_id.get(variables["collectionId"])
+        if collection is None:
+            return {"collection": None}, [0, 0]
+        connection, returned = self._products_connection(collection["products"], variables)
+        return {"collection": {"id": collection["id"], "title": collection["title"], "products": connection}}, returned
+
+    def get_collections(self, variables):
+        nodes, page_info = page(self.catalog.collections, variables.get("cursor"), variables["batchSize"])
+        edges = [{"node": {"id": c["id"], "title": c["title"], "productsCount": len(c["products"])}} for c in nodes]
+        return {"collections": {"pageInfo": page_info, "edges": edges}}, [len(edges)]
+
+    def get_collection_product_ids(self, variables):
+        collection = self.catalog.collections_by_id.get(variables["collectionId"])
+        if collection is None:
+            return {"collection": None}, [0]
+        nodes, page_info = page(collection["products"], variables.get("cursor"), variables["batchSize"])
+        return {"collection": {"products": {"pageInfo": page_info, "nodes": [{"id": product_id} for product_id in nodes]}}}, [len(nodes)]
+
+    def get_price_lists(self, variables):
+        nodes, page_info = page(self.catalog.price_lists, variables.get("cursor"), variables["batchSize"])
+        edges = [
+            {"node": {"id": p["id"], "name": p["name"], "currency": p["currency"], "fixedPricesCount": len(p["prices"])}}
+            for p in nodes
+        ]
+        return {"priceLists": {"pageInfo": page_info, "edges": edges}}, [len(edges)]
+
+    def get_price_list_prices(self, variables, node=None):
+        node = node or self.catalog.price_node
+        price_list = self.catalog.price_lists_by_id.get(variables["priceListId"])
+        if price_list is None:
+            return {"priceList": None}, [0]
+        filters = parse_search_query(variables.get("queryString"))
+        with self.lock:
+            variant_ids = [
+                variant_id for variant_id in price_list["prices"]
+                if "variant_id" not in filters or variant_id.split("/")[-1] in filters["variant_id"]
+            ]
+            variant_ids, page_info = page(variant_ids, variables.get("cursor"), variables["batchSize"])
+            nodes = [node(variant_id, price_list["prices"][variant_id]) for variant_id in variant_ids]
+        return {"priceList": {"prices": {"pageInfo": page_info, "nodes": nodes}}}, [len(nodes)]
+
+    def get_live_price_list_prices(self, variables):
+        return self.get_price_list_prices(variables, self.catalog.live_price_node)
+
+    def get_variant_prices(self, variables, fields=("id", "price", "compareAtPrice")):
+        filters = parse_search_query(variables.get("queryString"))
+        variant_ids = list(self.catalog.variants)
+        if "product_id" in filters:
+            variant_ids = [
+                variant_id for variant_id in variant_ids
+                if self.catalog.variants[variant_id]["productId"].split("/")[-1] in filters["product_id"]
+            ]
+        if "id" in filters:
+            variant_ids = [variant_id for variant_id in variant_ids if variant_id.split("/")[-1] in filters["id"]]
+        variant_ids, page_info = page(variant_ids, variables.get("cursor"), variables["batchSize"])
+        with self.lock:
+            nodes = [
+                {key: self.catalog.variants[variant_id][key] for key in fields}
+                for variant_id in variant_ids
+            ]
+        return {"productVariants": {"pageInfo": page_info, "nodes": nodes}}, [len(nodes)]
+
+    def get_live_variant_prices(self, variables):
+        result, returned = self.get_variant_prices(variables, ("id", "sku", "price", "compareAtPrice", "productId"))
+        for node in result["productVariants"]["nodes"]:
+            node["product"] = {"id": node.pop("productId")}
+        return result, returned
+
+    def get_bulk_operation(self, variables):
+        operation = self.bulk_operations.get(variables["id"])
+        return {"node": operation}, []
+
+    # Mutations
+
+    def product_variants_bulk_update(self, variables):
+        product = self.catalog.products_by_id.get(variables["productId"])
+        if product is None:
+            user_errors = [{"field": ["productId"], "message": "Product does not exist"}]
+            return {"productVariantsBulkUpdate": {"product": None, "productVariants": None, "userErrors": user_errors}}, []
+
+        user_errors = []
+        updated = []
+        with self.lock:
+            for index, variant_input in enumerate(variables["variants"]):
+                variant = self.catalog.variants.get(variant_input.get("id"))
+                if variant is None or variant["productId"] != product["id"]:
+                    user_errors.append({"field": ["variants", str(index), "id"], "message": "Product variant does not exist"})
+                    continue
+                if "price" in variant_input:
+                    variant["price"] = format_amount(variant_input["price"])
+                if "compareAtPrice" in variant_input:
+                    compare_at_price = variant_input["compareAtPrice"]
+                    variant["compareAtPrice"] = format_amount(compare_at_price) if compare_at_price is not None else None
+                updated.append({"id": variant["id"], "title": variant["title"], "price": variant["price"]})
+            if updated:
+                product["updatedAt"] = utc_timestamp()
+
+        return {"productVariantsBulkUpdate": {
+            "product": {"id": product["id"], "title": product["title"]},
+            "productVariants": updated,
+            "userErrors": user_errors
+        }}, []
+
+    def price_list_fixed_prices_add(self, variables):
+        price_list = self.catalog.price_lists_by_id.get(variables["priceListId"])
+        if price_list is None:
+            user_errors = [{"field": ["priceListId"], "message": "Price list does not exist"}]
+            return {"priceListFixedPricesAdd": {"prices": None, "userErrors": user_errors}}, []
+
+        user_errors = []
+        added = []
+        with self.lock:
+            for index, price_input in enumerate(variables["prices"]):
+                if price_input.get("variantId") not in self.catalog.variants:
+                    user_errors.append({"field": ["prices", str(index), "variantId"], "message": "Variant not found"})
+                    continue
+                price = price_input["price"]
+                if price.get("currencyCode") != price_list["currency"]:
+                    user_errors.append({"field": ["prices", str(index), "price", "currencyCode"],
+                                        "message": "Currency must match the price list currency"})
+                    continue
+                compare_at_price = price_input.get("compareAtPrice")
+                price_list["prices"][price_input["variantId"]] = {
+                    "price": {"amount": format_amount(price["amount"]), "currencyCode": price["currencyCode"]},
+                    "compareAtPrice": (
+                        {"amount": format_amount(compare_at_price["amount"]), "currencyCode": compare_at_price["currencyCode"]}
+                        if compare_at_price else None
+                    )
+                }
+                added.append({"price": price_list["prices"][price_input["variantId"]]["price"]})
+
+        return {"priceListFixedPricesAdd": {"prices": added, "userErrors": user_errors}}, []
+
+    def staged_uploads_create(self, variables):
+        targets = []
+        for upload in variables["input"]:
+            key = f"tmp/{uuid.uuid4().hex}/{upload['filename']}"
+            targets.append({
+                "url": f"{self.base_url}/staged-uploads",
+                "resourceUrl": f"{self.base_url}/staged-uploads/{key}",
+                "parameters": [{"name": "key", "value": key}]
+            })
+        return {"stagedUploadsCreate": {"stagedTargets": targets, "userErrors": []}}, []
+
+    def _finish_bulk_operation(self, records):
+        """Write a bulk operation's result file and record it as completed"""
+        operation_id = f"gid://shopify/BulkOperation/{len(self.bulk_operations) + 1}"
+        filename = f"bulk_{operation_id.split('/')[-1]}.jsonl"
+        with open(os.path.join(self.files_dir, filename), 'w') as f:
+            count = 0
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                count += 1
+        self.bulk_operations[operation_id] = {
+            "id": operation_id,
+            "status": "COMPLETED",
+            "errorCode": None,
+            "objectCount": str(count),
+            "url": f"{self.base_url}/files/{filename}" if count else None,
+            "partialDataUrl": None
+        }
+        return {"id": operation_id, "status": "CREATED"}
+
+    def _bulk_query_records(self, bulk_query):
+        catalog = self.catalog
+        if "priceLists" in bulk_query:
+            for price_list in catalog.price_lists:
+                yield {"id": price_list["id"], "name": price_list["name"], "currency": price_list["currency"],
+                       "fixedPricesCount": len(price_list["prices"])}
+                for variant_id, price in list(price_list["prices"].items()):
+                    yield dict(catalog.price_node(variant_id, price), __parentId=price_list["id"])
+        else:
+            for product in catalog.products:
+                yield {"id": product["id"], "title": product["title"], "handle": product["handle"], "tags": product["tags"]}
+                for variant_id in product["variants"]:
+                    yield dict(catalog.variant_node(variant_id), __parentId=product["id"])
+
+    def bulk_operation_run_query(self, variables):
+        bulk_operation = self._finish_bulk_operation(self._bulk_query_records(variables["query"]))
+        return {"bulkOperationRunQuery": {"bulkOperation": bulk_operation, "userErrors": []}}, []
+
+    def bulk_operation_run_mutation(self, variables):
+        mutation = operation_name(variables["mutation"])
+        handler = self.handlers.get(mutation)
+        path = os.path.join(self.files_dir, "uploads", variables["stagedUploadPath"])
+        if handler is None or not os.path.exists(path):
+            user_errors = [{"field": ["stagedUploadPath"], "message": "Invalid mutation or staged upload"}]
+            return {"bulkOperationRunMutation": {"bulkOperation": None, "userErrors": user_errors}}, []
+
+        def records():
+            with open(path) as f:
+                for line_number, line in enumerate(f):
+                    data, _ = handler(json.loads(line))
+                    yield {"data": data, "__lineNumber": line_number}
+
+        bulk_operation = self._finish_bulk_operation(records())
+        return {"bulkOperationRunMutation": {"bulkOperation": bulk_operation, "userErrors": []}}, []
+
+    def save_upload(self, content_type, body):
+        """Store a staged upload posted as multipart/form-data"""
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        fields = {}
+        file_content = None
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                file_content = part.get_payload(decode=True)
+            else:
+                fields[name] = part.get_content().strip()
+        if "key" not in fields or file_content is None:
+            return False
+        path = os.path.join(self.files_dir, "uploads", fields["key"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(file_content)
+        return True
+
+def operation_name(query):
+    """Name of a GraphQL operation, matching the CLI's own operation_name"""
+    match = re.match(r"\s*(?:query|mutation)\s+(\w+)", query)
+    if match:
+        return match.group(1)
+    match = re.search(r"\{\s*(\w+)", query)
+    return match.group(1) if match else "anonymous"
+
+def aliased_count(variables):
+    """Number of aliased sub-queries in a query that takes $id0, $id1, ..."""
+    return sum(1 for key in variables if re.fullmatch(r"id\d+", key))
+
+def connection_cost(first, node_cost=1):
+    return 2 + first * node_cost
+
+def requested_query_cost(operation, variables):
+    """Estimate the cost Shopify would charge up front for an operation"""
+    batch_size = variables.get("batchSize", 0)
+    variants_batch_size = variables.get("variantsBatchSize", 0)
+    if operation in ("GetProducts", "GetProductsByCollection"):
+        cost = connection_cost(batch_size, 1 + connection_cost(variants_batch_size))
+        return cost + (1 if operation == "GetProductsByCollection" else 0)
+    if operation == "GetProduct":
+        return 1 + connection_cost(variants_batch_size)
+    if operation == "GetProductsById":
+        return len(variables["ids"]) * (1 + connection_cost(variants_batch_size))
+    if operation == "GetProductsVariants":
+        return aliased_count(variables) * (1 + connection_cost(batch_size))
+    if operation in ("GetProductVariants", "GetPriceListPrices", "GetLivePriceListPrices", "GetCollectionProductIds"):
+        return 1 + connection_cost(batch_size)
+    if operation in ("GetCollections", "GetPriceLists", "GetVariantPrices", "GetLiveVariantPrices", "GetProductIds"):
+        return connection_cost(batch_size)
+    if operation == "GetBulkOperation":
+        return 1
+    return MUTATION_COST
+
+def actual_query_cost(operation, variables, returned):
+    """Cost of what a query actually returned, given node counts per connection level"""
+    if operation in ("GetProducts", "GetProductsByCollection"):
+        products, variants = returned
+        return 2 + products * 3 + variants + (1 if operation == "GetProductsByCollection" else 0)
+    if operation == "GetProductsById":
+        products, variants = returned
+        return products * 3 + variants
+    if operation == "GetProductsVariants":
+        return aliased_count(variables) * 3 + returned[0]
+    if operation in ("GetProduct", "GetProductVariants", "GetPriceListPrices", "GetLivePriceListPrices", "GetCollectionProductIds"):
+        return 1 + connection_cost(returned[0])
+    if operation in ("GetCollections", "GetPriceLists", "GetVariantPrices", "GetLiveVariantPrices", "GetProductIds"):
+        return connection_cost(returned[0])
+    return requested_query_cost(operation, variables)
+
+def page(items, cursor, first):
+    """Slice a list like a connection, using the offset as an opaque cursor"""
+    start = int(cursor) if cursor else 0
+    nodes = items[start:start + first]
+    has_next_page = start + first < len(items)
+    return nodes, {"hasNextPage": has_next_page, "endCursor": str(start + first) if has_next_page else None}
+
+def parse_search_query(query_string):
+    """Parse 'field:value OR field:value' search syntax into {field: {values}}"""
+    filters = {}
+    for field, value in re.findall(r"(\w+):(\S+)", query_string or ""):
+        filters.setdefault(field, set()).add(value)
+    return filters
+
+def updated_since(query_string):
+    """The timestamp in an "updated_at:>'...'" search filter, or None"""
+    match = re.search(r"updated_at:>'?([^'\s]+)'?", query_string or "")
+    return match.group(1) if match else None
+
+def utc_timestamp():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+def format_amount(amount):
+    """Format an amount with two decimals, as the Admin API returns Money values"""
+    return str(Decimal(str(amount)).quantize(Decimal("0.01")))
+
+class MockShopifyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def _reply(self, status, body=b"", content_type="application/json"):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        mock = self.server.mock
+        path = urlparse(self.path).path
+        body = self._read_body()
+
+        if path == GRAPHQL_PATH:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                self._reply(400, {"errors": [{"message": "Invalid JSON"}]})
+                return
+            self._reply(200, mock.execute(payload["query"], payload.get("variables") or {}))
+        elif path == "/staged-uploads":
+            if mock.save_upload(self.headers.get("Content-Type", ""), body):
+                self._reply(201)
+            else:
+                self._reply(400, b"Missing key or file", "text/plain")
+        elif path == "/stats/reset":
+            mock.reset_stats()
+            self._reply(200, mock.get_stats())
+        else:
+            self._reply(404)
+
+    def do_GET(self):
+        mock = self.server.mock
+        path = urlparse(self.path).path
+
+        if path == "/stats":
+            self._reply(200, mock.get_stats())
+        elif path.startswith("/files/"):
+            file_path = os.path.join(mock.files_dir, os.path.basename(path))
+            if not os.path.exists(file_path):
+                self._reply(404)
+                return
+            with open(file_path, 'rb') as f:
+                self._reply(200, f.read(), "application/jsonl")
+        else:
+            self._reply(404)
+
+def create_server(mock, host="127.0.0.1", port=0):
+    """Bind a threaded HTTP server for mock; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), MockShopifyHandler)
+    server.daemon_threads = True
+    server.mock = mock
+    mock.base_url = f"http://{host}:{server.server_address[1]}"
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Shopify Admin GraphQL API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787, help="Port to listen on (0 picks a free port)")
+    parser.add_argument("--variants", type=int, default=1000, help="Number of variants in the synthetic catalog")
+    parser.add_argument("--variants-per-product", type=int, default=4)
+    parser.add_argument("--price-lists", type=int, default=2)
+    parser.add_argument("--price-list-coverage", type=float, default=0.5,
+                        help="Fraction of variants with a fixed price in each price list")
+    parser.add_argument("--collections", type=int, default=5)
+    parser.add_argument("--maximum-available", type=float, default=2000.0, help="Cost bucket size")
+    parser.add_argument("--restore-rate", type=float, default=100.0, help="Cost points restored per second")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every GraphQL request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra latency of up to this many seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    catalog = Catalog(args.variants, args.variants_per_product, args.price_lists, args.price_list_coverage,
+                      args.collections, args.seed)
+    mock = MockShopify(catalog, CostBucket(args.maximum_available, args.restore_rate), args.latency, args.jitter)
+    server = create_server(mock, args.host, args.port)
+
+    # The bound port goes first on stdout so scripts can read it
+    print(f"{mock.base_url}{GRAPHQL_PATH}", flush=True)
+    print(f"Serving {len(catalog.products)} products / {len(catalog.variants)} variants, "
+          f"{len(catalog.price_lists)} price lists", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        shutil.rmtree(mock.files_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""End-to-end throughput benchmarks against the local mock Shopify server
+
+For every catalog size a mock_shopify_server.py process is started, then
+backup, discount and restore are run in turn, each in a fresh Python process
+so its peak RSS is its own. Requests, cost points and throttled requests are
+read from the server; wall time and peak RSS are reported by the scenario
+process.
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 100000
+    python benchmarks/run_benchmarks.py --sizes 10000 --bulk-backup --bulk-mutation --output results.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+SERVER_PATH = os.path.join(BENCHMARK_DIR, "mock_shopify_server.py")
+
+SCENARIOS = ("backup", "discount", "restore")
+
+def load_cli():
+    """Import the module behind the CLI script"""
+    sys.path.insert(0, REPO_DIR)
+    return importlib.import_module("shopify_price_manager")
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_scenario(args):
+    """Run one scenario in this process and write its result as JSON"""
+    cli = load_cli()
+    cli.BULK_POLL_INTERVAL = 0.5
+    cli.setup_logging(f"benchmark_{args.scenario}")
+
+    result = {}
+    start = time.perf_counter()
+    if args.scenario == "backup":
+        if args.bulk_backup:
+            result["backup_file"] = cli.backup_all_products_bulk("benchmark")
+        else:
+            result["backup_file"] = cli.backup_all_products("benchmark")
+    elif args.scenario == "discount":
+        outcome = cli.apply_bulk_discount(
+            args.backup_file, 20, True, workers=args.workers, use_bulk_mutation=args.bulk_mutation
+        )
+    elif args.scenario == "restore":
+        outcome = cli.restore_bulk_prices(
+            args.backup_file, workers=args.workers, use_bulk_mutation=args.bulk_mutation
+        )
+    if args.scenario != "backup":
+        if outcome is None:
+            sys.exit(f"{args.scenario} could not run")
+        result["success"], result["errors"] = outcome
+    result["wall_time"] = time.perf_counter() - start
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    with open(args.result_file, 'w') as f:
+        json.dump(result, f)
+
+def start_server(args, variants):
+    """Start a mock server process for a catalog size and return (process, graphql_url)"""
+    command = [
+        sys.executable, SERVER_PATH, "--port", "0",
+        "--variants", str(variants),
+        "--variants-per-product", str(args.variants_per_product),
+        "--price-lists", str(args.price_lists),
+        "--maximum-available", str(args.maximum_available),
+        "--restore-rate", str(args.restore_rate),
+        "--latency", str(args.latency),
+        "--jitter", str(args.jitter)
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError("Mock server failed to start")
+    return process, url
+
+def benchmark_size(args, variants):
+    """Run every scenario against a fresh catalog of the given size"""
+    process, url = start_server(args, variants)
+    server_url = url.split("/admin/")[0]
+    results = []
+    backup_file = None
+    try:
+        with tempfile.TemporaryDirectory(prefix="price_benchmark_") as work_dir:
+            env = dict(os.environ, SHOPIFY_API_URL=url, ACCESS_TOKEN="benchmark", MAX_WORKERS=str(args.workers))
+            for scenario in args.scenarios:
+                requests.post(f"{server_url}/stats/reset", timeout=10).raise_for_status()
+
+                result_file = os.path.join(work_dir, f"{scenario}.result.json")
+                command = [sys.executable, os.path.abspath(__file__), "--scenario", scenario,
+                           "--result-file", result_file, "--workers", str(args.workers)]
+                if backup_file:
+                    command += ["--backup-file", backup_file]
+                if args.bulk_backup:
+                    command.append("--bulk-backup")
+                if args.bulk_mutation:
+                    command.append("--bulk-mutation")
+
+                # Scenario output goes to a log file so it doesn't drown the report
+                with open(os.path.join(work_dir, f"{scenario}.out"), 'w') as out:
+                    returncode = subprocess.call(command, cwd=work_dir, env=env, stdout=out, stderr=subprocess.STDOUT)
+                if returncode != 0 or not os.path.exists(result_file):
+                    print(f"{scenario} at {variants} variants failed:", file=sys.stderr)
+                    with open(os.path.join(work_dir, f"{scenario}.out")) as out:
+                        sys.stderr.write(out.read()[-2000:])
+                    break
+
+                with open(result_file) as f:
+                    result = json.load(f)
+                if scenario == "backup":
+                    backup_file = os.path.join(work_dir, result["backup_file"]) if result.get("backup_file") else None
+                    if not backup_file:
+                        print(f"Backup at {variants} variants failed; skipping the remaining scenarios", file=sys.stderr)
+
+                stats = requests.get(f"{server_url}/stats", timeout=10).json()
+                results.append({
+                    "variants": variants,
+                    "scenario": scenario,
+                    "requests": stats["requests"],
+                    "cost": stats["cost"],
+                    "throttled": stats["throttled"],
+                    "wall_time": result["wall_time"],
+                    "peak_rss_mb": result["peak_rss_mb"],
+                    "failed_products": result.get("errors"),
+                    "operations": stats["operations"]
+                })
+                print_row(results[-1])
+                if scenario == "backup" and not backup_file:
+                    break
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+def print_header():
+    print(f"{'variants':>9} {'scenario':<9} {'requests':>9} {'cost':>10} {'throttled':>9} {'wall s':>9} {'req/s':>8} {'peak MB':>8}")
+
+def print_row(row):
+    rate = row["requests"] / row["wall_time"] if row["wall_time"] else 0
+    peak = f"{row['peak_rss_mb']:.1f}" if row["peak_rss_mb"] is not None else "n/a"
+    print(f"{row['variants']:>9} {row['scenario']:<9} {row['requests']:>9} {row['cost']:>10} {row['throttled']:>9} "
+          f"{row['wall_time']:>9.2f} {rate:>8.1f} {peak:>8}", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backup, discount and restore against a local mock store")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Catalog sizes in variants")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--bulk-backup", action="store_true", help="Back up with the Bulk Operations API")
+    parser.add_argument("--bulk-mutation", action="store_true", help="Send variant prices as one bulk mutation")
+    parser.add_argument("--variants-per-product", type=int, default=4)
+    parser.add_argument("--price-lists", type=int, default=2)
+    # Defaults match a Shopify Plus store; use 2000 / 100 for a standard plan
+    parser.add_argument("--maximum-available", type=float, default=20000.0)
+    parser.add_argument("--restore-rate", type=float, default=1000.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds of emulated latency per request")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    # Used internally to run a single scenario in a child process
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    parser.add_argument("--backup-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args)
+        return
+
+    # Discounts and restores need a backup to work from
+    args.scenarios = [scenario for scenario in SCENARIOS if scenario in args.scenarios or scenario == "backup"]
+
+    print_header()
+    results = []
+    for variants in args.sizes:
+        results.extend(benchmark_size(args, variants))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6140 @@
+__version__ = "1.0.0"
+
+import json
+import argparse
+import array
+import atexit
+import copy
+import csv
+import heapq
+import importlib
+import importlib.util
+import mmap
+import os
+import queue
+import struct
+import sys
+import tempfile
+import time
+import datetime
+import random
+import decimal
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from colorama import init, Fore, Style
+init(autoreset=True)
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access
+    
+    importlib.import_module holds the module's import lock, so worker threads
+    that touch it at the same time wait for one complete import instead of
+    seeing a half-initialised module.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+def lazy_import(name):
+    """Import a module on first use, or return None if it isn't installed
+    
+    Keeps startup fast for commands like list and --help, which never touch
+    the HTTP stack, progress bars or NumPy.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+requests = lazy_import("requests")
+asyncio = lazy_import("asyncio")
+tqdm_module = lazy_import("tqdm")
+
+def tqdm(*args, **kwargs):
+    return tqdm_module.tqdm(*args, **kwargs)
+
+# NumPy is optional; discounts fall back to plain integer arithmetic without it
+np = lazy_import("numpy")
+
+# httpx is optional; it is only needed for the asyncio engine (ENGINE=async)
+httpx = lazy_import("httpx")
+
+# Only needed for backup checksums and the snapshot store
+hashlib = lazy_import("hashlib")
+sqlite3 = lazy_import("sqlite3")
+
+class TqdmLoggingHandler(logging.Handler):
+    """Console handler that writes log lines to stderr around any progress bars
+    
+    No progress bar can exist before tqdm is imported, so until then lines are
+    written directly and short commands like list never import it.
+    """
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            if "tqdm" in sys.modules:
+                tqdm_module.tqdm.write(msg, file=sys.stderr)
+            else:
+                sys.stderr.write(msg + "\n")
+                sys.stderr.flush()
+        except Exception:
+            self.handleError(record)
+
+class ColorFormatter(logging.Formatter):
+    LEVEL_COLORS = {
+        logging.DEBUG: Fore.CYAN,
+        logging.INFO: Fore.GREEN,
+        logging.WARNING: Fore.YELLOW,
+        logging.ERROR: Fore.RED,
+        logging.CRITICAL: Fore.RED + Style.BRIGHT,
+    }
+
+    def format(self, record):
+        # Color a copy, so other handlers of the same record (e.g. the log
+        # file) don't get the escape codes
+        record = copy.copy(record)
+        level_color = self.LEVEL_COLORS.get(record.levelno, "")
+        record.levelname = f"{level_color}{record.levelname}{Style.RESET_ALL}"
+        return super().format(record)
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            tqdm_module.tqdm.write(msg)
+        except Exception:
+            self.handleError(record)
+
+import logging
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+SHOP_NAME = os.getenv('SHOP_NAME')
+ACCESS_TOKEN = os.getenv('ACCESS_TOKEN')
+API_VERSION = "2025-04"
+
+# Directory for storing price backups
+BACKUP_DIR = "price_backups"
+
+# Backups are written as JSON Lines: a header record, one record per product
+# and a footer. Legacy .json backups can still be read.
+BACKUP_EXTENSION = ".jsonl"
+BACKUP_FORMAT = "shopify-price-backup"
+BACKUP_FORMAT_VERSION = 1
+
+# Index of backup metadata, so listing backups doesn't have to read them
+BACKUP_INDEX_FILE = os.path.join(BACKUP_DIR, "index.json")
+BACKUP_INDEX_VERSION = 1
+
+# Convert finished backups to the compact columnar format (.spbc)
+COMPACT_BACKUPS = os.getenv('COMPACT_BACKUPS', '').lower() in ('1', 'true', 'yes')
+
+# Local SQLite database of price snapshots; SNAPSHOT_STORE=1 ingests every new backup
+SNAPSHOT_DB = os.getenv('SNAPSHOT_DB') or os.path.join(BACKUP_DIR, "snapshots.sqlite3")
+SNAPSHOT_STORE = os.getenv('SNAPSHOT_STORE', '').lower() in ('1', 'true', 'yes')
+
+# Directory for logs
+LOG_DIR = "price_logs"
+
+def ensure_directories():
+    """Create the backup and log directories; done on first write rather than at import"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+# Mock mode - When True, no actual updates are sent to the API
+MOCK_MODE = False
+
+# Number of products processed in parallel by backup, discount and restore
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', '4'))
+
+# I/O engine: "threads" sends requests from the worker pool, "async" runs them
+# all on one asyncio event loop (needs httpx)
+ENGINE = os.getenv('ENGINE', 'threads').lower()
+
+# Requests in flight at once on the asyncio engine
+ASYNC_CONCURRENCY = int(os.getenv('ASYNC_CONCURRENCY', '100'))
+
+# Keep-alive connections kept open to the Admin API
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', str(max(MAX_WORKERS, 10))))
+
+# Retries per request on throttling, 429, 5xx and connection errors
+MAX_RETRIES = int(os.getenv('MAX_RETRIES', '5'))
+
+def parse_retry_budgets(value):
+    """Parse "operation=retries,..." into {operation: retries}"""
+    budgets = {}
+    for entry in value.split(","):
+        if entry.strip():
+            operation, _, retries = entry.partition("=")
+            budgets[operation.strip()] = int(retries)
+    return budgets
+
+# Total retries one GraphQL operation may use over a run, e.g.
+# "productVariantsBulkUpdate=500,priceListFixedPricesAdd=200"; others are only capped per request
+RETRY_BUDGETS = parse_retry_budgets(os.getenv('RETRY_BUDGETS', ''))
+
+# Log level for the console and log files; DEBUG adds a line per variant and market price
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+# Also write every computed price to a JSON Lines audit file next to the log
+AUDIT_LOG = os.getenv('AUDIT_LOG', '').lower() in ('1', 'true', 'yes')
+
+# Write a machine-readable metrics file next to each operation's log
+WRITE_METRICS = os.getenv('WRITE_METRICS', '').lower() in ('1', 'true', 'yes')
+
+# Page size for paginated connections (Shopify allows up to 250)
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '250'))
+
+# Product pages also carry a nested page of variants. A query's cost grows
+# with the product of the two page sizes and Shopify rejects queries that
+# request more than 1000 points, so both are kept small; products with more
+# variants fetch the rest separately.
+PRODUCT_PAGE_SIZE = int(os.getenv('PRODUCT_PAGE_SIZE', '25'))
+NESTED_VARIANT_PAGE_SIZE = 25
+
+# Shopify rejects any single query whose requested cost is above this, and
+# nodes(ids:) takes at most this many IDs. Batched reads are sized to fit both.
+MAX_QUERY_COST = 1000
+NODES_BATCH_LIMIT = 250
+
+# Set up logging
+
+# Logger for the per-price audit trail, written as JSON Lines when AUDIT_LOG is on
+audit_log = logging.getLogger("price_audit")
+
+class AuditFormatter(logging.Formatter):
+    """Format an audit record's fields as one compact JSON line"""
+    
+    def format(self, record):
+        return json.dumps(dict(time=self.formatTime(record), **record.audit), separators=(",", ":"))
+
+def is_audit_record(record):
+    return record.name == audit_log.name
+
+def is_log_record(record):
+    return record.name != audit_log.name
+
+# Records are queued by the thread that logs them and written to the console
+# and files by a QueueListener thread, so workers never block on output
+log_queue = None
+log_listener = None
+
+def flush_logs():
+    """Wait until every queued log record has been written"""
+    if log_queue is not None:
+        log_queue.join()
+
+def prompt(text):
+    """input() that first lets queued log lines print, so they don't land after the prompt"""
+    flush_logs()
+    return input(text)
+
+def stop_logging():
+    """Write any queued records and stop the listener thread"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+    for handler in logging.getLogger().handlers[:]:
+        logging.getLogger().removeHandler(handler)
+    for handler in audit_log.handlers[:]:
+        audit_log.removeHandler(handler)
+
+atexit.register(stop_logging)
+
+def setup_logging(operation_name=None):
+    """Set up logging to both console and file using tqdm.write for terminal output
+    
+    With an operation_name, loggers only put records on a queue and a
+    listener thread formats and writes them. Console-only logging writes
+    directly, which keeps short commands from importing logging.handlers.
+    LOG_LEVEL sets the level (DEBUG includes a line per price). With
+    AUDIT_LOG and an operation_name, every computed price is also written to
+    a JSON Lines audit file next to the log.
+    """
+    global log_queue, log_listener
+    
+    # Drain and remove the previous operation's handlers
+    stop_logging()
+    if operation_name:
+        ensure_directories()
+    root_logger = logging.getLogger()
+    
+    # Create a formatter
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    
+    # Set up tqdm-aware console handler
+    console_handler = TqdmLoggingHandler()
+    console_handler.setFormatter(ColorFormatter("%(asctime)s - %(levelname)s - %(message)s"))
+    console_handler.addFilter(is_log_record)
+    handlers = [console_handler]
+    
+    log_path = None
+    audit_path = None
+    if operation_name:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        log_filename = f"{operation_name}_{timestamp}.log"
+        log_path = os.path.join(LOG_DIR, log_filename)
+        
+        file_handler = logging.FileHandler(log_path)
+        file_handler.setFormatter(formatter)
+        file_handler.addFilter(is_log_record)
+        handlers.append(file_handler)
+        
+        if AUDIT_LOG:
+            audit_path = os.path.join(LOG_DIR, f"{operation_name}_{timestamp}.audit.jsonl")
+            audit_handler = logging.FileHandler(audit_path)
+            audit_handler.setFormatter(AuditFormatter())
+            audit_handler.addFilter(is_audit_record)
+            handlers.append(audit_handler)
+    
+    root_logger.setLevel(LOG_LEVEL)
+    if not operation_name:
+        log_queue = None
+        audit_log.setLevel(logging.CRITICAL + 1)
+        root_logger.addHandler(console_handler)
+        return None
+    
+    from logging.handlers import QueueHandler, QueueListener
+    log_queue = queue.Queue()
+    root_logger.addHandler(QueueHandler(log_queue))
+    # Audit records go to the root logger's queue, and only when enabled
+    audit_log.setLevel(logging.INFO if audit_path else logging.CRITICAL + 1)
+    log_listener = QueueListener(log_queue, *handlers)
+    log_listener.start()
+    
+    if log_path:
+        logging.info(f"Logging to file: {log_path}")
+    if audit_path:
+        logging.info(f"Price audit log: {audit_path}")
+    return log_path
+
+def audit_price(product_id, variant_id, price, original_price=None, compare_at_price=None, price_list_id=None, currency=None):
+    """Record one computed price in the audit log, if it is enabled"""
+    if not audit_log.isEnabledFor(logging.INFO):
+        return
+    audit_log.info("price", extra={"audit": {
+        "product_id": product_id,
+        "variant_id": variant_id,
+        "price_list_id": price_list_id,
+        "currency": currency,
+        "from": original_price,
+        "to": price,
+        "compare_at": compare_at_price
+    }})
+
+# API URL. SHOPIFY_API_URL overrides it, e.g. to run against a local mock server
+base_url = os.getenv('SHOPIFY_API_URL') or f"https://{SHOP_NAME}/admin/api/{API_VERSION}/graphql.json"
+
+class CostRateLimiter:
+    """Token bucket shared by all workers, driven by Shopify's GraphQL cost budget
+    
+    Each request reserves its expected query cost before it is sent. The bucket
+    refills at the shop's restore rate and is resynchronised with the
+    throttleStatus Shopify returns in every response.
+    """
+    
+    def __init__(self, maximum_available=1000.0, restore_rate=50.0):
+        self.maximum_available = maximum_available
+        self.restore_rate = restore_rate
+        self.available = maximum_available
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.maximum_available, self.available + (now - self.updated_at) * self.restore_rate)
+        self.updated_at = now
+    
+    def reserve(self, cost):
+        """Reserve cost points if they are available and return 0, otherwise return the seconds to wait"""
+        with self.lock:
+            self._refill()
+            cost = min(cost, self.maximum_available)
+            if self.available >= cost:
+                self.available -= cost
+                return 0.0
+            return (cost - self.available) / self.restore_rate
+    
+    def acquire(self, cost):
+        """Block until cost points are available, reserve them and return the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            wait_time = self.reserve(cost)
+            if not wait_time:
+                return waited
+            time.sleep(wait_time)
+            waited += wait_time
+    
+    async def acquire_async(self, cost):
+        """Like acquire, but waits on the event loop instead of blocking the thread"""
+        waited = 0.0
+        while True:
+            wait_time = self.reserve(cost)
+            if not wait_time:
+                return waited
+            await asyncio.sleep(wait_time)
+            waited += wait_time
+    
+    def update(self, throttle_status):
+        """Resynchronise the bucket with a throttleStatus from the API"""
+        with self.lock:
+            self.maximum_available = float(throttle_status.get("maximumAvailable", self.maximum_available))
+            self.restore_rate = float(throttle_status.get("restoreRate", self.restore_rate))
+            self.available = float(throttle_status.get("currentlyAvailable", self.available))
+            self.updated_at = time.monotonic()
+
+class ShopifyAPIError(Exception):
+    """A GraphQL request failed at the HTTP, transport or GraphQL level"""
+    
+    def __init__(self, message, status_code=None, errors=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.errors = errors
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class RetryPolicy:
+    """Exponential backoff with full jitter and per-operation retry budgets
+    
+    max_retries caps the retries of a single request. budgets optionally caps
+    the total retries an operation may use over a run, so a persistently
+    failing operation stops retrying instead of stalling every worker.
+    """
+    
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=30.0, budgets=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budgets = dict(budgets or {})
+    
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(-(-fraction * len(sorted_values) // 1)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class RequestMetrics:
+    """Per-operation telemetry for every GraphQL request the client sends
+    
+    Records latency, requested and actual query cost, the throttle budget left
+    after each response, throttled responses, retries, and the time spent
+    waiting on the rate limiter and in retry backoff.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.started_at = datetime.datetime.now()
+            self.started = time.monotonic()
+            self.operations = {}
+            self.lowest_available = None
+            self.maximum_available = None
+    
+    def _operation(self, operation):
+        stats = self.operations.get(operation)
+        if stats is None:
+            stats = self.operations[operation] = {
+                "latencies": [],
+                "errors": 0,
+                "throttled": 0,
+                "retries": 0,
+                "requested_cost": 0,
+                "actual_cost": 0,
+                "rate_limit_wait": 0.0,
+                "retry_wait": 0.0
+            }
+        return stats
+    
+    def record_request(self, operation, latency, cost=None, failed=False, throttled=False):
+        """Record one HTTP round trip and the cost extensions of its response"""
+        with self.lock:
+            stats = self._operation(operation)
+            stats["latencies"].append(latency)
+            stats["errors"] += int(failed)
+            stats["throttled"] += int(throttled)
+            if cost:
+                stats["requested_cost"] += cost.get("requestedQueryCost") or 0
+                stats["actual_cost"] += cost.get("actualQueryCost") or 0
+                throttle_status = cost.get("throttleStatus") or {}
+                available = throttle_status.get("currentlyAvailable")
+                if available is not None:
+                    if self.lowest_available is None or available < self.lowest_available:
+                        self.lowest_available = available
+                    self.maximum_available = throttle_status.get("maximumAvailable", self.maximum_available)
+    
+    def record_wait(self, operation, seconds, retry=False):
+        """Record time spent waiting before a request, on the rate limiter or in retry backoff"""
+        with self.lock:
+            stats = self._operation(operation)
+            if retry:
+                stats["retries"] += 1
+                stats["retry_wait"] += seconds
+            else:
+                stats["rate_limit_wait"] += seconds
+    
+    def summary(self):
+        """Return the metrics as a JSON-serialisable dict"""
+        with self.lock:
+            operations = {}
+            for operation, stats in sorted(self.operations.items()):
+                latencies = sorted(stats["latencies"])
+                operations[operation] = {
+                    "requests": len(latencies),
+                    "errors": stats["errors"],
+                    "throttled": stats["throttled"],
+                    "retries": stats["retries"],
+                    "requested_cost": stats["requested_cost"],
+                    "actual_cost": stats["actual_cost"],
+                    "rate_limit_wait": round(stats["rate_limit_wait"], 3),
+                    "retry_wait": round(stats["retry_wait"], 3),
+                    "latency_ms": {
+                        "p50": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+                        "p95": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+                        "p99": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+                        "max": round(latencies[-1] * 1000, 1) if latencies else None
+                    }
+                }
+            
+            totals = {
+                key: sum(stats[key] for stats in operations.values())
+                for key in ("requests", "errors", "throttled", "retries", "requested_cost", "actual_cost")
+            }
+            totals["rate_limit_wait"] = round(sum(stats["rate_limit_wait"] for stats in operations.values()), 3)
+            totals["retry_wait"] = round(sum(stats["retry_wait"] for stats in operations.values()), 3)
+            
+            return {
+                "started_at": self.started_at.isoformat(),
+                "wall_time": round(time.monotonic() - self.started, 3),
+                "lowest_available": self.lowest_available,
+                "maximum_available": self.maximum_available,
+                "totals": totals,
+                "operations": operations
+            }
+
+# GraphQL error codes that are worth retrying
+RETRYABLE_ERROR_CODES = {"THROTTLED", "INTERNAL_SERVER_ERROR"}
+
+def operation_name(query):
+    """Name of a GraphQL operation, used for retry budgets and summaries"""
+    match = re.match(r"\s*(?:query|mutation)\s+(\w+)", query)
+    if match:
+        return match.group(1)
+    match = re.search(r"\{\s*(\w+)", query)
+    return match.group(1) if match else "anonymous"
+
+def request_payload(query, variables=None):
+    payload = {"query": query}
+    if variables is not None:
+        payload["variables"] = variables
+    return payload
+
+class GraphQLClient:
+    """Shared Admin GraphQL client used by every fetch and update function
+    
+    Requests go through one pooled keep-alive session with gzip-compressed
+    responses and are paced by a CostRateLimiter. Errors are parsed here and
+    raised as ShopifyAPIError; throttling, 429, 5xx and transport errors are
+    retried according to the RetryPolicy.
+    """
+    
+    # Last requested cost seen for each query, used to reserve budget up front
+    DEFAULT_QUERY_COST = 10
+    
+    def __init__(self, url, access_token, pool_size=10, timeout=60, retry_policy=None):
+        self.url = url
+        self.timeout = timeout
+        self.rate_limiter = CostRateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.query_costs = {}
+        self.retry_counts = {}
+        self.metrics = RequestMetrics()
+        self.lock = threading.Lock()
+        self.headers = {
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip",
+            "X-Shopify-Access-Token": access_token or ""
+        }
+        # Set to an AsyncEngine to send every request through its event loop
+        self.engine = None
+        
+        # Created on the first request, so importing requests is deferred too
+        self.pool_size = pool_size
+        self.session = None
+    
+    def execute(self, query, variables=None, cost=None):
+        """Send a query or mutation and return its data, raising ShopifyAPIError on failure
+        
+        cost is the budget to reserve for it, for queries whose cost varies
+        with their variables; otherwise the last cost seen for the query is used.
+        """
+        if self.engine is not None:
+            return self.engine.run(self.engine.client.execute(query, variables, cost))
+        
+        operation = operation_name(query)
+        payload = request_payload(query, variables)
+        
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire(cost or self.query_costs.get(query, self.DEFAULT_QUERY_COST))
+            if waited:
+                self.metrics.record_wait(operation, waited)
+            try:
+                return self._send(query, payload, operation)
+            except ShopifyAPIError as e:
+                delay = self._retry_delay(operation, attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+    
+    def _get_session(self):
+        if self.session is None:
+            with self.lock:
+                if self.session is None:
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(self.headers)
+                    self.session = session
+        return self.session
+    
+    def _send(self, query, payload, operation):
+        session = self._get_session()
+        started = time.monotonic()
+        try:
+            response = session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.metrics.record_request(operation, time.monotonic() - started, failed=True)
+            raise ShopifyAPIError(f"Request failed: {e}", retryable=True) from e
+        return self._handle_response(query, operation, time.monotonic() - started, response)
+    
+    def _handle_response(self, query, operation, latency, response):
+        """Check an HTTP response, update the rate limiter and metrics, and return its data
+        
+        Works with both requests and httpx responses. Raises ShopifyAPIError
+        on HTTP or GraphQL errors.
+        """
+        if response.status_code != 200:
+            self.metrics.record_request(operation, latency, failed=True, throttled=response.status_code == 429)
+        
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = None
+            try:
+                retry_after = float(response.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                pass
+            raise ShopifyAPIError(f"HTTP {response.status_code}", response.status_code, retryable=True, retry_after=retry_after)
+        
+        if response.status_code != 200:
+            raise ShopifyAPIError(f"HTTP {response.status_code}: {response.text[:200]}", response.status_code)
+        
+        try:
+            data = response.json()
+        except ValueError as e:
+            self.metrics.record_request(operation, latency, failed=True)
+            raise ShopifyAPIError(f"Invalid JSON response: {e}", response.status_code) from e
+        
+        cost = data.get("extensions", {}).get("cost")
+        if cost:
+            self.query_costs[query] = cost.get("requestedQueryCost", self.DEFAULT_QUERY_COST)
+            if cost.get("throttleStatus"):
+                self.rate_limiter.update(cost["throttleStatus"])
+        
+        errors = data.get("errors")
+        codes = set()
+        if errors:
+            codes = {error.get("extensions", {}).get("code") for error in errors if isinstance(error, dict)}
+        self.metrics.record_request(operation, latency, cost, failed=bool(errors), throttled="THROTTLED" in codes)
+        
+        if errors:
+            retry_after = None
+            if "THROTTLED" in codes:
+                # The rate limiter now holds the server's budget and will wait
+                # for it to refill; only add a little jitter here
+                retry_after = random.uniform(0, self.retry_policy.base_delay)
+            raise ShopifyAPIError(str(errors), response.status_code, errors,
+                                  retryable=bool(codes & RETRYABLE_ERROR_CODES), retry_after=retry_after)
+        
+        return data["data"]
+    
+    def _retry_delay(self, operation, attempt, error):
+        """Seconds to wait before retrying a failed request, or None if it shouldn't be retried"""
+        if not error.retryable or not self._consume_retry(operation, attempt):
+            return None
+        delay = error.retry_after if error.retry_after is not None else self.retry_policy.delay(attempt)
+        logging.warning(f"{operation} failed ({error}); retry {attempt + 1} in {delay:.1f}s")
+        self.metrics.record_wait(operation, delay, retry=True)
+        return delay
+    
+    def _consume_retry(self, operation, attempt):
+        """Record a retry for operation if its budgets allow one"""
+        if attempt >= self.retry_policy.max_retries:
+            return False
+        with self.lock:
+            used = self.retry_counts.get(operation, 0)
+            budget = self.retry_policy.budgets.get(operation)
+            if budget is not None and used >= budget:
+                return False
+            self.retry_counts[operation] = used + 1
+        return True
+    
+    def reset_stats(self):
+        with self.lock:
+            self.retry_counts = {}
+        self.metrics.reset()
+    
+    def log_summary(self, operation=None):
+        """Log request metrics since the last reset, and write them to a metrics file if enabled
+        
+        Returns the metrics file path, or None.
+        """
+        summary = self.metrics.summary()
+        totals = summary["totals"]
+        
+        logging.info(f"API requests: {totals['requests']} in {summary['wall_time']:.1f}s, "
+                     f"{totals['errors']} failed, {totals['throttled']} throttled, {totals['retries']} retries")
+        logging.info(f"Query cost: {totals['actual_cost']} actual / {totals['requested_cost']} requested")
+        budget = f", lowest available budget {summary['lowest_available']}/{summary['maximum_available']}" if summary["lowest_available"] is not None else ""
+        logging.info(f"Waiting (summed over workers): {totals['rate_limit_wait']:.1f}s on the rate limiter, "
+                     f"{totals['retry_wait']:.1f}s in retry backoff{budget}")
+        for name, stats in summary["operations"].items():
+            latency = stats["latency_ms"]
+            logging.info(f"  {name}: {stats['requests']} requests, latency p50 {latency['p50']}ms / p95 {latency['p95']}ms / p99 {latency['p99']}ms, "
+                         f"cost {stats['actual_cost']}, {stats['throttled']} throttled, {stats['retries']} retries")
+        
+        if not WRITE_METRICS:
+            return None
+        
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        metrics_path = os.path.join(LOG_DIR, f"{operation or 'operation'}_{timestamp}.metrics.json")
+        summary["operation"] = operation
+        with open(metrics_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        logging.info(f"Metrics written to: {metrics_path}")
+        return metrics_path
+
+class AsyncGraphQLClient:
+    """Asyncio counterpart of GraphQLClient for the async engine
+    
+    Requests go through one httpx.AsyncClient and share the synchronous
+    client's rate limiter, retry policy, query costs and metrics, so both
+    engines pace and report requests the same way. At most concurrency
+    requests are in flight at once. Only use it on the AsyncEngine's loop.
+    """
+    
+    def __init__(self, sync_client, concurrency=100):
+        self.sync_client = sync_client
+        self.concurrency = concurrency
+        self.http = None
+        self.semaphore = None
+    
+    async def execute(self, query, variables=None, cost=None):
+        """Send a query or mutation and return its data, raising ShopifyAPIError on failure"""
+        sync_client = self.sync_client
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                headers=sync_client.headers,
+                timeout=sync_client.timeout,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            )
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        
+        operation = operation_name(query)
+        payload = request_payload(query, variables)
+        
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                waited = await sync_client.rate_limiter.acquire_async(
+                    cost or sync_client.query_costs.get(query, sync_client.DEFAULT_QUERY_COST))
+                if waited:
+                    sync_client.metrics.record_wait(operation, waited)
+                try:
+                    return await self._send(query, payload, operation)
+                except ShopifyAPIError as e:
+                    delay = sync_client._retry_delay(operation, attempt, e)
+                    if delay is None:
+                        raise
+            await asyncio.sleep(delay)
+            attempt += 1
+    
+    async def _send(self, query, payload, operation):
+        started = time.monotonic()
+        try:
+            response = await self.http.post(self.sync_client.url, json=payload)
+        except httpx.HTTPError as e:
+            self.sync_client.metrics.record_request(operation, time.monotonic() - started, failed=True)
+            raise ShopifyAPIError(f"Request failed: {e or type(e).__name__}", retryable=True) from e
+        return self.sync_client._handle_response(query, operation, time.monotonic() - started, response)
+    
+    async def close(self):
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+class AsyncEngine:
+    """One asyncio event loop, on a background thread, that runs all GraphQL I/O
+    
+    Synchronous code hands coroutines to the loop with run() or submit(), so
+    the existing functions keep their signatures while hundreds of requests
+    share one thread. Coroutines running on the loop must use the async
+    fetch and update functions; calling run() from the loop would deadlock.
+    """
+    
+    def __init__(self, sync_client, concurrency=100):
+        self.concurrency = concurrency
+        self.client = AsyncGraphQLClient(sync_client, concurrency)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="graphql-event-loop", daemon=True)
+        self.thread.start()
+    
+    def submit(self, coroutine):
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+    
+    def run(self, coroutine):
+        """Run a coroutine on the loop and wait for its result"""
+        if threading.current_thread() is self.thread:
+            coroutine.close()
+            raise RuntimeError("AsyncEngine.run() called from its own event loop")
+        return self.submit(coroutine).result()
+    
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+client = GraphQLClient(base_url, ACCESS_TOKEN, pool_size=HTTP_POOL_SIZE, retry_policy=RetryPolicy(max_retries=MAX_RETRIES, budgets=RETRY_BUDGETS))
+
+# The asyncio engine, or None when requests are sent from worker threads
+engine = None
+if ENGINE == "async":
+    if httpx is None:
+        print(f"{Fore.YELLOW}ENGINE=async needs httpx (pip install httpx); using worker threads{Style.RESET_ALL}", file=sys.stderr)
+    else:
+        engine = client.engine = AsyncEngine(client, ASYNC_CONCURRENCY)
+        atexit.register(engine.close)
+elif ENGINE != "threads":
+    print(f"{Fore.YELLOW}Unknown ENGINE {ENGINE!r}; using worker threads{Style.RESET_ALL}", file=sys.stderr)
+
+def run_in_workers(func, items, desc, total=None, workers=None, async_func=None, progress=True):
+    """Run func over items on a thread pool, yielding (item, result, error) as each finishes
+    
+    At most twice the number of workers are queued at once so items can be
+    consumed lazily. With the asyncio engine and an async_func (a coroutine
+    function taking the same item), items run as coroutines on the event
+    loop instead, up to ASYNC_CONCURRENCY at once. progress=False hides the
+    progress bar, for short runs repeated many times.
+    """
+    workers = workers or MAX_WORKERS
+    if total is None and hasattr(items, "__len__"):
+        total = len(items)
+    
+    items = iter(items)
+    on_loop = engine is not None and async_func is not None
+    executor = None if on_loop else ThreadPoolExecutor(max_workers=workers)
+    try:
+        with tqdm(total=total, desc=desc, disable=not progress) as progress_bar:
+            pending = {}
+            
+            def submit_next():
+                for item in items:
+                    future = engine.submit(async_func(item)) if on_loop else executor.submit(func, item)
+                    pending[future] = item
+                    return True
+                return False
+            
+            for _ in range(engine.concurrency if on_loop else workers * 2):
+                if not submit_next():
+                    break
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    progress_bar.update(1)
+                    try:
+                        yield item, future.result(), None
+                    except Exception as e:
+                        yield item, None, e
+                    submit_next()
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+
+def page_nodes(data, path):
+    """Return (nodes, end_cursor) for the connection at path in a response"""
+    connection = data
+    for key in path:
+        connection = connection.get(key) if connection else None
+    if connection is None:
+        raise ShopifyAPIError(f"No {'.'.join(path)} in response")
+    
+    if "nodes" in connection:
+        nodes = connection["nodes"]
+    else:
+        nodes = [edge["node"] for edge in connection["edges"]]
+    
+    page_info = connection["pageInfo"]
+    end_cursor = page_info["endCursor"] if page_info["hasNextPage"] else None
+    return nodes, end_cursor
+
+def page_variables(variables, cursor=None, page_size=None):
+    variables = dict(variables or {}, batchSize=page_size or PAGE_SIZE)
+    if cursor:
+        variables["cursor"] = cursor
+    return variables
+
+def fetch_page(query, variables, path, cursor=None, page_size=None):
+    """Fetch one page of a cursor-paginated connection
+    
+    The query must take $cursor and $batchSize, and the connection at path
+    (e.g. ["priceList", "prices"]) must select pageInfo and either nodes or
+    edges { node }. Returns (nodes, end_cursor, data), where end_cursor is
+    None on the last page. Raises ShopifyAPIError on failure.
+    """
+    data = client.execute(query, page_variables(variables, cursor, page_size))
+    nodes, end_cursor = page_nodes(data, path)
+    return nodes, end_cursor, data
+
+async def fetch_page_async(query, variables, path, cursor=None, page_size=None):
+    """Coroutine version of fetch_page for the asyncio engine"""
+    data = await engine.client.execute(query, page_variables(variables, cursor, page_size))
+    nodes, end_cursor = page_nodes(data, path)
+    return nodes, end_cursor, data
+
+async def paginate_async(query, variables, path, page_size=None, cursor=None):
+    """Async generator version of paginate, prefetching the next page as a task"""
+    nodes, cursor, _ = await fetch_page_async(query, variables, path, cursor, page_size)
+    while True:
+        next_page = None
+        if cursor:
+            next_page = asyncio.ensure_future(fetch_page_async(query, variables, path, cursor, page_size))
+        
+        try:
+            for node in nodes:
+                yield node
+        except BaseException:
+            if next_page:
+                next_page.cancel()
+            raise
+        
+        if not next_page:
+            break
+        nodes, cursor, _ = await next_page
+
+def paginate_pages(query, variables, path, page_size=None, cursor=None, prefetch=True):
+    """Yield the nodes of a cursor-paginated connection one page (a list) at a time
+    
+    Takes the same arguments as fetch_page. With prefetch, the next page is
+    requested in the background while the caller works through the current
+    one. Raises ShopifyAPIError if a page can't be fetched.
+    """
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        nodes, cursor, _ = fetch_page(query, variables, path, cursor, page_size)
+        while True:
+            next_page = None
+            if cursor and executor:
+                next_page = executor.submit(fetch_page, query, variables, path, cursor, page_size)
+            
+            yield nodes
+            
+            if not cursor:
+                break
+            if next_page:
+                nodes, cursor, _ = next_page.result()
+            else:
+                nodes, cursor, _ = fetch_page(query, variables, path, cursor, page_size)
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+
+def paginate(query, variables, path, page_size=None, cursor=None, prefetch=True):
+    """Yield every node of a cursor-paginated connection, prefetching as paginate_pages does"""
+    for nodes in paginate_pages(query, variables, path, page_size, cursor, prefetch):
+        yield from nodes
+
+def cost_batch_size(item_cost):
+    """How many items costing item_cost each fit in one query under MAX_QUERY_COST"""
+    return max(1, min(NODES_BATCH_LIMIT, int(MAX_QUERY_COST // item_cost)))
+
+def is_max_cost_exceeded(error):
+    return any(
+        isinstance(e, dict) and e.get("extensions", {}).get("code") == "MAX_COST_EXCEEDED"
+        for e in error.errors or []
+    )
+
+def run_batched(items, item_cost, send_batch):
+    """Call send_batch on consecutive batches of items, yielding (batch, result)
+    
+    Batches are as large as fits under MAX_QUERY_COST given each item's
+    estimated cost, and are halved if Shopify still finds them too expensive.
+    send_batch gets the batch and the cost to reserve for it. Raises
+    ShopifyAPIError if a batch fails.
+    """
+    size = cost_batch_size(item_cost)
+    start = 0
+    while start < len(items):
+        batch = items[start:start + size]
+        try:
+            result = send_batch(batch, len(batch) * item_cost)
+        except ShopifyAPIError as e:
+            if len(batch) == 1 or not is_max_cost_exceeded(e):
+                raise
+            size = max(1, len(batch) // 2)
+            logging.warning(f"Batch of {len(batch)} exceeded the query cost limit; retrying with {size}")
+            continue
+        yield batch, result
+        start += len(batch)
+
+PRODUCTS_BY_ID_QUERY = """
+query GetProductsById($ids: [ID!]!, $variantsBatchSize: Int!) {
+    nodes(ids: $ids) {
+        ... on Product {
+            id
+            title
+            handle
+            tags
+            variants(first: $variantsBatchSize) {
+                pageInfo {
+                    hasNextPage
+                    endCursor
+                }
+                edges {
+                    node {
+                        id
+                        title
+                        sku
+                        price
+                        compareAtPrice
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+PRODUCTS_QUERY = """
+query GetProducts($cursor: String, $batchSize: Int!, $variantsBatchSize: Int!, $queryString: String) {
+    products(first: $batchSize, after: $cursor, query: $queryString) {
+        pageInfo {
+            hasNextPage
+            endCursor
+        }
+        edges {
+            node {
+                id
+                title
+                handle
+                tags
+                variants(first: $variantsBatchSize) {
+                    pageInfo {
+                        hasNextPage
+                        endCursor
+                    }
+                    edges {
+                        node {
+                            id
+                            title
+                            sku
+                            price
+                            compareAtPrice
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+COLLECTION_PRODUCTS_QUERY = """
+query GetProductsByCollection($collectionId: ID!, $cursor: String, $batchSize: Int!, $variantsBatchSize: Int!) {
+    collection(id: $collectionId) {
+        products(first: $batchSize, after: $cursor) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            edges {
+                node {
+                    id
+                    title
+                    handle
+                    tags
+                    variants(first: $variantsBatchSize) {
+                        pageInfo {
+                            hasNextPage
+                            endCursor
+                        }
+                        edges {
+                            node {
+                                id
+                                title
+                                sku
+                                price
+                                compareAtPrice
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+def variants_pages_query(count):
+    """Query for the next variants page of count products at once, as aliases p0, p1, ...
+    
+    Takes $id<n> and $cursor<n> for each product and a shared $batchSize.
+    """
+    parameters = ", ".join(f"$id{i}: ID!, $cursor{i}: String" for i in range(count))
+    fields = "\n".join(
+        f"    p{i}: product(id: $id{i}) {{ variants(first: $batchSize, after: $cursor{i}) {{ ...VariantsPage }} }}"
+        for i in range(count)
+    )
+    return f"""
+query GetProductsVariants({parameters}, $batchSize: Int!) {{
+{fields}
+}}
+
+fragment VariantsPage on ProductVariantConnection {{
+    pageInfo {{
+        hasNextPage
+        endCursor
+    }}
+    edges {{
+        node {{
+            id
+            title
+            sku
+            price
+            compareAtPrice
+        }}
+    }}
+}}
+"""
+
+def complete_products_variants(products):
+    """Fetch the rest of the variants of products whose nested variants page didn't hold them all
+    
+    The next page of several products is fetched per request with aliased
+    queries, until every product is complete. Removes the variants pageInfo
+    so the products keep the backup format. Raises ShopifyAPIError on failure.
+    """
+    incomplete = []
+    for product in products:
+        page_info = product["variants"].pop("pageInfo", None)
+        if page_info and page_info["hasNextPage"]:
+            incomplete.append((product, page_info["endCursor"]))
+    
+    def send_batch(batch, cost):
+        variables = {"batchSize": PAGE_SIZE}
+        for i, (product, cursor) in enumerate(batch):
+            variables[f"id{i}"] = product["id"]
+            variables[f"cursor{i}"] = cursor
+        return client.execute(variants_pages_query(len(batch)), variables, cost)
+    
+    # Each alias costs the product plus a connection of PAGE_SIZE variants
+    while incomplete:
+        next_pages = []
+        for batch, data in run_batched(incomplete, 3 + PAGE_SIZE, send_batch):
+            for i, (product, _) in enumerate(batch):
+                nodes, cursor = page_nodes(data, [f"p{i}", "variants"])
+                product["variants"]["edges"].extend({"node": node} for node in nodes)
+                if cursor:
+                    next_pages.append((product, cursor))
+        incomplete = next_pages
+
+def fetch_products(product_ids):
+    """Fetch many products, each with all of its variants, in as few requests as possible
+    
+    Products are read with nodes(ids:), as many per request as fit under
+    MAX_QUERY_COST, and variants beyond the first page are fetched in batches
+    too. Returns {product_id: product}, with None for IDs that aren't
+    products, or None on failure.
+    """
+    product_ids = list(dict.fromkeys(product_ids))
+    
+    def send_batch(ids, cost):
+        return client.execute(PRODUCTS_BY_ID_QUERY, {"ids": ids, "variantsBatchSize": NESTED_VARIANT_PAGE_SIZE}, cost)
+    
+    products = {}
+    try:
+        # Each product costs itself plus its nested variants connection
+        for ids, data in run_batched(product_ids, 3 + NESTED_VARIANT_PAGE_SIZE, send_batch):
+            for product_id, node in zip(ids, data["nodes"]):
+                products[product_id] = node if node and node.get("id") else None
+        complete_products_variants([product for product in products.values() if product])
+    except ShopifyAPIError as e:
+        logging.error(f"Error fetching products: {e}")
+        return None
+    
+    return products
+
+def fetch_product(product_id):
+    """Fetch a single product and all of its variants"""
+    products = fetch_products([product_id])
+    if products is None:
+        logging.error(f"Error fetching product {product_id}")
+        return None
+    return products.get(product_id)
+
+def fetch_all_collections():
+    """Fetch all collections in the shop"""
+    query = """
+    query GetCollections($cursor: String, $batchSize: Int!) {
+        collections(first: $batchSize, after: $cursor) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            edges {
+                node {
+                    id
+                    title
+                    productsCount
+                }
+            }
+        }
+    }
+    """
+    
+    collections = []
+    try:
+        for collection in paginate(query, {}, ["collections"]):
+            collections.append({
+                "id": collection["id"],
+                "title": collection["title"],
+                "productsCount": collection["productsCount"]
+            })
+    except ShopifyAPIError as e:
+        logging.error(f"Error fetching collections: {e}")
+        return []
+    
+    return collections
+
+def fetch_collection_product_ids(collection_id):
+    """Fetch the IDs of every product in a collection, or None if they could not be fetched"""
+    query = """
+    query GetCollectionProductIds($collectionId: ID!, $cursor: String, $batchSize: Int!) {
+        collection(id: $collectionId) {
+            products(first: $batchSize, after: $cursor) {
+                pageInfo {
+                    hasNextPage
+                    endCursor
+                }
+                nodes {
+                    id
+                }
+            }
+        }
+    }
+    """
+    
+    try:
+        return [node["id"] for node in paginate(query, {"collectionId": collection_id}, ["collection", "products"])]
+    except ShopifyAPIError as e:
+        logging.error(f"Error fetching products of collection {collection_id}: {e}")
+        return None
+
+def iter_product_pages(collection_id=None, query_string=None, batch_size=None):
+    """Yield pages of products (the whole shop's, or one collection's), each with all of its variants
+    
+    query_string is an optional product search filter, e.g.
+    "updated_at:>'2025-01-01T00:00:00Z'"; it only applies to the whole shop.
+    The next page is requested while the caller works through the current
+    one. Raises ShopifyAPIError if a page can't be fetched.
+    """
+    if collection_id:
+        query, path = COLLECTION_PRODUCTS_QUERY, ["collection", "products"]
+        variables = {"collectionId": collection_id}
+    else:
+        query, path = PRODUCTS_QUERY, ["products"]
+        variables = {"queryString": query_string}
+    variables["variantsBatchSize"] = NESTED_VARIANT_PAGE_SIZE
+    
+    for products in paginate_pages(query, variables, path, batch_size or PRODUCT_PAGE_SIZE):
+        complete_products_variants(products)
+        yield products
+
+def fetch_product_ids():
+    """Fetch the ID of every product in the shop, or None if they could not be fetched"""
+    query = """
+    query GetProductIds($cursor: String, $batchSize: Int!) {
+        products(first: $batchSize, after: $cursor) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            nodes {
+                id
+            }
+        }
+    }
+    """
+    
+    try:
+        return [node["id"] for node in paginate(query, {}, ["products"])]
+    except ShopifyAPIError as e:
+        logging.error(f"Error fetching product IDs: {e}")
+        return None
+
+def fetch_price_lists():
+    """Fetch all price lists in the shop, or None if they could not be fetched"""
+    query = """
+    query GetPriceLists($cursor: String, $batchSize: Int!) {
+        priceLists(first: $batchSize, after: $cursor) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            edges {
+                node {
+                    id
+                    name
+                    currency
+                    fixedPricesCount
+                }
+            }
+        }
+    }
+    """
+    
+    try:
+        price_lists = list(paginate(query, {}, ["priceLists"]))
+    except ShopifyAPIError as e:
+        logging.error(f"Error fetching price lists: {e}")
+        return None
+    
+    logging.info(f"Found {len(price_lists)} price lists in the shop")
+    return price_lists
+
+PRICE_LIST_PRICES_QUERY = """
+query GetPriceListPrices($priceListId: ID!, $cursor: String, $batchSize: Int!, $queryString: String) {
+    priceList(id: $priceListId) {
+        prices(first: $batchSize, after: $cursor, query: $queryString) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            nodes {
+                price {
+                    amount
+                    currencyCode
+                }
+                compareAtPrice {
+                    amount
+                    currencyCode
+                }
+                variant {
+                    id
+                }
+            }
+        }
+    }
+}
+"""
+
+def price_list_prices_variables(price_list_id, query_string=None):
+    variables = {
+        "priceListId": price_list_id
+    }
+    if query_string:
+        variables["queryString"] = query_string
+    return variables
+
+def price_list_price(node):
+    """Format a price list price node in our expected structure"""
+    return {
+        "variant_id": node["variant"]["id"],
+        "price": node["price"],
+        "compare_at_price": node.get("compareAtPrice")
+    }
+
+def fetch_price_list_prices(price_list_id, query_string=None, batch_size=None):
+    """Fetch every fixed price in a price list, following pagination"""
+    variables = price_list_prices_variables(price_list_id, query_string)
+    try:
+        return [price_list_price(node) for node in paginate(PRICE_LIST_PRICES_QUERY, variables, ["priceList", "prices"], batch_size)]
+    except ShopifyAPIError as e:
+        logging.error(f"Error fetching price list prices: {e}")
+        return None
+
+async def fetch_price_list_prices_async(price_list_id, query_string=None, batch_size=None):
+    """Coroutine version of fetch_price_list_prices for the asyncio engine"""
+    variables = price_list_prices_variables(price_list_id, query_string)
+    try:
+        return [price_list_price(node) async for node in paginate_async(PRICE_LIST_PRICES_QUERY, variables, ["priceList", "prices"], batch_size)]
+    except ShopifyAPIError as e:
+        logging.error(f"Error fetching price list prices: {e}")
+        return None
+
+VARIANT_PRICES_QUERY = """
+query GetVariantPrices($cursor: String, $batchSize: Int!, $queryString: String) {
+    productVariants(first: $batchSize, after: $cursor, query: $queryString) {
+        pageInfo {
+            hasNextPage
+            endCursor
+        }
+        nodes {
+            id
+            price
+            compareAtPrice
+        }
+    }
+}
+"""
+
+def fetch_variant_prices(query_string=None, batch_size=None):
+    """Fetch the current price and compare-at price of every matching variant, following pagination
+    
+    Returns {variant_id: {"price", "compareAtPrice"}}, or None on failure.
+    """
+    variables = {"queryString": query_string} if query_string else {}
+    try:
+        return {
+            node["id"]: {"price": node["price"], "compareAtPrice": node.get("compareAtPrice")}
+            for node in paginate(VARIANT_PRICES_QUERY, variables, ["productVariants"], batch_size)
+        }
+    except ShopifyAPIError as e:
+        logging.error(f"Error fetching variant prices: {e}")
+        return None
+
+async def fetch_variant_prices_async(query_string=None, batch_size=None):
+    """Coroutine version of fetch_variant_prices for the asyncio engine"""
+    variables = {"queryString": query_string} if query_string else {}
+    try:
+        return {
+            node["id"]: {"price": node["price"], "compareAtPrice": node.get("compareAtPrice")}
+            async for node in paginate_async(VARIANT_PRICES_QUERY, variables, ["productVariants"], batch_size)
+        }
+    except ShopifyAPIError as e:
+        logging.error(f"Error fetching variant prices: {e}")
+        return None
+
+# Scopes with at most this many variants are looked up with variant_id: filters
+# instead of sweeping each whole price list
+PRICE_FILTER_MAX_VARIANTS = 500
+PRICE_FILTER_CHUNK_SIZE = 50
+
+def id_filter_query_strings(field, ids):
+    """Search queries matching ids on field ("variant_id:1 OR variant_id:2"), PRICE_FILTER_CHUNK_SIZE IDs each"""
+    id_parts = sorted(gid.split("/")[-1] for gid in ids)
+    return [
+        f"{field}:" + f" OR {field}:".join(id_parts[i:i + PRICE_FILTER_CHUNK_SIZE])
+        for i in range(0, len(id_parts), PRICE_FILTER_CHUNK_SIZE)
+    ]
+
+def build_market_price_index(price_lists, variant_ids=None, by_variant=False, quiet=False):
+    """Sweep each price list once and index its prices by variant ID
+    
+    Returns {variant_id: {price_list_id: price_data}}, or None if a price list
+    could not be read. When variant_ids is given, only those variants are kept;
+    with by_variant they are always looked up by variant ID instead of
+    sweeping. quiet logs the per-list counts at DEBUG and hides the progress
+    bar, for lookups repeated once per page.
+    """
+    wanted = set(variant_ids) if variant_ids is not None else None
+    
+    # Small scopes (e.g. a collection) are cheaper to look up by variant ID
+    # than to page through every price in every list
+    query_strings = [None]
+    if wanted is not None and (by_variant or len(wanted) <= PRICE_FILTER_MAX_VARIANTS):
+        query_strings = id_filter_query_strings("variant_id", wanted)
+    
+    def sweep(task):
+        price_list, query_string = task
+        return fetch_price_list_prices(price_list["id"], query_string)
+    
+    async def sweep_async(task):
+        price_list, query_string = task
+        return await fetch_price_list_prices_async(price_list["id"], query_string)
+    
+    tasks = [(price_list, query_string) for price_list in price_lists for query_string in query_strings]
+    
+    # Price lists are swept in parallel and joined here on the calling thread
+    index = {}
+    found = {}
+    failed = False
+    results = run_in_workers(sweep, tasks, "Sweeping price lists", async_func=sweep_async, progress=not quiet)
+    for (price_list, _), prices, error in results:
+        price_list_id = price_list["id"]
+        if error or prices is None:
+            logging.error(f"Failed to fetch prices for price list {price_list['name']}: {error or 'request failed'}")
+            failed = True
+            continue
+        
+        for price_data in prices:
+            variant_id = price_data["variant_id"]
+            if wanted is not None and variant_id not in wanted:
+                continue
+            index.setdefault(variant_id, {})[price_list_id] = price_data
+            found[price_list_id] = found.get(price_list_id, 0) + 1
+    
+    if failed:
+        return None
+    
+    for price_list in price_lists:
+        logging.log(logging.DEBUG if quiet else logging.INFO,
+                    f"Found {found.get(price_list['id'], 0)} prices in price list {price_list['name']} ({price_list['currency']})")
+    
+    return index
+
+# Price lists with at most this many fixed prices are swept once per backup;
+# larger ones are looked up page by page so a backup's memory stays bounded
+PRICE_LIST_SWEEP_MAX_PRICES = 10000
+
+class MarketPriceLookup:
+    """Market prices for product pages that are backed up as they are fetched
+    
+    Price lists without fixed prices are skipped. Lists with at most
+    PRICE_LIST_SWEEP_MAX_PRICES fixed prices are swept once up front, and
+    larger ones are looked up by variant ID for each page, so only one
+    page's prices of the large lists are held at a time.
+    """
+    
+    def __init__(self, price_lists, swept_index, paged_lists):
+        self.price_lists = price_lists
+        self.swept_index = swept_index
+        self.paged_lists = paged_lists
+    
+    @classmethod
+    def fetch(cls, price_lists):
+        """Sweep the small price lists; returns None if one could not be read"""
+        with_prices = [price_list for price_list in price_lists if price_list.get("fixedPricesCount") != 0]
+        swept_lists = [
+            price_list for price_list in with_prices
+            if price_list.get("fixedPricesCount") is not None and price_list["fixedPricesCount"] <= PRICE_LIST_SWEEP_MAX_PRICES
+        ]
+        paged_lists = [price_list for price_list in with_prices if price_list not in swept_lists]
+        logging.info(f"Sweeping {len(swept_lists)} price lists once and looking up {len(paged_lists)} per page; "
+                     f"{len(price_lists) - len(with_prices)} have no fixed prices")
+        
+        swept_index = build_market_price_index(swept_lists) if swept_lists else {}
+        if swept_index is None:
+            return None
+        return cls(price_lists, swept_index, paged_lists)
+    
+    def page_index(self, products):
+        """Market price index for the variants of one page of products, or None on failure"""
+        variant_ids = [edge["node"]["id"] for product in products for edge in product["variants"]["edges"]]
+        index = {}
+        if self.paged_lists and variant_ids:
+            index = build_market_price_index(self.paged_lists, variant_ids, by_variant=True, quiet=True)
+            if index is None:
+                return None
+        for variant_id in variant_ids:
+            if variant_id in self.swept_index:
+                index.setdefault(variant_id, {}).update(self.swept_index[variant_id])
+        return index
+
+class BackupWriter:
+    """Stream product backups to a JSON Lines file
+    
+    The first line is a header record, followed by one record per product and
+    a footer with product, variant and market price counts once the backup is
+    complete. Records are flushed as they are written and fsync'd every
+    fsync_every products, so an interrupted backup keeps everything written
+    before the interruption.
+    """
+    
+    def __init__(self, path, name=None, fsync_every=100, scope=None, snapshot_at=None, price_lists=None, base=None):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.product_count = 0
+        self.variant_count = 0
+        self.market_price_count = 0
+        self.price_list_ids = set()
+        # Written to the footer too, so a backup can be rescoped (e.g. as a
+        # partial catalog) after its header is on disk
+        self.scope = scope
+        ensure_directories()
+        self.file = open(path, 'w')
+        self._write({
+            "type": "header",
+            "format": BACKUP_FORMAT,
+            "version": BACKUP_FORMAT_VERSION,
+            "name": name,
+            "shop": SHOP_NAME,
+            "scope": scope,
+            "created": datetime.datetime.now().isoformat(),
+            # When fetching started (UTC); incremental backups look for changes after this
+            "snapshot_at": snapshot_at,
+            "price_lists": [price_list_fingerprint(price_list) for price_list in price_lists or []],
+            "base": base
+        })
+        self.sync()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
+    
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+    
+    def sync(self):
+        """Flush and fsync every record written so far"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    
+    def write_product(self, product_id, backup_data):
+        self._write({"type": "product", "product_id": product_id, "data": backup_data})
+        self.product_count += 1
+        self.variant_count += len(backup_data["product"]["variants"]["edges"])
+        for price_list_id, price_list_data in backup_data["market_prices"].items():
+            self.price_list_ids.add(price_list_id)
+            self.market_price_count += len(price_list_data["prices"])
+        if self.product_count % self.fsync_every == 0:
+            self.sync()
+        else:
+            self.file.flush()
+    
+    def close(self, complete=True):
+        """Write the footer (unless the backup was interrupted) and close the file"""
+        if self.file.closed:
+            return
+        if complete:
+            self._write({
+                "type": "footer",
+                "scope": self.scope,
+                "product_count": self.product_count,
+                "variant_count": self.variant_count,
+                "market_price_count": self.market_price_count,
+                "price_list_count": len(self.price_list_ids)
+            })
+        self.sync()
+        self.file.close()
+
+def read_backup_info(backup_file):
+    """Read the header and footer of a backup without loading its products
+    
+    Returns (header, footer). Legacy JSON backups have no header and are
+    loaded to count their products; footer is None for interrupted backups.
+    """
+    if is_snapshot_ref(backup_file):
+        with SnapshotStore() as store:
+            return store.info(int(backup_file[len(SNAPSHOT_PREFIX):]))
+    
+    if backup_file.endswith(COLUMNAR_EXTENSION):
+        with ColumnarBackup(backup_file) as backup:
+            return backup.header, backup.footer
+    
+    if not backup_file.endswith(BACKUP_EXTENSION):
+        with open(backup_file, 'r') as f:
+            return {}, {"type": "footer", "product_count": len(json.load(f))}
+    
+    with open(backup_file, 'rb') as f:
+        header = json.loads(f.readline())
+        
+        # Read backwards from the end of the file to find the last line
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        tail = b""
+        while position > 0 and tail.count(b"\n") < 2:
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+        last_line = tail.rstrip(b"\n").rsplit(b"\n", 1)[-1]
+    
+    try:
+        footer = json.loads(last_line)
+    except ValueError:
+        footer = None
+    if not footer or footer.get("type") != "footer":
+        footer = None
+    
+    return header, footer
+
+def iter_backup(backup_file):
+    """Yield (product_id, product_data) pairs from a backup file
+    
+    JSON Lines and columnar backups are streamed one product at a time.
+    Legacy pretty-printed JSON backups are loaded whole. "snapshot:<id>"
+    reads a snapshot from the snapshot store.
+    """
+    if is_snapshot_ref(backup_file):
+        with SnapshotStore() as store:
+            yield from store.iter_products(int(backup_file[len(SNAPSHOT_PREFIX):]))
+        return
+    
+    if backup_file.endswith(COLUMNAR_EXTENSION):
+        with ColumnarBackup(backup_file) as backup:
+            yield from backup
+        return
+    
+    if not backup_file.endswith(BACKUP_EXTENSION):
+        with open(backup_file, 'r') as f:
+            backup_data = json.load(f)
+        yield from backup_data.items()
+        return
+    
+    with open(backup_file, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # An interrupted backup may end in a partially written line
+                logging.warning(f"Skipping unreadable line {line_number} in {backup_file}")
+                continue
+            if record.get("type") == "product":
+                yield record["product_id"], record["data"]
+
+def count_backup_products(backup_file):
+    """Number of products in a backup, or None if it was interrupted"""
+    _, footer = read_backup_info(backup_file)
+    return footer["product_count"] if footer else None
+
+# Compact columnar backups store the same records as JSON Lines backups, but
+# as typed columns: IDs as integers, prices as scaled integers and strings in
+# one blob per column. Products that don't fit the columns exactly are kept
+# as raw JSON, so conversion in either direction is lossless.
+COLUMNAR_EXTENSION = ".spbc"
+COLUMNAR_MAGIC = b"SPBCOL1\n"
+COLUMNAR_TRAILER_MAGIC = b"SPBCEND\n"
+
+# Typed columns are stored little-endian
+COLUMNAR_BYTE_ORDER_SWAP = sys.byteorder != "little"
+
+PRODUCT_GID_PREFIX = "gid://shopify/Product/"
+VARIANT_GID_PREFIX = "gid://shopify/ProductVariant/"
+
+# Scale stored for missing decimals and index stored for missing currencies
+NULL_SCALE = -1
+NULL_INDEX = 0xFFFF
+
+DECIMAL_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+
+def encode_decimal(amount):
+    """Split a decimal string into (unscaled integer, scale), or None if it can't be stored exactly"""
+    if amount is None:
+        return 0, NULL_SCALE
+    if not isinstance(amount, str) or not DECIMAL_PATTERN.fullmatch(amount):
+        return None
+    whole, _, fraction = amount.partition(".")
+    if len(fraction) > 18:
+        return None
+    unscaled = int(whole + fraction)
+    # Columns are int64; anything larger is kept in the raw JSON fallback
+    if not -2 ** 63 <= unscaled < 2 ** 63:
+        return None
+    return unscaled, len(fraction)
+
+def decode_decimal(unscaled, scale):
+    if scale == NULL_SCALE:
+        return None
+    sign = "-" if unscaled < 0 else ""
+    digits = str(abs(unscaled)).rjust(scale + 1, "0")
+    if not scale:
+        return sign + digits
+    return f"{sign}{digits[:-scale]}.{digits[-scale:]}"
+
+def encode_gid(gid, prefix):
+    """Numeric part of a global ID with the given prefix, or None"""
+    if isinstance(gid, str) and gid.startswith(prefix) and gid[len(prefix):].isdigit():
+        return int(gid[len(prefix):])
+    return None
+
+class ColumnarBackupWriter:
+    """Build the columns of a compact backup in memory and write them out in one go"""
+    
+    INT_COLUMNS = {
+        "product_kind": "B", "product_id": "q", "variant_start": "I", "price_list_start": "I",
+        "variant_id": "q", "variant_price": "q", "variant_price_scale": "b",
+        "variant_compare_at": "q", "variant_compare_at_scale": "b",
+        "product_price_list": "H", "market_row_start": "I",
+        "market_variant_id": "q", "market_price": "q", "market_price_scale": "b", "market_currency": "H",
+        "market_compare_at": "q", "market_compare_at_scale": "b", "market_compare_at_currency": "H"
+    }
+    STRING_COLUMNS = (
+        "product_raw", "product_timestamp", "product_shop", "product_metadata_title", "product_title",
+        "product_handle", "product_tags", "variant_title", "variant_sku",
+        "price_list_id", "price_list_name", "price_list_currency", "currency"
+    )
+    
+    def __init__(self):
+        self.columns = {name: array.array(typecode) for name, typecode in self.INT_COLUMNS.items()}
+        self.strings = {name: [] for name in self.STRING_COLUMNS}
+        self.price_list_index = {}
+        self.currency_index = {}
+        self.columns["variant_start"].append(0)
+        self.columns["price_list_start"].append(0)
+        self.columns["market_row_start"].append(0)
+        self.raw_count = 0
+    
+    def _currency(self, currency):
+        if currency not in self.currency_index:
+            self.currency_index[currency] = len(self.strings["currency"])
+            self.strings["currency"].append(currency)
+        return self.currency_index[currency]
+    
+    def _price_list(self, price_list_id, name, currency):
+        key = (price_list_id, name, currency)
+        if key not in self.price_list_index:
+            self.price_list_index[key] = len(self.strings["price_list_id"])
+            self.strings["price_list_id"].append(price_list_id)
+            self.strings["price_list_name"].append(name)
+            self.strings["price_list_currency"].append(currency)
+        return self.price_list_index[key]
+    
+    def add_product(self, product_id, product_data):
+        """Add one backed up product, as columns if it round-trips exactly and as raw JSON otherwise"""
+        rows = self._encode(product_id, product_data)
+        if rows is not None and json.dumps(decode_product_rows(*rows)) == json.dumps((product_id, product_data)):
+            self._append(*rows)
+            return
+        
+        # Anything the columns can't hold exactly is kept verbatim
+        self.raw_count += 1
+        self.columns["product_kind"].append(1)
+        self.columns["product_id"].append(0)
+        self.strings["product_raw"].append(json.dumps([product_id, product_data], separators=(",", ":")))
+        for name in ("product_timestamp", "product_shop", "product_metadata_title", "product_title", "product_handle", "product_tags"):
+            self.strings[name].append(None)
+        self.columns["variant_start"].append(self.columns["variant_start"][-1])
+        self.columns["price_list_start"].append(self.columns["price_list_start"][-1])
+    
+    def _encode(self, product_id, product_data):
+        """Flatten a product into plain rows, or None if its shape doesn't fit the columns"""
+        try:
+            metadata = product_data["metadata"]
+            product = product_data["product"]
+            numeric_id = encode_gid(product_id, PRODUCT_GID_PREFIX)
+            if numeric_id is None:
+                return None
+            
+            variants = []
+            for edge in product["variants"]["edges"]:
+                node = edge["node"]
+                variant_id = encode_gid(node["id"], VARIANT_GID_PREFIX)
+                price = encode_decimal(node["price"])
+                compare_at = encode_decimal(node.get("compareAtPrice"))
+                if variant_id is None or price is None or price[1] == NULL_SCALE or compare_at is None:
+                    return None
+                variants.append((variant_id, node.get("title"), node.get("sku"), price, compare_at))
+            
+            price_lists = []
+            for price_list_id, price_list_data in product_data["market_prices"].items():
+                rows = []
+                for price_data in price_list_data["prices"]:
+                    variant_id = encode_gid(price_data["variant_id"], VARIANT_GID_PREFIX)
+                    amount = encode_decimal(price_data["price"]["amount"])
+                    compare_at_price = price_data.get("compare_at_price")
+                    compare_at = encode_decimal(compare_at_price["amount"] if compare_at_price else None)
+                    if variant_id is None or amount is None or amount[1] == NULL_SCALE or compare_at is None:
+                        return None
+                    rows.append((
+                        variant_id, amount, price_data["price"]["currencyCode"],
+                        compare_at, compare_at_price["currencyCode"] if compare_at_price else None
+                    ))
+                price_lists.append((price_list_id, price_list_data["name"], price_list_data["currency"], rows))
+            
+            tags = json.dumps(product["tags"], separators=(",", ":")) if "tags" in product else None
+            return (
+                numeric_id, metadata["timestamp"], metadata["shop"], metadata["product_title"],
+                product["title"], product["handle"], tags, variants, price_lists
+            )
+        except (KeyError, TypeError, AttributeError):
+            return None
+    
+    def _append(self, numeric_id, timestamp, shop, metadata_title, title, handle, tags, variants, price_lists):
+        columns = self.columns
+        strings = self.strings
+        columns["product_kind"].append(0)
+        columns["product_id"].append(numeric_id)
+        strings["product_raw"].append(None)
+        strings["product_timestamp"].append(timestamp)
+        strings["product_shop"].append(shop)
+        strings["product_metadata_title"].append(metadata_title)
+        strings["product_title"].append(title)
+        strings["product_handle"].append(handle)
+        strings["product_tags"].append(tags)
+        
+        for variant_id, variant_title, sku, price, compare_at in variants:
+            columns["variant_id"].append(variant_id)
+            strings["variant_title"].append(variant_title)
+            strings["variant_sku"].append(sku)
+            columns["variant_price"].append(price[0])
+            columns["variant_price_scale"].append(price[1])
+            columns["variant_compare_at"].append(compare_at[0])
+            columns["variant_compare_at_scale"].append(compare_at[1])
+        columns["variant_start"].append(len(columns["variant_id"]))
+        
+        for price_list_id, name, currency, rows in price_lists:
+            columns["product_price_list"].append(self._price_list(price_list_id, name, currency))
+            for variant_id, amount, amount_currency, compare_at, compare_at_currency in rows:
+                columns["market_variant_id"].append(variant_id)
+                columns["market_price"].append(amount[0])
+                columns["market_price_scale"].append(amount[1])
+                columns["market_currency"].append(self._currency(amount_currency))
+                columns["market_compare_at"].append(compare_at[0])
+                columns["market_compare_at_scale"].append(compare_at[1])
+                columns["market_compare_at_currency"].append(
+                    self._currency(compare_at_currency) if compare_at_currency is not None else NULL_INDEX
+                )
+            columns["market_row_start"].append(len(columns["market_variant_id"]))
+        columns["price_list_start"].append(len(columns["product_price_list"]))
+    
+    def write(self, path, header, footer):
+        """Write the columns and a directory describing them to path"""
+        directory = {"header": header, "footer": footer, "columns": {}}
+        
+        with open(path, 'wb') as f:
+            f.write(COLUMNAR_MAGIC)
+            
+            def write_blob(name, typecode, data):
+                # Columns start on 8-byte boundaries so they can be cast in place
+                f.write(b"\0" * (-f.tell() % 8))
+                directory["columns"][name] = {"type": typecode, "offset": f.tell(), "length": len(data)}
+                f.write(data)
+            
+            for name, values in self.columns.items():
+                if COLUMNAR_BYTE_ORDER_SWAP:
+                    values = array.array(values.typecode, values)
+                    values.byteswap()
+                write_blob(name, values.typecode, values.tobytes())
+            
+            for name, values in self.strings.items():
+                offsets = array.array("Q", [0])
+                nulls = bytearray()
+                blob = bytearray()
+                for value in values:
+                    nulls.append(value is None)
+                    if value is not None:
+                        blob += value.encode("utf-8")
+                    offsets.append(len(blob))
+                if COLUMNAR_BYTE_ORDER_SWAP:
+                    offsets.byteswap()
+                write_blob(f"{name}.offsets", "Q", offsets.tobytes())
+                write_blob(f"{name}.nulls", "B", bytes(nulls))
+                write_blob(f"{name}.data", "s", bytes(blob))
+            
+            directory_bytes = json.dumps(directory, separators=(",", ":")).encode("utf-8")
+            directory_offset = f.tell()
+            f.write(directory_bytes)
+            f.write(struct.pack("<QQ", directory_offset, len(directory_bytes)))
+            f.write(COLUMNAR_TRAILER_MAGIC)
+
+def decode_product_rows(numeric_id, timestamp, shop, metadata_title, title, handle, tags, variants, price_lists):
+    """Rebuild (product_id, product_data) in the backup record shape from flattened rows"""
+    product_id = f"{PRODUCT_GID_PREFIX}{numeric_id}"
+    product = {"id": product_id, "title": title, "handle": handle}
+    if tags is not None:
+        product["tags"] = json.loads(tags)
+    product["variants"] = {"edges": [
+        {"node": {
+            "id": f"{VARIANT_GID_PREFIX}{variant_id}",
+            "title": variant_title,
+            "sku": sku,
+            "price": decode_decimal(*price),
+            "compareAtPrice": decode_decimal(*compare_at)
+        }}
+        for variant_id, variant_title, sku, price, compare_at in variants
+    ]}
+    
+    market_prices = {}
+    for price_list_id, name, currency, rows in price_lists:
+        prices = []
+        for variant_id, amount, amount_currency, compare_at, compare_at_currency in rows:
+            compare_at_amount = decode_decimal(*compare_at)
+            prices.append({
+                "variant_id": f"{VARIANT_GID_PREFIX}{variant_id}",
+                "price": {"amount": decode_decimal(*amount), "currencyCode": amount_currency},
+                "compare_at_price": (
+                    {"amount": compare_at_amount, "currencyCode": compare_at_currency}
+                    if compare_at_amount is not None else None
+                )
+            })
+        market_prices[price_list_id] = {"prices": prices, "currency": currency, "name": name}
+    
+    return product_id, {
+        "metadata": {
+            "timestamp": timestamp,
+            "shop": shop,
+            "product_id": product_id,
+            "product_title": metadata_title
+        },
+        "product": product,
+        "market_prices": market_prices
+    }
+
+class ColumnarBackup:
+    """Memory-mapped reader for compact columnar backups
+    
+    Only the directory is parsed on open. Columns are exposed as typed
+    memoryviews over the mapped file, and products are decoded one at a
+    time when they are read.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        if self.map[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC or self.map[-len(COLUMNAR_TRAILER_MAGIC):] != COLUMNAR_TRAILER_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a columnar backup")
+        
+        trailer_start = len(self.map) - len(COLUMNAR_TRAILER_MAGIC) - 16
+        directory_offset, directory_length = struct.unpack("<QQ", self.map[trailer_start:trailer_start + 16])
+        directory = json.loads(self.map[directory_offset:directory_offset + directory_length])
+        self.header = directory["header"]
+        self.footer = directory["footer"]
+        self.directory = directory["columns"]
+        self.view = memoryview(self.map)
+        self._columns = {}
+        self.product_count = len(self.column("product_kind"))
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def __len__(self):
+        return self.product_count
+    
+    def close(self):
+        self._columns = {}
+        if getattr(self, "view", None) is not None:
+            self.view.release()
+            self.view = None
+        if not self.map.closed:
+            self.map.close()
+        self.file.close()
+    
+    def column(self, name):
+        """A typed view of a column, read straight from the mapped file"""
+        column = self._columns.get(name)
+        if column is None:
+            entry = self.directory[name]
+            data = self.view[entry["offset"]:entry["offset"] + entry["length"]]
+            if entry["type"] == "s":
+                column = data
+            elif COLUMNAR_BYTE_ORDER_SWAP and entry["type"] not in ("b", "B"):
+                column = array.array(entry["type"], data.tobytes())
+                column.byteswap()
+            else:
+                column = data.cast(entry["type"])
+            self._columns[name] = column
+        return column
+    
+    def string(self, name, index):
+        if self.column(f"{name}.nulls")[index]:
+            return None
+        offsets = self.column(f"{name}.offsets")
+        return bytes(self.column(f"{name}.data")[offsets[index]:offsets[index + 1]]).decode("utf-8")
+    
+    def product(self, index):
+        """Decode the product at index as (product_id, product_data)"""
+        if self.column("product_kind")[index] == 1:
+            product_id, product_data = json.loads(self.string("product_raw", index))
+            return product_id, product_data
+        
+        variant_start = self.column("variant_start")
+        variants = [
+            (
+                self.column("variant_id")[row],
+                self.string("variant_title", row),
+                self.string("variant_sku", row),
+                (self.column("variant_price")[row], self.column("variant_price_scale")[row]),
+                (self.column("variant_compare_at")[row], self.column("variant_compare_at_scale")[row])
+            )
+            for row in range(variant_start[index], variant_start[index + 1])
+        ]
+        
+        price_list_start = self.column("price_list_start")
+        market_row_start = self.column("market_row_start")
+        price_lists = []
+        for position in range(price_list_start[index], price_list_start[index + 1]):
+            price_list = self.column("product_price_list")[position]
+            rows = []
+            for row in range(market_row_start[position], market_row_start[position + 1]):
+                compare_at_currency = self.column("market_compare_at_currency")[row]
+                rows.append((
+                    self.column("market_variant_id")[row],
+                    (self.column("market_price")[row], self.column("market_price_scale")[row]),
+                    self.string("currency", self.column("market_currency")[row]),
+                    (self.column("market_compare_at")[row], self.column("market_compare_at_scale")[row]),
+                    self.string("currency", compare_at_currency) if compare_at_currency != NULL_INDEX else None
+                ))
+            price_lists.append((
+                self.string("price_list_id", price_list),
+                self.string("price_list_name", price_list),
+                self.string("price_list_currency", price_list),
+                rows
+            ))
+        
+        return decode_product_rows(
+            self.column("product_id")[index],
+            self.string("product_timestamp", index),
+            self.string("product_shop", index),
+            self.string("product_metadata_title", index),
+            self.string("product_title", index),
+            self.string("product_handle", index),
+            self.string("product_tags", index),
+            variants,
+            price_lists
+        )
+    
+    def __iter__(self):
+        for index in range(self.product_count):
+            yield self.product(index)
+
+def generated_backup_header(name):
+    """Header for a JSON Lines backup written from a source without one, such as a legacy JSON backup"""
+    return {
+        "type": "header", "format": BACKUP_FORMAT, "version": BACKUP_FORMAT_VERSION,
+        "name": name, "shop": SHOP_NAME, "created": datetime.datetime.now().isoformat()
+    }
+
+def convert_backup(backup_file):
+    """Convert a JSON or JSON Lines backup to the compact columnar format, or a columnar backup back to JSON Lines
+    
+    The converted file is written next to the original, which is kept.
+    Returns the new path, or None on failure.
+    """
+    base_path = os.path.splitext(backup_file)[0]
+    
+    if backup_file.endswith(COLUMNAR_EXTENSION):
+        target = base_path + BACKUP_EXTENSION
+        if os.path.exists(target):
+            logging.error(f"Not converting: {target} already exists")
+            return None
+        with ColumnarBackup(backup_file) as backup:
+            header = backup.header or generated_backup_header(os.path.basename(base_path))
+            with open(target, 'w') as f:
+                f.write(json.dumps(header, separators=(",", ":")) + "\n")
+                for product_id, product_data in backup:
+                    f.write(json.dumps({"type": "product", "product_id": product_id, "data": product_data}, separators=(",", ":")) + "\n")
+                if backup.footer:
+                    f.write(json.dumps(backup.footer, separators=(",", ":")) + "\n")
+        logging.info(f"Converted {backup_file} to {target}")
+        index_backup(target)
+        return target
+    
+    target = base_path + COLUMNAR_EXTENSION
+    if os.path.exists(target):
+        logging.error(f"Not converting: {target} already exists")
+        return None
+    
+    header, footer = read_backup_info(backup_file)
+    writer = ColumnarBackupWriter()
+    for product_id, product_data in iter_backup(backup_file):
+        writer.add_product(product_id, product_data)
+    writer.write(target, header, footer)
+    
+    if writer.raw_count:
+        logging.info(f"{writer.raw_count} products did not fit the columns and were stored as JSON")
+    logging.info(f"Converted {backup_file} ({os.path.getsize(backup_file)} bytes) to {target} ({os.path.getsize(target)} bytes)")
+    index_backup(target)
+    return target
+
+def find_base_backup():
+    """The newest complete full catalog backup of this shop that an incremental backup can build on"""
+    backup_files = [
+        f for f in (os.listdir(BACKUP_DIR) if os.path.isdir(BACKUP_DIR) else [])
+        if f.endswith((BACKUP_EXTENSION, COLUMNAR_EXTENSION)) and f != os.path.basename(BACKUP_INDEX_FILE)
+    ]
+    entries = backup_index_entries(backup_files)
+    candidates = sorted(
+        (entry["created"] or "", file) for file, entry in entries.items()
+        if entry and entry["complete"] and entry["scope"] == "all products" and entry["shop"] == SHOP_NAME
+    )
+    
+    for _, file in reversed(candidates):
+        file_path = os.path.join(BACKUP_DIR, file)
+        header, _ = read_backup_info(file_path)
+        # Backups from before snapshot times were recorded can't be used as a base
+        if header.get("snapshot_at"):
+            return file_path
+    return None
+
+def utc_timestamp(moment=None):
+    """Format a moment (default: now) the way Shopify search queries expect"""
+    moment = moment or datetime.datetime.now(datetime.timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def price_list_fingerprint(price_list):
+    """What is recorded about a price list to tell whether it changed between backups"""
+    return {key: price_list.get(key) for key in ("id", "name", "currency", "fixedPricesCount")}
+
+def backup_scope(header, footer):
+    """Scope of a backup; the footer's overrides the header's"""
+    if footer and "scope" in footer:
+        return footer["scope"]
+    return (header or {}).get("scope")
+
+def backup_manifest_entry(backup_file):
+    """Describe a backup for the index: scope, counts, size and checksum
+    
+    Counts come from the footer when the backup recorded them. Older and
+    interrupted backups are streamed once to count them instead.
+    """
+    header, footer = read_backup_info(backup_file)
+    header = header or {}
+    
+    if footer and "variant_count" in footer:
+        counts = {
+            "products": footer["product_count"],
+            "variants": footer["variant_count"],
+            "market_prices": footer["market_price_count"],
+            "price_lists": footer["price_list_count"]
+        }
+    else:
+        counts = {"products": 0, "variants": 0, "market_prices": 0, "price_lists": 0}
+        price_list_ids = set()
+        for _, product_data in iter_backup(backup_file):
+            counts["products"] += 1
+            counts["variants"] += len(product_data["product"]["variants"]["edges"])
+            for price_list_id, price_list_data in product_data.get("market_prices", {}).items():
+                price_list_ids.add(price_list_id)
+                counts["market_prices"] += len(price_list_data["prices"])
+        counts["price_lists"] = len(price_list_ids)
+    
+    checksum = hashlib.sha256()
+    with open(backup_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            checksum.update(chunk)
+    
+    stat = os.stat(backup_file)
+    return {
+        "name": header.get("name"),
+        "shop": header.get("shop"),
+        "scope": backup_scope(header, footer),
+        "created": header.get("created"),
+        "complete": footer is not None,
+        **counts,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha256": checksum.hexdigest()
+    }
+
+def load_backup_index():
+    """Load the backup index, or an empty one if it is missing or unreadable"""
+    try:
+        with open(BACKUP_INDEX_FILE, 'r') as f:
+            index = json.load(f)
+        if index.get("version") == BACKUP_INDEX_VERSION:
+            return index
+        logging.info("Backup index is from another version and will be rebuilt")
+    except FileNotFoundError:
+        pass
+    except (ValueError, AttributeError) as e:
+        logging.warning(f"Backup index is unreadable and will be rebuilt: {e}")
+    return {"version": BACKUP_INDEX_VERSION, "backups": {}}
+
+def save_backup_index(index):
+    """Write the backup index atomically so a crash never leaves it half written"""
+    ensure_directories()
+    temp_path = f"{BACKUP_INDEX_FILE}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(temp_path, BACKUP_INDEX_FILE)
+
+def index_backup(backup_file):
+    """Add or refresh a backup's entry in the index"""
+    try:
+        index = load_backup_index()
+        index["backups"][os.path.basename(backup_file)] = backup_manifest_entry(backup_file)
+        save_backup_index(index)
+    except Exception as e:
+        # The index is only a cache; listing repairs a missing entry later
+        logging.warning(f"Couldn't index backup {backup_file}: {e}")
+
+def backup_index_entries(backup_files):
+    """Index entries for the given backup files, repairing missing or stale ones
+    
+    An entry is stale when the file's size or modification time no longer
+    match. Entries for files that no longer exist are dropped.
+    """
+    index = load_backup_index()
+    backups = index["backups"]
+    changed = False
+    
+    for file in list(backups):
+        if file not in backup_files:
+            del backups[file]
+            changed = True
+    
+    entries = {}
+    for file in backup_files:
+        file_path = os.path.join(BACKUP_DIR, file)
+        entry = backups.get(file)
+        try:
+            stat = os.stat(file_path)
+            if not entry or entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime_ns:
+                logging.info(f"Indexing backup {file}")
+                entry = backup_manifest_entry(file_path)
+                backups[file] = entry
+                changed = True
+        except Exception as e:
+            logging.warning(f"Couldn't read details for backup file: {file}: {e}")
+            entry = None
+        entries[file] = entry
+    
+    if changed:
+        try:
+            save_backup_index(index)
+        except OSError as e:
+            logging.warning(f"Couldn't save the backup index: {e}")
+    
+    return entries
+
+# Backups can be ingested into a local SQLite database that indexes prices by
+# product, variant, SKU, price list and snapshot. A snapshot is referred to as
+# "snapshot:<id>" wherever a backup file is expected.
+SNAPSHOT_PREFIX = "snapshot:"
+
+SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    source_file TEXT,
+    source_sha256 TEXT UNIQUE,
+    shop TEXT,
+    scope TEXT,
+    created TEXT,
+    snapshot_at TEXT,
+    ingested TEXT,
+    header TEXT,
+    footer TEXT
+);
+CREATE TABLE IF NOT EXISTS product_records (
+    sha1 TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_products (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    position INTEGER NOT NULL,
+    product_id TEXT NOT NULL,
+    record_sha1 TEXT NOT NULL REFERENCES product_records(sha1),
+    PRIMARY KEY (snapshot_id, position)
+);
+CREATE TABLE IF NOT EXISTS price_lists (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    price_list_id TEXT NOT NULL,
+    name TEXT,
+    currency TEXT,
+    PRIMARY KEY (snapshot_id, price_list_id)
+);
+CREATE TABLE IF NOT EXISTS variant_prices (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    variant_id TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    sku TEXT,
+    price_cents INTEGER,
+    compare_at_cents INTEGER,
+    PRIMARY KEY (snapshot_id, variant_id)
+);
+CREATE TABLE IF NOT EXISTS market_prices (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    price_list_id TEXT NOT NULL,
+    variant_id TEXT NOT NULL,
+    currency TEXT,
+    price_cents INTEGER,
+    compare_at_cents INTEGER,
+    PRIMARY KEY (snapshot_id, price_list_id, variant_id)
+);
+CREATE INDEX IF NOT EXISTS snapshot_products_product ON snapshot_products (product_id, snapshot_id);
+CREATE INDEX IF NOT EXISTS variant_prices_variant ON variant_prices (variant_id, snapshot_id);
+CREATE INDEX IF NOT EXISTS variant_prices_sku ON variant_prices (sku, snapshot_id);
+CREATE INDEX IF NOT EXISTS variant_prices_product ON variant_prices (product_id, snapshot_id);
+CREATE INDEX IF NOT EXISTS market_prices_variant ON market_prices (variant_id, snapshot_id);
+"""
+
+def is_snapshot_ref(backup_file):
+    return isinstance(backup_file, str) and backup_file.startswith(SNAPSHOT_PREFIX)
+
+def optional_cents(amount):
+    return parse_cents(amount) if amount is not None and amount != "" else None
+
+class SnapshotStore:
+    """Price snapshots ingested from backups, in a local SQLite database
+    
+    Every product record is kept verbatim (deduplicated across snapshots),
+    so a snapshot of a JSON Lines backup exports back to the exact file it
+    came from. Variant and market prices are also stored as indexed rows in
+    integer cents for history and diff queries.
+    """
+    
+    def __init__(self, path=None):
+        self.path = path or SNAPSHOT_DB
+        ensure_directories()
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SNAPSHOT_SCHEMA)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def close(self):
+        self.connection.close()
+    
+    def ingest(self, backup_file):
+        """Add a backup as a new snapshot and return its ID
+        
+        A backup whose contents were already ingested is not added twice; the
+        existing snapshot's ID is returned instead.
+        """
+        checksum = hashlib.sha256()
+        with open(backup_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                checksum.update(chunk)
+        existing = self.connection.execute(
+            "SELECT id FROM snapshots WHERE source_sha256 = ?", (checksum.hexdigest(),)
+        ).fetchone()
+        if existing:
+            logging.info(f"{backup_file} is already snapshot {existing['id']}")
+            return existing["id"]
+        
+        header, footer = read_backup_info(backup_file)
+        header = header or {}
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO snapshots (name, source_file, source_sha256, shop, scope, created, snapshot_at, ingested, header, footer) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    header.get("name") or os.path.splitext(os.path.basename(backup_file))[0],
+                    os.path.basename(backup_file), checksum.hexdigest(),
+                    header.get("shop"), backup_scope(header, footer), header.get("created"), header.get("snapshot_at"),
+                    datetime.datetime.now().isoformat(),
+                    json.dumps(header) if header else None, json.dumps(footer) if footer else None
+                )
+            )
+            snapshot_id = cursor.lastrowid
+            
+            price_lists = {}
+            rows = {"records": [], "products": [], "variants": [], "markets": []}
+            
+            def flush():
+                self.connection.executemany("INSERT OR IGNORE INTO product_records VALUES (?, ?)", rows["records"])
+                self.connection.executemany("INSERT INTO snapshot_products VALUES (?, ?, ?, ?)", rows["products"])
+                self.connection.executemany("INSERT OR REPLACE INTO variant_prices VALUES (?, ?, ?, ?, ?, ?)", rows["variants"])
+                self.connection.executemany("INSERT OR REPLACE INTO market_prices VALUES (?, ?, ?, ?, ?, ?)", rows["markets"])
+                for batch in rows.values():
+                    batch.clear()
+            
+            for position, (product_id, product_data) in enumerate(iter_backup(backup_file)):
+                record = json.dumps([product_id, product_data], separators=(",", ":"))
+                record_sha1 = hashlib.sha1(record.encode("utf-8")).hexdigest()
+                rows["records"].append((record_sha1, record))
+                rows["products"].append((snapshot_id, position, product_id, record_sha1))
+                
+                for edge in product_data["product"]["variants"]["edges"]:
+                    variant = edge["node"]
+                    rows["variants"].append((
+                        snapshot_id, variant["id"], product_id, variant.get("sku"),
+                        optional_cents(variant.get("price")), optional_cents(variant.get("compareAtPrice"))
+                    ))
+                
+                for price_list_id, price_list_data in product_data.get("market_prices", {}).items():
+                    price_lists[price_list_id] = (price_list_data.get("name"), price_list_data.get("currency"))
+                    for price_data in price_list_data["prices"]:
+                        compare_at_price = price_data.get("compare_at_price")
+                        rows["markets"].append((
+                            snapshot_id, price_list_id, price_data["variant_id"],
+                            price_data["price"]["currencyCode"], optional_cents(price_data["price"].get("amount")),
+                            optional_cents(compare_at_price["amount"]) if compare_at_price else None
+                        ))
+                
+                if len(rows["products"]) >= 1000:
+                    flush()
+            flush()
+            
+            self.connection.executemany(
+                "INSERT INTO price_lists VALUES (?, ?, ?, ?)",
+                [(snapshot_id, price_list_id, name, currency) for price_list_id, (name, currency) in price_lists.items()]
+            )
+        
+        logging.info(f"Ingested {backup_file} as snapshot {snapshot_id}")
+        return snapshot_id
+    
+    def snapshots(self):
+        """Every snapshot with its product and variant counts, oldest first"""
+        return [dict(row) for row in self.connection.execute(
+            "SELECT s.id, s.name, s.source_file, s.shop, s.scope, s.created, s.snapshot_at, "
+            "(SELECT COUNT(*) FROM snapshot_products p WHERE p.snapshot_id = s.id) AS products, "
+            "(SELECT COUNT(*) FROM variant_prices v WHERE v.snapshot_id = s.id) AS variants "
+            "FROM snapshots s ORDER BY s.created, s.id"
+        )]
+    
+    def info(self, snapshot_id):
+        """The header and footer of the backup a snapshot was ingested from"""
+        row = self.connection.execute("SELECT header, footer FROM snapshots WHERE id = ?", (snapshot_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Snapshot {snapshot_id} does not exist")
+        return json.loads(row["header"]) if row["header"] else {}, json.loads(row["footer"]) if row["footer"] else None
+    
+    def iter_products(self, snapshot_id):
+        """Yield (product_id, product_data) pairs of a snapshot in their original order"""
+        rows = self.connection.execute(
+            "SELECT r.data FROM snapshot_products p JOIN product_records r ON r.sha1 = p.record_sha1 "
+            "WHERE p.snapshot_id = ? ORDER BY p.position",
+            (snapshot_id,)
+        )
+        for row in rows:
+            product_id, product_data = json.loads(row["data"])
+            yield product_id, product_data
+    
+    def export(self, snapshot_id, backup_path):
+        """Write a snapshot back out as a JSON Lines backup
+        
+        A snapshot of a JSON Lines backup is written out byte for byte as it
+        was ingested. Columnar and legacy JSON sources come out as equivalent
+        JSON Lines backups; legacy ones get a generated header.
+        """
+        header, footer = self.info(snapshot_id)
+        if not header:
+            row = self.connection.execute("SELECT name FROM snapshots WHERE id = ?", (snapshot_id,)).fetchone()
+            header = generated_backup_header(row["name"])
+        with open(backup_path, 'w') as f:
+            f.write(json.dumps(header, separators=(",", ":")) + "\n")
+            for product_id, product_data in self.iter_products(snapshot_id):
+                f.write(json.dumps({"type": "product", "product_id": product_id, "data": product_data}, separators=(",", ":")) + "\n")
+            if footer:
+                f.write(json.dumps(footer, separators=(",", ":")) + "\n")
+        logging.info(f"Exported snapshot {snapshot_id} to {backup_path}")
+        return backup_path
+    
+    def history(self, sku=None, variant_id=None, market=None):
+        """Prices of a SKU or variant across every snapshot, oldest first
+        
+        market limits the rows to the variant's own price ("base") or a
+        price list, given by ID, name or currency.
+        """
+        column, value = ("sku", sku) if sku is not None else ("variant_id", variant_id)
+        rows = self.connection.execute(
+            f"""
+            SELECT s.id AS snapshot_id, s.name AS snapshot, s.created, v.variant_id, v.sku,
+                   'base' AS market, NULL AS price_list_id, NULL AS currency, v.price_cents, v.compare_at_cents
+            FROM variant_prices v JOIN snapshots s ON s.id = v.snapshot_id
+            WHERE v.{column} = ?
+            UNION ALL
+            SELECT s.id, s.name, s.created, v.variant_id, v.sku,
+                   l.name, m.price_list_id, m.currency, m.price_cents, m.compare_at_cents
+            FROM variant_prices v
+            JOIN market_prices m ON m.snapshot_id = v.snapshot_id AND m.variant_id = v.variant_id
+            JOIN price_lists l ON l.snapshot_id = m.snapshot_id AND l.price_list_id = m.price_list_id
+            JOIN snapshots s ON s.id = v.snapshot_id
+            WHERE v.{column} = ?
+            ORDER BY 3, 1, 4, 7
+            """,
+            (value, value)
+        )
+        
+        return [
+            dict(row) for row in rows
+            if market is None or market in (row["market"], row["price_list_id"], row["currency"])
+        ]
+    
+    def diff(self, old_snapshot_id, new_snapshot_id):
+        """Variant and market price rows that were added, removed or changed between two snapshots
+        
+        Returns rows with the variant, SKU, market, old and new price and
+        compare-at price in cents, and change ("added", "removed" or "changed").
+        """
+        # Each side is joined to the other on its primary key, so both
+        # directions are index lookups rather than scans
+        rows = self.connection.execute(
+            """
+            SELECT o.variant_id, COALESCE(n.sku, o.sku) AS sku, 'base' AS market, NULL AS currency,
+                   o.price_cents AS old_price_cents, n.price_cents AS new_price_cents,
+                   o.compare_at_cents AS old_compare_at_cents, n.compare_at_cents AS new_compare_at_cents,
+                   CASE WHEN n.variant_id IS NULL THEN 'removed' ELSE 'changed' END AS change
+            FROM variant_prices o
+            LEFT JOIN variant_prices n ON n.snapshot_id = :new AND n.variant_id = o.variant_id
+            WHERE o.snapshot_id = :old
+              AND (n.variant_id IS NULL OR o.price_cents IS NOT n.price_cents OR o.compare_at_cents IS NOT n.compare_at_cents)
+            UNION ALL
+            SELECT n.variant_id, n.sku, 'base', NULL, NULL, n.price_cents, NULL, n.compare_at_cents, 'added'
+            FROM variant_prices n
+            LEFT JOIN variant_prices o ON o.snapshot_id = :old AND o.variant_id = n.variant_id
+            WHERE n.snapshot_id = :new AND o.variant_id IS NULL
+            UNION ALL
+            SELECT o.variant_id, (SELECT sku FROM variant_prices v WHERE v.snapshot_id = :old AND v.variant_id = o.variant_id),
+                   (SELECT name FROM price_lists l WHERE l.snapshot_id = :old AND l.price_list_id = o.price_list_id),
+                   o.currency, o.price_cents, n.price_cents, o.compare_at_cents, n.compare_at_cents,
+                   CASE WHEN n.variant_id IS NULL THEN 'removed' ELSE 'changed' END
+            FROM market_prices o
+            LEFT JOIN market_prices n
+                ON n.snapshot_id = :new AND n.price_list_id = o.price_list_id AND n.variant_id = o.variant_id
+            WHERE o.snapshot_id = :old
+              AND (n.variant_id IS NULL OR o.price_cents IS NOT n.price_cents OR o.compare_at_cents IS NOT n.compare_at_cents)
+            UNION ALL
+            SELECT n.variant_id, (SELECT sku FROM variant_prices v WHERE v.snapshot_id = :new AND v.variant_id = n.variant_id),
+                   (SELECT name FROM price_lists l WHERE l.snapshot_id = :new AND l.price_list_id = n.price_list_id),
+                   n.currency, NULL, n.price_cents, NULL, n.compare_at_cents, 'added'
+            FROM market_prices n
+            LEFT JOIN market_prices o
+                ON o.snapshot_id = :old AND o.price_list_id = n.price_list_id AND o.variant_id = n.variant_id
+            WHERE n.snapshot_id = :new AND o.variant_id IS NULL
+            ORDER BY 1, 3
+            """,
+            {"old": old_snapshot_id, "new": new_snapshot_id}
+        )
+        return [dict(row) for row in rows]
+
+def ingest_backup(backup_file):
+    """Ingest a backup into the snapshot store, returning the snapshot ID or None on failure"""
+    try:
+        with SnapshotStore() as store:
+            return store.ingest(backup_file)
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        logging.error(f"Failed to ingest {backup_file} into the snapshot store: {e}")
+        return None
+
+def print_price_rows(rows, limit=20):
+    """Print history or diff rows as a table, up to limit rows"""
+    def money(cents):
+        return format_cents(cents) if cents is not None else "-"
+    
+    for row in rows[:limit]:
+        market = row["market"] if row.get("currency") is None else f"{row['market']} ({row['currency']})"
+        if "change" in row:
+            print(f"   {row['change']:<8} {row['sku'] or row['variant_id']:<24} {market:<24} "
+                  f"{money(row['old_price_cents']):>10} -> {money(row['new_price_cents']):<10} "
+                  f"compare at {money(row['old_compare_at_cents'])} -> {money(row['new_compare_at_cents'])}")
+        else:
+            print(f"   {row['created'] or '':<26} {row['snapshot']:<32} {market:<24} "
+                  f"{money(row['price_cents']):>10}  compare at {money(row['compare_at_cents'])}")
+    if len(rows) > limit:
+        print(f"   ... and {len(rows) - limit} more")
+
+def backup_product(product, price_lists=None, market_price_index=None):
+    """Backup a single product's prices and its market-specific prices
+    
+    product may be a product node already fetched by iter_product_pages, or a
+    product ID to fetch. Bulk callers pass price_lists and market_price_index
+    so no further requests are made.
+    """
+    if isinstance(product, str):
+        product_id = product
+        product = fetch_product(product_id)
+        if not product:
+            logging.error(f"Failed to fetch product {product_id}. Skipping.")
+            return None
+    
+    product_id = product["id"]
+    logging.info(f"Backing up prices for product: {product['title']} (ID: {product_id})")
+    
+    variant_ids = [edge["node"]["id"] for edge in product["variants"]["edges"]]
+    
+    if price_lists is None:
+        price_lists = fetch_price_lists()
+        if price_lists is None:
+            return None
+    if market_price_index is None:
+        market_price_index = build_market_price_index(price_lists, variant_ids)
+        if market_price_index is None:
+            return None
+    
+    # Join the indexed market prices back onto this product's variants
+    market_prices = {}
+    for price_list in price_lists:
+        price_list_id = price_list["id"]
+        prices = [
+            market_price_index[variant_id][price_list_id]
+            for variant_id in variant_ids
+            if price_list_id in market_price_index.get(variant_id, {})
+        ]
+        
+        # Only store price lists with prices for this product
+        if prices:
+            market_prices[price_list_id] = {
+                "prices": prices,
+                "currency": price_list["currency"],
+                "name": price_list["name"]
+            }
+    
+    # Create backup data structure
+    backup_data = {
+        "metadata": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "shop": SHOP_NAME,
+            "product_id": product_id,
+            "product_title": product.get("title", "Unknown")
+        },
+        "product": product,
+        "market_prices": market_prices
+    }
+    
+    return backup_data
+
+def backup_products(products, backup_name=None, scope=None, snapshot_at=None):
+    """Backup multiple products
+    
+    products may hold product nodes and product IDs; IDs are fetched in
+    batches with fetch_products. The products are backed up a page at a time
+    with backup_product_pages. snapshot_at is when fetching the products
+    started, in UTC.
+    """
+    product_ids = [product for product in products if isinstance(product, str)]
+    if product_ids:
+        fetched = fetch_products(product_ids)
+        if fetched is None:
+            logging.error("Backup aborted: products could not be fetched")
+            return None
+        for product_id in product_ids:
+            if fetched.get(product_id) is None:
+                logging.warning(f"Product {product_id} not found. Skipping.")
+        products = [fetched.get(product) if isinstance(product, str) else product for product in products]
+        products = [product for product in products if product]
+    
+    logging.info(f"Starting backup of {len(products)} products...")
+    pages = (products[i:i + PRODUCT_PAGE_SIZE] for i in range(0, len(products), PRODUCT_PAGE_SIZE))
+    return backup_product_pages(pages, backup_name, scope, snapshot_at)
+
+def write_backup_page(writer, products, lookup):
+    """Join market prices from a MarketPriceLookup onto one page of products and write them
+    
+    Returns [(product_id, backup_data)] for the page. Raises ShopifyAPIError
+    if the page's market prices could not be fetched.
+    """
+    market_price_index = lookup.page_index(products)
+    if market_price_index is None:
+        raise ShopifyAPIError("market prices could not be fetched")
+    
+    page = []
+    for product in products:
+        backup_data = backup_product(product, lookup.price_lists, market_price_index)
+        writer.write_product(product["id"], backup_data)
+        page.append((product["id"], backup_data))
+    return page
+
+def backup_product_pages(pages, backup_name=None, scope=None, snapshot_at=None, keep_fetching=None):
+    """Stream pages of product nodes into a new backup; returns the backup path or None
+    
+    Each page's market prices are joined on and its products written before
+    the next page is used, so memory doesn't grow with the catalog.
+    keep_fetching is called with the running product count after each page;
+    when it returns False the backup stops there and is scoped as a partial
+    catalog. If a page or its prices can't be fetched, the unfinished
+    backup is removed.
+    """
+    if not backup_name:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_name = f"bulk_backup_{timestamp}"
+    backup_path = os.path.join(BACKUP_DIR, f"{backup_name}{BACKUP_EXTENSION}")
+    
+    price_lists = fetch_price_lists()
+    if price_lists is None:
+        logging.error("Backup aborted: price lists could not be fetched")
+        return None
+    lookup = MarketPriceLookup.fetch(price_lists)
+    if lookup is None:
+        logging.error("Backup aborted: market prices could not be fetched")
+        return None
+    
+    try:
+        with BackupWriter(backup_path, backup_name, scope=scope, snapshot_at=snapshot_at, price_lists=price_lists) as writer:
+            for products in pages:
+                write_backup_page(writer, products, lookup)
+                logging.info(f"Backed up {len(products)} products (total: {writer.product_count})")
+                
+                if keep_fetching and not keep_fetching(writer.product_count):
+                    # A partial backup can't be the base of an incremental backup
+                    writer.scope = "partial catalog"
+                    break
+    except ShopifyAPIError as e:
+        logging.error(f"Backup aborted to avoid an incomplete backup: {e}")
+        os.remove(backup_path)
+        return None
+    
+    logging.info(f"Backup completed: {writer.product_count} products backed up")
+    backup_path = finish_backup(backup_path)
+    client.log_summary("backup")
+    return backup_path
+
+def write_backup(products, price_lists, market_price_index, backup_name=None, scope=None, snapshot_at=None):
+    """Join market prices onto product nodes and stream each product to a new backup file"""
+    if not backup_name:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_name = f"bulk_backup_{timestamp}"
+    
+    backup_path = os.path.join(BACKUP_DIR, f"{backup_name}{BACKUP_EXTENSION}")
+    
+    success_count = 0
+    error_count = 0
+    
+    with BackupWriter(backup_path, backup_name, scope=scope, snapshot_at=snapshot_at, price_lists=price_lists) as writer:
+        for i, product in enumerate(tqdm(products, desc="Backing up products")):
+            product_id = product["id"]
+            try:
+                logging.info(f"[{i+1}/{len(products)}] Backing up: {product['title']} (ID: {product_id})")
+                backup_data = backup_product(product, price_lists, market_price_index)
+                
+                if backup_data:
+                    writer.write_product(product_id, backup_data)
+                    success_count += 1
+                else:
+                    logging.warning(f"No backup data returned for {product['title']} (ID: {product_id})")
+                    error_count += 1
+            
+            except Exception as e:
+                logging.error(f"Error backing up product {product_id}: {e}")
+                error_count += 1
+    
+    logging.info(f"Backup completed: {success_count} products backed up successfully, {error_count} errors")
+    
+    return finish_backup(backup_path)
+
+def finish_backup(backup_path):
+    """Convert a completed backup to the compact format if enabled, index it and return its final path"""
+    # The backup is streamed as JSON Lines so an interruption loses nothing,
+    # and only converted once it is complete
+    if COMPACT_BACKUPS:
+        compact_path = convert_backup(backup_path)
+        if compact_path:
+            os.remove(backup_path)
+            backup_path = compact_path
+    else:
+        index_backup(backup_path)
+    
+    if SNAPSHOT_STORE:
+        ingest_backup(backup_path)
+    
+    logging.info(f"Backup saved to: {backup_path}")
+    
+    return backup_path
+
+# Seconds between status checks of a running bulk operation
+BULK_POLL_INTERVAL = 5
+
+BULK_PRODUCTS_QUERY = """
+{
+    products {
+        edges {
+            node {
+                id
+                title
+                handle
+                tags
+                variants {
+                    edges {
+                        node {
+                            id
+                            title
+                            sku
+                            price
+                            compareAtPrice
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+BULK_PRICE_LISTS_QUERY = """
+{
+    priceLists {
+        edges {
+            node {
+                id
+                name
+                currency
+                fixedPricesCount
+                prices {
+                    edges {
+                        node {
+                            price {
+                                amount
+                                currencyCode
+                            }
+                            compareAtPrice {
+                                amount
+                                currencyCode
+                            }
+                            variant {
+                                id
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+def start_bulk_query(bulk_query):
+    """Submit a bulkOperationRunQuery and return the bulk operation ID"""
+    mutation = """
+    mutation bulkOperationRunQuery($query: String!) {
+        bulkOperationRunQuery(query: $query) {
+            bulkOperation {
+                id
+                status
+            }
+            userErrors {
+                field
+                message
+            }
+        }
+    }
+    """
+    
+    try:
+        data = client.execute(mutation, {"query": bulk_query})
+    except ShopifyAPIError as e:
+        logging.error(f"Error starting bulk operation: {e}")
+        return None
+    
+    user_errors = data["bulkOperationRunQuery"]["userErrors"]
+    if user_errors:
+        logging.error(f"User errors starting bulk operation: {user_errors}")
+        return None
+    
+    return data["bulkOperationRunQuery"]["bulkOperation"]["id"]
+
+def wait_for_bulk_operation(operation_id, poll_interval=None):
+    """Poll a bulk operation until it finishes
+    
+    Returns the finished BulkOperation whatever its status, or None if it
+    could not be polled. A FAILED or CANCELED operation may have done part
+    of its work; its partialDataUrl holds the results it got to.
+    """
+    query = """
+    query GetBulkOperation($id: ID!) {
+        node(id: $id) {
+            ... on BulkOperation {
+                id
+                status
+                errorCode
+                objectCount
+                url
+                partialDataUrl
+            }
+        }
+    }
+    """
+    
+    poll_interval = poll_interval or BULK_POLL_INTERVAL
+    while True:
+        try:
+            data = client.execute(query, {"id": operation_id})
+        except ShopifyAPIError as e:
+            logging.error(f"Error checking bulk operation {operation_id}: {e}")
+            return None
+        
+        operation = data["node"]
+        status = operation["status"]
+        if status == "COMPLETED":
+            logging.info(f"Bulk operation {operation_id} completed with {operation['objectCount']} objects")
+            return operation
+        if status not in ("CREATED", "RUNNING"):
+            logging.error(f"Bulk operation {operation_id} ended with status {status} (error: {operation.get('errorCode')})")
+            return operation
+        
+        logging.info(f"Bulk operation {operation_id} {status.lower()}: {operation['objectCount']} objects so far")
+        time.sleep(poll_interval)
+
+def iter_bulk_results(url):
+    """Stream the JSONL result file of a finished bulk operation
+    
+    The file is fetched from a signed URL, so it is requested without the
+    Admin API session and its access token.
+    """
+    if not url:
+        # Bulk operations that matched no objects have no result file
+        return
+    
+    with requests.get(url, stream=True, timeout=client.timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+def run_bulk_query(bulk_query):
+    """Run a bulk query to completion and stream its result objects, or return None on failure"""
+    operation_id = start_bulk_query(bulk_query)
+    if not operation_id:
+        return None
+    
+    operation = wait_for_bulk_operation(operation_id)
+    if not operation or operation["status"] != "COMPLETED":
+        return None
+    
+    return iter_bulk_results(operation["url"])
+
+def fetch_products_bulk():
+    """Fetch every product and its variants with a bulk operation
+    
+    Returns product nodes in the same shape as iter_product_pages, or None.
+    """
+    results = run_bulk_query(BULK_PRODUCTS_QUERY)
+    if results is None:
+        return None
+    
+    products = {}
+    try:
+        for record in results:
+            parent_id = record.pop("__parentId", None)
+            if parent_id is None:
+                record["variants"] = {"edges": []}
+                products[record["id"]] = record
+            else:
+                products[parent_id]["variants"]["edges"].append({"node": record})
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"Error downloading bulk product export: {e}")
+        return None
+    
+    logging.info(f"Fetched {len(products)} products with the Bulk Operations API")
+    return list(products.values())
+
+def fetch_market_prices_bulk():
+    """Fetch every price list and its prices with a bulk operation
+    
+    Returns (price_lists, market_price_index) in the same shape as
+    fetch_price_lists and build_market_price_index, or (None, None).
+    """
+    results = run_bulk_query(BULK_PRICE_LISTS_QUERY)
+    if results is None:
+        return None, None
+    
+    price_lists = []
+    index = {}
+    try:
+        for record in results:
+            parent_id = record.pop("__parentId", None)
+            if parent_id is None:
+                price_lists.append(record)
+            else:
+                variant_id = record["variant"]["id"]
+                index.setdefault(variant_id, {})[parent_id] = {
+                    "variant_id": variant_id,
+                    "price": record["price"],
+                    "compare_at_price": record.get("compareAtPrice")
+                }
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"Error downloading bulk price list export: {e}")
+        return None, None
+    
+    logging.info(f"Fetched {len(price_lists)} price lists with the Bulk Operations API")
+    return price_lists, index
+
+def backup_all_products_bulk(backup_name=None):
+    """Backup the whole catalog using the Bulk Operations API
+    
+    Shopify runs one bulk query per shop at a time, so products and price
+    lists are exported one after the other and joined locally into the same
+    backup format that backup_products writes.
+    """
+    logging.info("Starting full catalog backup with the Bulk Operations API...")
+    client.reset_stats()
+    snapshot_at = utc_timestamp()
+    
+    products = fetch_products_bulk()
+    if products is None:
+        logging.error("Backup aborted: product export failed")
+        return None
+    
+    price_lists, market_price_index = fetch_market_prices_bulk()
+    if price_lists is None:
+        logging.error("Backup aborted: price list export failed")
+        return None
+    
+    backup_path = write_backup(products, price_lists, market_price_index, backup_name, "all products", snapshot_at)
+    client.log_summary("bulk_backup")
+    return backup_path
+
+# Incremental backups look back this far before the base snapshot, to allow
+# for clock differences between this machine and Shopify
+INCREMENTAL_OVERLAP_SECONDS = 300
+
+def merge_market_prices(product_data, price_lists, swept_ids, market_price_index):
+    """Market prices for a product carried over from a base backup
+    
+    Prices in price lists that were swept again come from market_price_index;
+    the rest are kept from the base backup. Price lists that no longer exist
+    are dropped.
+    """
+    variant_ids = [edge["node"]["id"] for edge in product_data["product"]["variants"]["edges"]]
+    base_prices = product_data.get("market_prices", {})
+    
+    market_prices = {}
+    for price_list in price_lists:
+        price_list_id = price_list["id"]
+        if price_list_id in swept_ids:
+            prices = [
+                market_price_index[variant_id][price_list_id]
+                for variant_id in variant_ids
+                if price_list_id in market_price_index.get(variant_id, {})
+            ]
+        else:
+            prices = base_prices.get(price_list_id, {}).get("prices", [])
+        
+        if prices:
+            market_prices[price_list_id] = {
+                "prices": prices,
+                "currency": price_list["currency"],
+                "name": price_list["name"]
+            }
+    
+    return market_prices
+
+def backup_all_products_incremental(backup_name=None, sweep_all_price_lists=True):
+    """Backup the whole catalog by refreshing only what changed since the last full backup
+    
+    The newest complete full catalog backup is the base snapshot. Products
+    updated since it was taken are fetched again, every price list is swept
+    again, and the remaining products are carried over from the base. The
+    result is a complete point-in-time backup that later incremental backups
+    can build on.
+    
+    Editing a fixed price doesn't change anything Shopify reports about its
+    price list, so with sweep_all_price_lists=False price lists whose name,
+    currency and number of fixed prices are unchanged are carried over too.
+    That is faster but can keep stale market prices; it is opt-in.
+    """
+    base_file = find_base_backup()
+    if not base_file:
+        logging.error("No complete full catalog backup to build on. Create a full backup first.")
+        return None
+    
+    base_header, _ = read_backup_info(base_file)
+    snapshot_at = utc_timestamp()
+    base_snapshot = datetime.datetime.strptime(base_header["snapshot_at"], "%Y-%m-%dT%H:%M:%SZ")
+    since = utc_timestamp(base_snapshot - datetime.timedelta(seconds=INCREMENTAL_OVERLAP_SECONDS))
+    logging.info(f"Starting incremental backup on top of {base_file} (taken {base_header['snapshot_at']})")
+    client.reset_stats()
+    
+    # 1. Every product that still exists, so deleted products can be dropped
+    product_ids = fetch_product_ids()
+    if product_ids is None:
+        logging.error("Backup aborted: product IDs could not be fetched")
+        return None
+    current_ids = set(product_ids)
+    
+    # 2. Products created or updated since the base snapshot
+    changed_products = []
+    try:
+        for products in iter_product_pages(query_string=f"updated_at:>'{since}'"):
+            changed_products.extend(products)
+    except ShopifyAPIError as e:
+        logging.error(f"Backup aborted: changed products could not be fetched: {e}")
+        return None
+    changed_ids = {product["id"] for product in changed_products}
+    logging.info(f"{len(changed_products)} products changed since {since}")
+    
+    # 3. Sweep price lists that changed in full, and look up the changed
+    # products' prices in the rest
+    price_lists = fetch_price_lists()
+    if price_lists is None:
+        logging.error("Backup aborted: price lists could not be fetched")
+        return None
+    
+    base_price_lists = {price_list["id"]: price_list for price_list in base_header.get("price_lists") or []}
+    swept_lists = [
+        price_list for price_list in price_lists
+        if sweep_all_price_lists or base_price_lists.get(price_list["id"]) != price_list_fingerprint(price_list)
+    ]
+    kept_lists = [price_list for price_list in price_lists if price_list not in swept_lists]
+    swept_ids = {price_list["id"] for price_list in swept_lists}
+    if kept_lists:
+        logging.warning(f"Keeping market prices of {len(kept_lists)} price lists from the base backup; "
+                        f"fixed prices edited since then are not picked up")
+    logging.info(f"Sweeping {len(swept_lists)} price lists, keeping {len(kept_lists)} from the base backup")
+    
+    market_price_index = build_market_price_index(swept_lists) if swept_lists else {}
+    if market_price_index is None:
+        logging.error("Backup aborted: market prices could not be fetched")
+        return None
+    
+    changed_variant_ids = [
+        variant_edge["node"]["id"]
+        for product in changed_products
+        for variant_edge in product["variants"]["edges"]
+    ]
+    if kept_lists and changed_variant_ids:
+        changed_index = build_market_price_index(kept_lists, changed_variant_ids)
+        if changed_index is None:
+            logging.error("Backup aborted: market prices could not be fetched")
+            return None
+        for variant_id, prices in changed_index.items():
+            market_price_index.setdefault(variant_id, {}).update(prices)
+    
+    # 4. Merge into a new full backup: unchanged products from the base, then
+    # the changed ones as fetched
+    if not backup_name:
+        backup_name = f"incremental_backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    backup_path = os.path.join(BACKUP_DIR, f"{backup_name}{BACKUP_EXTENSION}")
+    
+    carried_over = 0
+    deleted = 0
+    with BackupWriter(backup_path, backup_name, scope="all products", snapshot_at=snapshot_at,
+                      price_lists=price_lists, base=os.path.basename(base_file)) as writer:
+        for product_id, product_data in iter_backup(base_file):
+            if product_id not in current_ids:
+                deleted += 1
+                continue
+            if product_id in changed_ids:
+                continue
+            product_data["market_prices"] = merge_market_prices(product_data, price_lists, swept_ids, market_price_index)
+            writer.write_product(product_id, product_data)
+            carried_over += 1
+        
+        for product in tqdm(changed_products, desc="Backing up changed products"):
+            writer.write_product(product["id"], backup_product(product, price_lists, market_price_index))
+    
+    logging.info(f"Incremental backup completed: {len(changed_products)} products refreshed, "
+                 f"{carried_over} carried over, {deleted} deleted products dropped")
+    backup_path = finish_backup(backup_path)
+    client.log_summary("incremental_backup")
+    return backup_path
+
+PRODUCT_VARIANTS_BULK_UPDATE_MUTATION = """
+mutation productVariantsBulkUpdate($productId: ID!, $variants: [ProductVariantsBulkInput!]!) {
+    productVariantsBulkUpdate(productId: $productId, variants: $variants) {
+        product {
+            id
+            title
+        }
+        productVariants {
+            id
+            title
+            price
+        }
+        userErrors {
+            field
+            message
+        }
+    }
+}
+"""
+
+def update_product_variants_prices(product_id, variants_data, mock=None):
+    """Update prices for a product's variants"""
+    if mock is None:
+        mock = MOCK_MODE
+    if not variants_data:
+        return False
+    
+    # When in mock mode, just simulate success and print the data
+    if mock:
+        logging.info(f"MOCK: Would update prices for product {product_id}")
+        logging.info(f"MOCK: Data: {variants_data[:3]}... (and {len(variants_data) - 3} more variants)")
+        return True
+    
+    mutation = PRODUCT_VARIANTS_BULK_UPDATE_MUTATION
+    
+    variables = {
+        "productId": product_id,
+        "variants": variants_data
+    }
+    
+    try:
+        data = client.execute(mutation, variables)
+    except ShopifyAPIError as e:
+        logging.error(f"Error updating variants: {e}")
+        return False
+    
+    user_errors = data["productVariantsBulkUpdate"]["userErrors"]
+    if user_errors:
+        logging.error(f"User errors updating variants: {user_errors}")
+        return False
+    
+    return True
+
+async def update_product_variants_prices_async(product_id, variants_data, mock=None):
+    """Coroutine version of update_product_variants_prices for the asyncio engine"""
+    if mock is None:
+        mock = MOCK_MODE
+    if not variants_data:
+        return False
+    
+    if mock:
+        logging.info(f"MOCK: Would update prices for product {product_id}")
+        logging.info(f"MOCK: Data: {variants_data[:3]}... (and {len(variants_data) - 3} more variants)")
+        return True
+    
+    variables = {
+        "productId": product_id,
+        "variants": variants_data
+    }
+    
+    try:
+        data = await engine.client.execute(PRODUCT_VARIANTS_BULK_UPDATE_MUTATION, variables)
+    except ShopifyAPIError as e:
+        logging.error(f"Error updating variants: {e}")
+        return False
+    
+    user_errors = data["productVariantsBulkUpdate"]["userErrors"]
+    if user_errors:
+        logging.error(f"User errors updating variants: {user_errors}")
+        return False
+    
+    return True
+
+PRICE_LIST_FIXED_PRICES_ADD_MUTATION = """
+mutation priceListFixedPricesAdd($priceListId: ID!, $prices: [PriceListPriceInput!]!) {
+    priceListFixedPricesAdd(priceListId: $priceListId, prices: $prices) {
+        prices {
+            price {
+                amount
+                currencyCode
+            }
+        }
+        userErrors {
+            field
+            message
+        }
+    }
+}
+"""
+
+# Largest number of prices sent in one priceListFixedPricesAdd
+PRICE_LIST_CHUNK_SIZE = 250
+
+def price_list_prices_input(price_list_id, variant_prices):
+    """Variables for a priceListFixedPricesAdd of variant_prices"""
+    # Convert variant prices to the format expected by the API
+    api_prices = []
+    for price_data in variant_prices:
+        variant_id = price_data["variant_id"]
+        price = price_data["price"]
+        
+        api_price = {
+            "variantId": variant_id,
+            "price": price
+        }
+        
+        # Add compareAtPrice if it exists
+        if price_data.get("compare_at_price"):
+            api_price["compareAtPrice"] = price_data["compare_at_price"]
+        
+        api_prices.append(api_price)
+    
+    return {
+        "priceListId": price_list_id,
+        "prices": api_prices
+    }
+
+def send_price_list_prices(price_list_id, variant_prices):
+    """Send one priceListFixedPricesAdd and return its userErrors
+    
+    Raises ShopifyAPIError if the request itself fails.
+    """
+    data = client.execute(PRICE_LIST_FIXED_PRICES_ADD_MUTATION, price_list_prices_input(price_list_id, variant_prices))
+    return data["priceListFixedPricesAdd"]["userErrors"]
+
+async def send_price_list_prices_async(price_list_id, variant_prices):
+    """Coroutine version of send_price_list_prices for the asyncio engine"""
+    data = await engine.client.execute(PRICE_LIST_FIXED_PRICES_ADD_MUTATION, price_list_prices_input(price_list_id, variant_prices))
+    return data["priceListFixedPricesAdd"]["userErrors"]
+
+def update_price_list_prices(price_list_id, variant_prices, mock=None):
+    """Update market-specific prices for variants"""
+    if mock is None:
+        mock = MOCK_MODE
+    if not variant_prices:
+        return True
+    
+    # When in mock mode, just simulate success and print the data
+    if mock:
+        logging.info(f"MOCK: Would update market prices for price list {price_list_id}")
+        logging.info(f"MOCK: Data: {variant_prices[:3]}... (and {len(variant_prices) - 3} more variants)")
+        return True
+    
+    try:
+        user_errors = send_price_list_prices(price_list_id, variant_prices)
+    except ShopifyAPIError as e:
+        logging.error(f"Error updating price list: {e}")
+        return False
+    
+    if user_errors:
+        logging.error(f"User errors updating price list: {user_errors}")
+        return False
+    
+    return True
+
+def failed_price_indexes(user_errors):
+    """Indexes into the prices input named by userErrors, or None if an error can't be tied to a row"""
+    indexes = set()
+    for user_error in user_errors:
+        field = user_error.get("field") or []
+        if len(field) < 2 or field[0] != "prices" or not str(field[1]).isdigit():
+            return None
+        indexes.add(int(field[1]))
+    return indexes
+
+class PriceListBatcher:
+    """Collect market price updates across products and send them per price list in large chunks
+    
+    Rows from many products are buffered per price list and sent as soon as a
+    list has PRICE_LIST_CHUNK_SIZE of them, so each priceListFixedPricesAdd
+    carries up to that many prices instead of one product's worth. Failures
+    reported for a chunk are mapped back to the products whose rows failed,
+    and each (product, price list) is recorded in the journal once all of its
+    rows went through.
+    """
+    
+    def __init__(self, journal=None, action="update", chunk_size=None):
+        self.journal = journal
+        self.action = action
+        self.chunk_size = chunk_size or PRICE_LIST_CHUNK_SIZE
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.price_list_names = {}
+        self.pending_rows = {}
+        self.pending_lists = {}
+        self.titles = {}
+        self.failed_products = set()
+        self.sent_count = 0
+        self.chunk_count = 0
+    
+    def add_product(self, product_id, product_title, market_updates):
+        """Queue a product's market price updates, sending any chunks that fill up"""
+        for price_list_id, rows in self._queue_product(product_id, product_title, market_updates):
+            self._send_chunk(price_list_id, rows)
+    
+    async def add_product_async(self, product_id, product_title, market_updates):
+        """Coroutine version of add_product for the asyncio engine"""
+        for price_list_id, rows in self._queue_product(product_id, product_title, market_updates):
+            await self._send_chunk_async(price_list_id, rows)
+    
+    def _queue_product(self, product_id, product_title, market_updates):
+        """Buffer a product's market price rows and return the chunks that filled up"""
+        chunks = []
+        with self.lock:
+            price_list_ids = set()
+            for price_list_id, market_update in market_updates.items():
+                if self.journal and self.journal.is_done(product_id, price_list_id):
+                    continue
+                if not market_update["prices"]:
+                    if self.journal:
+                        self.journal.record(product_id, price_list_id)
+                    continue
+                
+                price_list_ids.add(price_list_id)
+                self.price_list_names[price_list_id] = market_update["name"]
+                self.pending_rows[(product_id, price_list_id)] = len(market_update["prices"])
+                
+                buffer = self.buffers.setdefault(price_list_id, [])
+                buffer.extend((product_id, row) for row in market_update["prices"])
+                while len(buffer) >= self.chunk_size:
+                    chunks.append((price_list_id, buffer[:self.chunk_size]))
+                    del buffer[:self.chunk_size]
+            
+            if price_list_ids:
+                self.pending_lists[product_id] = price_list_ids
+                self.titles[product_id] = product_title
+            elif self.journal:
+                self.journal.record(product_id)
+        return chunks
+    
+    def flush(self, workers=None):
+        """Send every partially filled chunk, one worker per chunk"""
+        with self.lock:
+            chunks = [(price_list_id, rows) for price_list_id, rows in self.buffers.items() if rows]
+            self.buffers = {}
+        
+        async def send_chunk_async(chunk):
+            await self._send_chunk_async(*chunk)
+        
+        for _ in run_in_workers(lambda chunk: self._send_chunk(*chunk), chunks, "Sending market prices", workers=workers,
+                                async_func=send_chunk_async):
+            pass
+    
+    def _send_chunk(self, price_list_id, rows):
+        self._record_chunk(price_list_id, rows, self._send_rows(price_list_id, rows))
+    
+    async def _send_chunk_async(self, price_list_id, rows):
+        self._record_chunk(price_list_id, rows, await self._send_rows_async(price_list_id, rows))
+    
+    def _record_chunk(self, price_list_id, rows, failed):
+        """Mark a sent chunk's rows done and journal the products and price lists that are complete"""
+        with self.lock:
+            self.sent_count += len(rows)
+            self.chunk_count += 1
+            for index, (product_id, _) in enumerate(rows):
+                key = (product_id, price_list_id)
+                if index in failed:
+                    self.failed_products.add(product_id)
+                self.pending_rows[key] -= 1
+                if self.pending_rows[key]:
+                    continue
+                
+                # Every row of this product in this price list has been sent
+                del self.pending_rows[key]
+                pending = self.pending_lists[product_id]
+                pending.discard(price_list_id)
+                if self.journal and product_id not in self.failed_products:
+                    self.journal.record(product_id, price_list_id)
+                if not pending:
+                    del self.pending_lists[product_id]
+                    del self.titles[product_id]
+                    if self.journal and product_id not in self.failed_products:
+                        self.journal.record(product_id)
+    
+    def _send_rows(self, price_list_id, rows):
+        """Send one chunk and return the indexes of the rows that failed"""
+        prices = [row for _, row in rows]
+        if MOCK_MODE:
+            logging.info(f"MOCK: Would update {len(prices)} market prices in price list {self.price_list_names[price_list_id]}")
+            return set()
+        
+        try:
+            user_errors = send_price_list_prices(price_list_id, prices)
+        except ShopifyAPIError as e:
+            user_errors = e
+        failed, remaining = self._check_chunk(price_list_id, rows, user_errors)
+        
+        # The rest of the chunk may not have been applied, so send it again
+        # without the rows that failed
+        if remaining:
+            try:
+                retry_errors = send_price_list_prices(price_list_id, [prices[index] for index in remaining])
+            except ShopifyAPIError as e:
+                retry_errors = [{"message": str(e)}]
+            self._check_retry(price_list_id, failed, remaining, retry_errors)
+        return failed
+    
+    async def _send_rows_async(self, price_list_id, rows):
+        """Coroutine version of _send_rows for the asyncio engine"""
+        prices = [row for _, row in rows]
+        if MOCK_MODE:
+            logging.info(f"MOCK: Would update {len(prices)} market prices in price list {self.price_list_names[price_list_id]}")
+            return set()
+        
+        try:
+            user_errors = await send_price_list_prices_async(price_list_id, prices)
+        except ShopifyAPIError as e:
+            user_errors = e
+        failed, remaining = self._check_chunk(price_list_id, rows, user_errors)
+        
+        if remaining:
+            try:
+                retry_errors = await send_price_list_prices_async(price_list_id, [prices[index] for index in remaining])
+            except ShopifyAPIError as e:
+                retry_errors = [{"message": str(e)}]
+            self._check_retry(price_list_id, failed, remaining, retry_errors)
+        return failed
+    
+    def _check_chunk(self, price_list_id, rows, user_errors):
+        """Log the outcome of a sent chunk and return (failed indexes, indexes to send again)
+        
+        user_errors is the mutation's userErrors, or the ShopifyAPIError if the
+        request itself failed.
+        """
+        price_list_name = self.price_list_names[price_list_id]
+        if isinstance(user_errors, ShopifyAPIError):
+            logging.error(f"Failed to {self.action} {len(rows)} market prices in {price_list_name}: {user_errors}")
+            return set(range(len(rows))), []
+        
+        if not user_errors:
+            logging.info(f"Sent {len(rows)} market prices to {price_list_name}")
+            return set(), []
+        
+        failed = failed_price_indexes(user_errors)
+        if failed is None:
+            logging.error(f"Failed to {self.action} {len(rows)} market prices in {price_list_name}: {user_errors}")
+            return set(range(len(rows))), []
+        
+        for user_error in user_errors:
+            product_id = rows[int(user_error["field"][1])][0]
+            logging.error(f"Failed to {self.action} market price in {price_list_name} for {self.titles.get(product_id, product_id)}: {user_error['message']}")
+        
+        return failed, [index for index in range(len(rows)) if index not in failed]
+    
+    def _check_retry(self, price_list_id, failed, remaining, retry_errors):
+        """Add the resent rows to failed if sending them again didn't work"""
+        if retry_errors:
+            logging.error(f"Failed to {self.action} {len(remaining)} market prices in {self.price_list_names[price_list_id]}: {retry_errors}")
+            failed.update(remaining)
+
+class CheckpointJournal:
+    """Append-only record of the work a discount or restore has completed
+    
+    The journal lives next to the operation's log in LOG_DIR. Its header
+    records the operation, backup file and parameters; every product's
+    variant update and price list update is appended as it succeeds, followed
+    by a product record once all of them have. A resumed run skips whatever
+    the journal already holds.
+    """
+    
+    JOURNAL_SUFFIX = ".journal.jsonl"
+    
+    def __init__(self, path, header, completed=None):
+        self.path = path
+        self.header = header
+        self.completed = completed or set()
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+    
+    @classmethod
+    def create(cls, operation, backup_file, params):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        ensure_directories()
+        path = os.path.join(LOG_DIR, f"{operation}_{timestamp}{cls.JOURNAL_SUFFIX}")
+        header = {
+            "type": "header",
+            "operation": operation,
+            "backup_file": backup_file,
+            "params": params,
+            "created": datetime.datetime.now().isoformat()
+        }
+        journal = cls(path, header)
+        journal._write(header)
+        return journal
+    
+    @classmethod
+    def load(cls, path):
+        header, completed, _ = cls.read(path)
+        return cls(path, header, completed)
+    
+    @staticmethod
+    def read(path):
+        """Return (header, completed, is_complete) for a journal file"""
+        header = None
+        completed = set()
+        is_complete = False
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may have been cut off by the interruption
+                    continue
+                if record["type"] == "header":
+                    header = record
+                elif record["type"] == "done":
+                    completed.add((record["product_id"], record.get("target")))
+                elif record["type"] == "complete":
+                    is_complete = True
+        if header is None:
+            raise ValueError(f"{path} is not a checkpoint journal")
+        return header, completed, is_complete
+    
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+    
+    def is_done(self, product_id, target=None):
+        """Whether a product's target ("variants" or a price list ID) or, with no target, the whole product is done"""
+        return (product_id, target) in self.completed
+    
+    def record(self, product_id, target=None):
+        with self.lock:
+            self.completed.add((product_id, target))
+            self._write({"type": "done", "product_id": product_id, "target": target})
+    
+    def completed_product_count(self):
+        return sum(1 for _, target in self.completed if target is None)
+    
+    def close(self, complete=False):
+        """Close the journal, marking it complete if nothing is left to resume"""
+        with self.lock:
+            if complete:
+                self._write({"type": "complete", "finished": datetime.datetime.now().isoformat()})
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+def open_checkpoint_journal(operation, backup_file, params, resume_journal=None):
+    """Create a journal for a new run or reopen one to resume; None in mock mode"""
+    if resume_journal:
+        journal = CheckpointJournal.load(resume_journal)
+        logging.info(f"Resuming from checkpoint journal: {resume_journal} ({journal.completed_product_count()} products already done)")
+        return journal
+    if MOCK_MODE:
+        return None
+    journal = CheckpointJournal.create(operation, backup_file, params)
+    logging.info(f"Checkpoint journal: {journal.path} (resume with --resume {journal.path})")
+    return journal
+
+def list_incomplete_journals():
+    """Journals in LOG_DIR whose operation did not finish, newest first"""
+    journals = []
+    for file in sorted(os.listdir(LOG_DIR) if os.path.isdir(LOG_DIR) else [], reverse=True):
+        if not file.endswith(CheckpointJournal.JOURNAL_SUFFIX):
+            continue
+        path = os.path.join(LOG_DIR, file)
+        try:
+            header, completed, is_complete = CheckpointJournal.read(path)
+        except (OSError, ValueError, KeyError):
+            continue
+        if not is_complete:
+            journals.append((path, header))
+    return journals
+
+def resume_operation(journal_path, workers=None):
+    """Resume an interrupted discount or restore from its checkpoint journal"""
+    header, _, is_complete = CheckpointJournal.read(journal_path)
+    if MOCK_MODE:
+        raise ValueError("Resuming is not available in mock mode")
+    if is_complete:
+        logging.info(f"Operation in {journal_path} already completed; nothing to resume")
+        return 0, 0
+    
+    operation = header["operation"]
+    params = header.get("params", {})
+    if operation == "apply_discount":
+        return apply_bulk_discount(header["backup_file"], workers=workers, resume_journal=journal_path, **params)
+    if operation == "restore_prices":
+        return restore_bulk_prices(header["backup_file"], workers=workers, resume_journal=journal_path, **params)
+    raise ValueError(f"Unknown operation in journal: {operation}")
+
+# Discounts are computed in integer cents, so prices are exact and rounded
+# half up instead of inheriting binary float errors
+
+def parse_cents(amount):
+    """Convert a money amount such as "19.99" to integer cents
+    
+    Raises ValueError for a missing amount and for amounts with more than two
+    decimals (e.g. "19.999" in a three-decimal currency), which cents can't
+    hold without rounding.
+    """
+    if amount is None or amount == "":
+        raise ValueError("missing amount")
+    text = str(amount)
+    whole, _, fraction = text.partition(".")
+    if whole.isdigit() and len(fraction) <= 2 and (not fraction or fraction.isdigit()):
+        return int(whole) * 100 + int(fraction.ljust(2, "0"))
+    try:
+        cents = decimal.Decimal(text) * 100
+    except decimal.InvalidOperation:
+        raise ValueError(f"{amount!r} is not a money amount")
+    if not cents.is_finite():
+        raise ValueError(f"{amount!r} is not a money amount")
+    if cents != cents.to_integral_value():
+        raise ValueError(f"{amount} has more than two decimals")
+    return int(cents)
+
+def format_cents(cents):
+    """Format integer cents as a money amount, e.g. 1999 as 19.99"""
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+def discount_factor(discount_percentage):
+    """Exact price multiplier for a discount percentage, as (numerator, denominator)"""
+    numerator, denominator = (100 - decimal.Decimal(str(discount_percentage))).as_integer_ratio()
+    return numerator, denominator * 100
+
+def divide_half_up(value, denominator):
+    """Integer division of value by a positive denominator, rounding halves away from zero"""
+    quotient = (2 * abs(value) + denominator) // (2 * denominator)
+    return quotient if value >= 0 else -quotient
+
+def discount_cents(cents, discount_percentage):
+    """Discount a sequence of cent amounts in one pass and return the results as a list
+    
+    Uses NumPy when it is installed and the intermediate products fit in 64
+    bits, and Python integers otherwise; both round exactly the same way.
+    """
+    numerator, denominator = discount_factor(discount_percentage)
+    
+    if np is not None and len(cents):
+        try:
+            values = np.asarray(cents, dtype=np.int64)
+        except OverflowError:
+            # Amounts past int64 are left to Python integers
+            values = None
+        if values is not None:
+            largest = max(abs(int(values.max())), abs(int(values.min())))
+            if (2 * largest * abs(numerator) + denominator) < 2 ** 62:
+                scaled = values * numerator
+                quotient = (2 * np.abs(scaled) + denominator) // (2 * denominator)
+                return np.where(scaled >= 0, quotient, -quotient).tolist()
+    
+    return [divide_half_up(value * numerator, denominator) for value in cents]
+
+def discount_amount(amount, discount_percentage):
+    """Discount a single money amount, rounding the same way as discount_cents
+    
+    Returns None, with a warning, if the amount is missing or not in cents.
+    """
+    try:
+        cents = parse_cents(amount)
+    except ValueError as e:
+        logging.warning(f"Leaving price {amount!r} unchanged: {e}")
+        return None
+    numerator, denominator = discount_factor(discount_percentage)
+    return format_cents(divide_half_up(cents * numerator, denominator))
+
+class DiscountPlan:
+    """Discounted prices for every variant and market price in a backup
+    
+    All amounts are read into one column of integer cents and discounted
+    together by discount_cents, so building each product's updates while
+    sending is only a lookup. Plans built from pricing rules have no
+    discount_percentage; prices no rule matched are left unchanged.
+    """
+    
+    def __init__(self, discount_percentage, variant_prices, market_prices):
+        self.discount_percentage = discount_percentage
+        self.variant_prices = variant_prices
+        self.market_prices = market_prices
+    
+    @classmethod
+    def build(cls, products, discount_percentage=20):
+        """Compute discounted prices for an iterable of backed up products"""
+        started = time.monotonic()
+        variant_keys = []
+        variant_amounts = []
+        market_keys = []
+        market_amounts = []
+        
+        # Prices that aren't whole cents are kept as None, so they are left unchanged
+        invalid_variants = {}
+        invalid_markets = {}
+        
+        for product_data in products:
+            for variant_edge in product_data["product"]["variants"]["edges"]:
+                variant = variant_edge["node"]
+                try:
+                    variant_amounts.append(parse_cents(variant["price"]))
+                except ValueError:
+                    invalid_variants[variant["id"]] = None
+                    continue
+                variant_keys.append(variant["id"])
+        
+            for price_list_id, price_list_data in product_data.get("market_prices", {}).items():
+                for price_data in price_list_data["prices"]:
+                    amount = price_data["price"].get("amount")
+                    if amount:
+                        key = (price_list_id, price_data["variant_id"])
+                        try:
+                            market_amounts.append(parse_cents(amount))
+                        except ValueError:
+                            invalid_markets[key] = None
+                            continue
+                        market_keys.append(key)
+        
+        discounted = [format_cents(cents) for cents in discount_cents(variant_amounts + market_amounts, discount_percentage)]
+        variant_prices = dict(zip(variant_keys, discounted))
+        market_prices = dict(zip(market_keys, discounted[len(variant_keys):]))
+        if invalid_variants or invalid_markets:
+            logging.warning(f"Leaving {len(invalid_variants) + len(invalid_markets)} prices unchanged that are missing "
+                            f"or have more than two decimals")
+            variant_prices.update(invalid_variants)
+            market_prices.update(invalid_markets)
+        
+        engine = "NumPy" if np is not None else "integer"
+        logging.info(f"Computed {len(variant_prices)} variant and {len(market_prices)} market prices "
+                     f"in {time.monotonic() - started:.2f}s ({engine} engine)")
+        return cls(discount_percentage, variant_prices, market_prices)
+    
+    @classmethod
+    def from_backup(cls, backup_file, discount_percentage=20):
+        return cls.build((product_data for _, product_data in iter_backup(backup_file)), discount_percentage)
+    
+    @classmethod
+    def from_rules(cls, backup_file, rules):
+        """Price every variant and market price in a backup with compiled PricingRules"""
+        started = time.monotonic()
+        variant_prices, market_prices = rules.evaluate(product_data for _, product_data in iter_backup(backup_file))
+        logging.info(f"Priced {len(variant_prices)} variant and {len(market_prices)} market prices with "
+                     f"{len(rules.rules)} rules in {time.monotonic() - started:.2f}s")
+        return cls(None, variant_prices, market_prices)
+    
+    def variant_price(self, variant_id, original_price):
+        """Discounted price of a variant, or None if it should be left unchanged"""
+        if variant_id in self.variant_prices or self.discount_percentage is None:
+            return self.variant_prices.get(variant_id)
+        return discount_amount(original_price, self.discount_percentage)
+    
+    def market_price(self, price_list_id, variant_id, original_price):
+        """Discounted market price of a variant, or None if it should be left unchanged"""
+        key = (price_list_id, variant_id)
+        if key in self.market_prices or self.discount_percentage is None:
+            return self.market_prices.get(key)
+        return discount_amount(original_price, self.discount_percentage)
+
+# Conditions a pricing rule can match on, and the price actions it can take
+RULE_MATCH_KEYS = ("product_id", "handle", "tag", "collection", "sku_prefix", "market")
+RULE_ACTION_KEYS = ("percent_off", "amount_off", "skip")
+
+class PricingRules:
+    """Declarative pricing rules loaded from a JSON rule file
+    
+    Rules are checked in order and the first rule whose conditions all match
+    a price decides it, so tiers are listed from most to least specific. A
+    rule takes percent_off, amount_off (in the price's own currency) or
+    skip, and may override the file-wide floor and charm ending:
+    
+        {
+            "set_compare_at_price": true,
+            "floor": "1.00",
+            "charm": "0.99",
+            "rules": [
+                {"match": {"collection": "gid://shopify/Collection/1"}, "skip": true},
+                {"match": {"tag": "clearance"}, "percent_off": 50, "charm": null},
+                {"match": {"sku_prefix": ["ACC-", "GIFT-"], "market": "EUR"}, "amount_off": "5.00"},
+                {"match": {"market": "base"}, "percent_off": 25},
+                {"percent_off": 20}
+            ]
+        }
+    
+    Match values may be a single value or a list of alternatives. market
+    matches a price list ID, name or currency, or "base" for the variant's
+    own price. Prices no rule matches are left unchanged.
+    """
+    
+    def __init__(self, rules, floor=None, charm=None, set_compare_at_price=True, path=None):
+        self.rules = rules
+        self.floor = floor
+        self.charm = charm
+        self.set_compare_at_price = set_compare_at_price
+        self.path = path
+        self.compiled = False
+    
+    @classmethod
+    def load(cls, path):
+        """Load and validate a rule file, returning None if it is invalid"""
+        try:
+            with open(path, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read rule file {path}: {e}")
+            return None
+        
+        try:
+            rules = [cls._parse_rule(rule, number) for number, rule in enumerate(config.get("rules") or [], 1)]
+            if not rules:
+                raise ValueError("no rules defined")
+            floor = cls._parse_amount(config, "floor", "file") if config.get("floor") is not None else None
+            charm = cls._parse_charm(config.get("charm"), "file")
+        except (ValueError, TypeError) as e:
+            logging.error(f"Invalid rule file {path}: {e}")
+            return None
+        
+        return cls(rules, floor, charm, config.get("set_compare_at_price", True), path)
+    
+    @staticmethod
+    def _parse_amount(config, key, where):
+        """Cents of a money amount in the rule file, naming the key if it isn't a number"""
+        try:
+            return parse_cents(config[key])
+        except ValueError:
+            raise ValueError(f"{where}: {key} must be a money amount in cents, got {config[key]!r}")
+    
+    @classmethod
+    def _parse_charm(cls, charm, where):
+        if charm is None:
+            return None
+        cents = cls._parse_amount({"charm": charm}, "charm", where)
+        if not 0 <= cents <= 99:
+            raise ValueError(f"{where}: charm ending must be between 0.00 and 0.99, got {charm}")
+        return cents
+    
+    @classmethod
+    def _parse_rule(cls, rule, number):
+        match = rule.get("match") or {}
+        unknown = set(match) - set(RULE_MATCH_KEYS)
+        if unknown:
+            raise ValueError(f"rule {number}: unknown match keys {sorted(unknown)}")
+        # 0 == False, so a 0 percent_off has to be told apart from "skip": false by identity
+        actions = [key for key in RULE_ACTION_KEYS if rule.get(key) is not None and rule.get(key) is not False]
+        if len(actions) != 1:
+            raise ValueError(f"rule {number}: needs exactly one of {', '.join(RULE_ACTION_KEYS)}")
+        
+        parsed = {
+            "number": number,
+            "name": rule.get("name") or f"rule {number}",
+            "match": {key: set(value) if isinstance(value, list) else {value} for key, value in match.items()},
+            "action": actions[0]
+        }
+        where = f"rule {number}"
+        if actions[0] == "percent_off":
+            try:
+                parsed["percent_off"] = decimal.Decimal(str(rule["percent_off"]))
+            except decimal.InvalidOperation:
+                raise ValueError(f"{where}: percent_off must be a number, got {rule['percent_off']!r}")
+            if not 0 <= parsed["percent_off"] <= 100:
+                raise ValueError(f"{where}: percent_off must be between 0 and 100, got {rule['percent_off']}")
+        elif actions[0] == "amount_off":
+            parsed["amount_off"] = cls._parse_amount(rule, "amount_off", where)
+            if parsed["amount_off"] <= 0:
+                raise ValueError(f"{where}: amount_off must be greater than 0, got {rule['amount_off']}")
+        if "floor" in rule:
+            parsed["floor"] = cls._parse_amount(rule, "floor", where) if rule["floor"] is not None else None
+        if "charm" in rule:
+            parsed["charm"] = cls._parse_charm(rule["charm"], where)
+        return parsed
+    
+    def compile(self):
+        """Resolve collections to product IDs and index the rules by their conditions
+        
+        Each rule is indexed under one of its conditions; evaluation then only
+        checks the rules indexed under a price's product, tags, market and
+        SKU, plus rules without conditions. Returns False if a collection
+        could not be fetched.
+        """
+        self.by_product = {}
+        self.by_handle = {}
+        self.by_tag = {}
+        self.by_market = {}
+        self.sku_prefixes = []
+        self.unconditional = []
+        
+        for index, rule in enumerate(self.rules):
+            match = rule["match"]
+            if "collection" in match:
+                product_ids = set()
+                for collection_id in match["collection"]:
+                    if str(collection_id).isdigit():
+                        collection_id = f"gid://shopify/Collection/{collection_id}"
+                    collection_product_ids = fetch_collection_product_ids(collection_id)
+                    if collection_product_ids is None:
+                        return False
+                    product_ids.update(collection_product_ids)
+                rule["collection_products"] = product_ids
+            
+            if "product_id" in match:
+                for product_id in match["product_id"]:
+                    self.by_product.setdefault(product_id, []).append(index)
+            elif "collection" in match:
+                for product_id in rule["collection_products"]:
+                    self.by_product.setdefault(product_id, []).append(index)
+            elif "handle" in match:
+                for handle in match["handle"]:
+                    self.by_handle.setdefault(handle, []).append(index)
+            elif "tag" in match:
+                for tag in match["tag"]:
+                    self.by_tag.setdefault(tag, []).append(index)
+            elif "sku_prefix" in match:
+                for prefix in match["sku_prefix"]:
+                    self.sku_prefixes.append((prefix, index))
+            elif "market" in match:
+                for market in match["market"]:
+                    self.by_market.setdefault(market, []).append(index)
+            else:
+                self.unconditional.append(index)
+        
+        self.compiled = True
+        return True
+    
+    def _matches(self, rule, product, tags, sku, market_keys):
+        match = rule["match"]
+        if "product_id" in match and product["id"] not in match["product_id"]:
+            return False
+        if "collection" in match and product["id"] not in rule["collection_products"]:
+            return False
+        if "handle" in match and product.get("handle") not in match["handle"]:
+            return False
+        if "tag" in match and not match["tag"] & tags:
+            return False
+        if "sku_prefix" in match and not any(sku.startswith(prefix) for prefix in match["sku_prefix"]):
+            return False
+        if "market" in match and not match["market"] & market_keys:
+            return False
+        return True
+    
+    def _select(self, product_candidates, product, tags, sku, market_keys):
+        """Index of the first rule matching a price, or None"""
+        candidates = set(product_candidates)
+        for market_key in market_keys:
+            candidates.update(self.by_market.get(market_key, ()))
+        for prefix, index in self.sku_prefixes:
+            if sku.startswith(prefix):
+                candidates.add(index)
+        for index in sorted(candidates):
+            if self._matches(self.rules[index], product, tags, sku, market_keys):
+                return index
+        return None
+    
+    def evaluate(self, products):
+        """Price every variant and market price of the given backed up products
+        
+        Prices are grouped by the rule that matched them and each group is
+        computed in one batch. Returns ({variant_id: price},
+        {(price_list_id, variant_id): price}); unmatched or skipped prices are
+        left out.
+        """
+        if not self.compiled:
+            raise RuntimeError("PricingRules.compile() must be called before evaluate()")
+        
+        # rule index -> ([keys], [original cents])
+        groups = {}
+        invalid = 0
+        
+        for product_data in products:
+            product = product_data["product"]
+            tags = set(product.get("tags") or [])
+            product_candidates = set(self.unconditional)
+            product_candidates.update(self.by_product.get(product["id"], ()))
+            product_candidates.update(self.by_handle.get(product.get("handle"), ()))
+            for tag in tags:
+                product_candidates.update(self.by_tag.get(tag, ()))
+            
+            skus = {}
+            for variant_edge in product["variants"]["edges"]:
+                variant = variant_edge["node"]
+                sku = variant.get("sku") or ""
+                skus[variant["id"]] = sku
+                index = self._select(product_candidates, product, tags, sku, {"base"})
+                if index is not None:
+                    try:
+                        cents = parse_cents(variant["price"])
+                    except ValueError:
+                        invalid += 1
+                        continue
+                    keys, amounts = groups.setdefault(index, ([], []))
+                    keys.append(variant["id"])
+                    amounts.append(cents)
+            
+            for price_list_id, price_list_data in product_data.get("market_prices", {}).items():
+                market_keys = {price_list_id, price_list_data.get("name"), price_list_data.get("currency")}
+                for price_data in price_list_data["prices"]:
+                    amount = price_data["price"].get("amount")
+                    if not amount:
+                        continue
+                    sku = skus.get(price_data["variant_id"], "")
+                    index = self._select(product_candidates, product, tags, sku, market_keys)
+                    if index is not None:
+                        try:
+                            cents = parse_cents(amount)
+                        except ValueError:
+                            invalid += 1
+                            continue
+                        keys, amounts = groups.setdefault(index, ([], []))
+                        keys.append((price_list_id, price_data["variant_id"]))
+                        amounts.append(cents)
+        
+        if invalid:
+            logging.warning(f"Leaving {invalid} prices unchanged that are missing or have more than two decimals")
+        
+        variant_prices = {}
+        market_prices = {}
+        for index, (keys, amounts) in groups.items():
+            rule = self.rules[index]
+            if rule["action"] == "skip":
+                continue
+            if rule["action"] == "percent_off":
+                discounted = discount_cents(amounts, rule["percent_off"])
+            else:
+                discounted = [amount - rule["amount_off"] for amount in amounts]
+            
+            charm = rule.get("charm", self.charm)
+            floor = rule.get("floor", self.floor)
+            rejected = 0
+            for key, original, cents in zip(keys, amounts, discounted):
+                cents = limit_price(cents, original, charm, floor)
+                if cents is None:
+                    rejected += 1
+                    continue
+                price = format_cents(cents)
+                if isinstance(key, tuple):
+                    market_prices[key] = price
+                else:
+                    variant_prices[key] = price
+            if rejected:
+                logging.error(f"{rule['name']}: {rejected} prices would drop to 0.00 or below and were left unchanged; "
+                              f"set a floor or a smaller discount")
+        
+        return variant_prices, market_prices
+
+def limit_price(cents, original, charm=None, floor=None):
+    """Apply charm rounding and a price floor to a discounted price in cents
+    
+    Charm rounding moves the price down to the nearest amount ending in the
+    charm cents (e.g. 16.40 -> 15.99). The floor then keeps the price from
+    dropping below it, without ever raising it above the original price.
+    Returns None if the price would still be zero or negative, so it is never
+    sent as a free product.
+    """
+    if charm is not None:
+        charmed = cents - cents % 100 + charm
+        if charmed > cents:
+            charmed -= 100
+        if charmed > 0:
+            cents = charmed
+    if floor is not None and cents < floor:
+        cents = min(floor, original)
+    return cents if cents > 0 else None
+
+def build_discount_variant_updates(product_data, discount_percentage=20, set_compare_at_price=True, plan=None):
+    """Calculate discounted variant prices for a backed up product, taking them from plan if given"""
+    variants = product_data["product"]["variants"]["edges"]
+    product_id = product_data["product"]["id"]
+    log_prices = logging.getLogger().isEnabledFor(logging.DEBUG)
+    
+    variants_data = []
+    for variant_edge in variants:
+        variant = variant_edge["node"]
+        variant_id = variant["id"]
+        original_price = variant["price"]
+        current_compare_at_price = variant.get("compareAtPrice")
+        
+        # Calculate discounted price
+        if plan:
+            discounted_price = plan.variant_price(variant_id, original_price)
+            if discounted_price is None:
+                continue
+        else:
+            discounted_price = discount_amount(original_price, discount_percentage)
+            if discounted_price is None:
+                continue
+        
+        variant_update = {
+            "id": variant_id,
+            "price": discounted_price
+        }
+        
+        # Set the original price as compareAtPrice if requested and no compareAtPrice exists
+        if set_compare_at_price and not current_compare_at_price:
+            variant_update["compareAtPrice"] = original_price
+        
+        variants_data.append(variant_update)
+        
+        audit_price(product_id, variant_id, discounted_price, original_price, variant_update.get("compareAtPrice"))
+        if log_prices:
+            compare_at = f" (compare-at: {original_price})" if "compareAtPrice" in variant_update else ""
+            logging.debug(f"Variant {variant['title']}: {original_price} -> {discounted_price}{compare_at}")
+    
+    return variants_data
+
+def build_discount_market_updates(product_data, discount_percentage=20, set_compare_at_price=True, plan=None):
+    """Calculate discounted market prices for a backed up product, taking them from plan if given
+    
+    Returns {price_list_id: {"name", "currency", "prices"}} with prices in the
+    format update_price_list_prices expects.
+    """
+    product_id = product_data["product"]["id"]
+    log_prices = logging.getLogger().isEnabledFor(logging.DEBUG)
+    
+    market_updates = {}
+    for price_list_id, price_list_data in product_data.get("market_prices", {}).items():
+        price_list_currency = price_list_data["currency"]
+        
+        variant_prices = []
+        for price_data in price_list_data["prices"]:
+            variant_id = price_data["variant_id"]
+            original_price = price_data["price"].get("amount")
+            current_compare_at_price = price_data.get("compare_at_price")
+            
+            if original_price:
+                # Calculate discounted price
+                if plan:
+                    discounted_price = plan.market_price(price_list_id, variant_id, original_price)
+                    if discounted_price is None:
+                        continue
+                else:
+                    discounted_price = discount_amount(original_price, discount_percentage)
+                    if discounted_price is None:
+                        continue
+                
+                variant_price = {
+                    "variant_id": variant_id,
+                    "price": {
+                        "amount": discounted_price,
+                        "currencyCode": price_list_currency
+                    }
+                }
+                
+                # Set the original price as compareAtPrice if requested and no compareAtPrice exists
+                if set_compare_at_price and not current_compare_at_price:
+                    variant_price["compare_at_price"] = {
+                        "amount": original_price,
+                        "currencyCode": price_list_currency
+                    }
+                
+                variant_prices.append(variant_price)
+                
+                compare_at = original_price if "compare_at_price" in variant_price else None
+                audit_price(product_id, variant_id, discounted_price, original_price, compare_at, price_list_id, price_list_currency)
+                if log_prices:
+                    compare_at = f" (compare-at: {compare_at})" if compare_at else ""
+                    logging.debug(f"Market variant {variant_id.split('/')[-1]}: {price_list_currency} {original_price} -> {price_list_currency} {discounted_price}{compare_at}")
+        
+        market_updates[price_list_id] = {
+            "name": price_list_data["name"],
+            "currency": price_list_currency,
+            "prices": variant_prices
+        }
+    
+    return market_updates
+
+def build_restore_variant_updates(product_data):
+    """Collect a backed up product's original variant prices"""
+    variants = product_data["product"]["variants"]["edges"]
+    product_id = product_data["product"]["id"]
+    log_prices = logging.getLogger().isEnabledFor(logging.DEBUG)
+    
+    variants_data = []
+    for variant_edge in variants:
+        variant = variant_edge["node"]
+        variant_id = variant["id"]
+        original_price = variant["price"]
+        compare_at_price = variant.get("compareAtPrice")
+        
+        variant_update = {
+            "id": variant_id,
+            "price": original_price
+        }
+        
+        if compare_at_price:
+            variant_update["compareAtPrice"] = compare_at_price
+        
+        variants_data.append(variant_update)
+        
+        audit_price(product_id, variant_id, original_price, compare_at_price=compare_at_price)
+        if log_prices:
+            compare_at = f" (compare-at: {compare_at_price})" if compare_at_price else ""
+            logging.debug(f"Variant {variant['title']}: {original_price}{compare_at}")
+    
+    return variants_data
+
+def build_restore_market_updates(product_data):
+    """Collect a backed up product's original market prices, in the same shape as build_discount_market_updates"""
+    product_id = product_data["product"]["id"]
+    log_prices = logging.getLogger().isEnabledFor(logging.DEBUG)
+    
+    market_updates = {}
+    for price_list_id, price_list_data in product_data.get("market_prices", {}).items():
+        price_list_currency = price_list_data["currency"]
+        
+        variant_prices = []
+        for price_data in price_list_data["prices"]:
+            variant_id = price_data["variant_id"]
+            price = price_data["price"]
+            compare_at_price = price_data.get("compare_at_price")
+            
+            if price and "amount" in price:
+                variant_price = {
+                    "variant_id": variant_id,
+                    "price": {
+                        "amount": price['amount'],
+                        "currencyCode": price_list_currency
+                    }
+                }
+                
+                if compare_at_price:
+                    # Ensure correct currency for compareAtPrice
+                    variant_price["compare_at_price"] = {
+                        "amount": compare_at_price['amount'],
+                        "currencyCode": price_list_currency
+                    }
+                
+                variant_prices.append(variant_price)
+                
+                compare_at = compare_at_price['amount'] if compare_at_price else None
+                audit_price(product_id, variant_id, price['amount'], None, compare_at, price_list_id, price_list_currency)
+                if log_prices:
+                    compare_at = f" (compare-at: {compare_at})" if compare_at else ""
+                    logging.debug(f"Market variant {variant_id.split('/')[-1]}: {price_list_currency} {price['amount']}{compare_at}")
+        
+        market_updates[price_list_id] = {
+            "name": price_list_data["name"],
+            "currency": price_list_currency,
+            "prices": variant_prices
+        }
+    
+    return market_updates
+
+def send_variant_updates(product_data, variants_data, journal=None, action="update"):
+    """Send a product's variant price updates unless a resumed run already did"""
+    product_id = product_data["product"]["id"]
+    product_title = product_data["product"]["title"]
+    
+    if journal and journal.is_done(product_id, "variants"):
+        logging.info(f"Regular prices for {product_title} already updated in a previous run, skipping")
+        return True
+    
+    if not variants_data:
+        # Nothing left to send, e.g. every variant already has its target price
+        if journal:
+            journal.record(product_id, "variants")
+        return True
+    
+    success = update_product_variants_prices(product_id, variants_data)
+    if not success:
+        logging.error(f"Failed to {action} regular prices for {product_title}")
+        return False
+    if journal:
+        journal.record(product_id, "variants")
+    return True
+
+async def send_variant_updates_async(product_data, variants_data, journal=None, action="update"):
+    """Coroutine version of send_variant_updates for the asyncio engine"""
+    product_id = product_data["product"]["id"]
+    product_title = product_data["product"]["title"]
+    
+    if journal and journal.is_done(product_id, "variants"):
+        logging.info(f"Regular prices for {product_title} already updated in a previous run, skipping")
+        return True
+    
+    if not variants_data:
+        if journal:
+            journal.record(product_id, "variants")
+        return True
+    
+    success = await update_product_variants_prices_async(product_id, variants_data)
+    if not success:
+        logging.error(f"Failed to {action} regular prices for {product_title}")
+        return False
+    if journal:
+        journal.record(product_id, "variants")
+    return True
+
+def send_product_updates(product_data, variants_data, market_updates, journal=None, action="update"):
+    """Send a product's variant and market price updates, recording progress in the journal
+    
+    variants_data is None when the variant prices were already sent, e.g. by a
+    bulk mutation. action ("update" or "restore") is used in log messages.
+    """
+    product_id = product_data["product"]["id"]
+    
+    # 1. Update regular prices
+    if variants_data is not None and not send_variant_updates(product_data, variants_data, journal, action):
+        return False
+    
+    # 2. Update market-specific prices if they exist
+    all_updated = True
+    for price_list_id, market_update in market_updates.items():
+        if journal and journal.is_done(product_id, price_list_id):
+            logging.info(f"Market prices for {market_update['name']} already updated in a previous run, skipping")
+            continue
+        
+        logging.debug(f"Processing price list: {market_update['name']} ({market_update['currency']})")
+        
+        # Update this price list
+        if market_update["prices"]:
+            success = update_price_list_prices(price_list_id, market_update["prices"])
+            if not success:
+                logging.error(f"Failed to {action} market prices for {market_update['name']}")
+                all_updated = False
+                continue
+        
+        if journal:
+            journal.record(product_id, price_list_id)
+    
+    # Only mark the whole product done once every price list went through, so
+    # a resumed run retries the ones that failed
+    if journal and all_updated:
+        journal.record(product_id)
+    
+    return True
+
+def apply_discount_to_product_data(product_data, discount_percentage=20, set_compare_at_price=True, journal=None):
+    """Apply a discount to a backed up product's variant and market prices"""
+    product_id = product_data["product"]["id"]
+    product_title = product_data["product"]["title"]
+    
+    logging.info(f"Processing discount for product: {product_title} (ID: {product_id})")
+    
+    variants_data = build_discount_variant_updates(product_data, discount_percentage, set_compare_at_price)
+    market_updates = build_discount_market_updates(product_data, discount_percentage, set_compare_at_price)
+    return send_product_updates(product_data, variants_data, market_updates, journal, "update")
+
+def restore_product_prices_from_data(product_data, journal=None):
+    """Restore a product's variant and market prices from backup data"""
+    product_id = product_data["product"]["id"]
+    product_title = product_data["product"]["title"]
+    
+    logging.info(f"Restoring prices for: {product_title} (ID: {product_id})")
+    
+    variants_data = build_restore_variant_updates(product_data)
+    market_updates = build_restore_market_updates(product_data)
+    return send_product_updates(product_data, variants_data, market_updates, journal, "restore")
+
+def create_staged_upload(filename):
+    """Reserve a staged upload target for a bulk mutation variables file"""
+    mutation = """
+    mutation stagedUploadsCreate($input: [StagedUploadInput!]!) {
+        stagedUploadsCreate(input: $input) {
+            stagedTargets {
+                url
+                resourceUrl
+                parameters {
+                    name
+                    value
+                }
+            }
+            userErrors {
+                field
+                message
+            }
+        }
+    }
+    """
+    
+    variables = {
+        "input": [{
+            "resource": "BULK_MUTATION_VARIABLES",
+            "filename": filename,
+            "mimeType": "text/jsonl",
+            "httpMethod": "POST"
+        }]
+    }
+    
+    try:
+        data = client.execute(mutation, variables)
+    except ShopifyAPIError as e:
+        logging.error(f"Error creating staged upload: {e}")
+        return None
+    
+    user_errors = data["stagedUploadsCreate"]["userErrors"]
+    if user_errors:
+        logging.error(f"User errors creating staged upload: {user_errors}")
+        return None
+    
+    return data["stagedUploadsCreate"]["stagedTargets"][0]
+
+def upload_staged_file(target, path):
+    """Upload a file to a staged upload target and return its staged upload path
+    
+    The target is a signed URL, so the file is posted without the Admin API
+    session and its access token.
+    """
+    form = {parameter["name"]: parameter["value"] for parameter in target["parameters"]}
+    try:
+        with open(path, 'rb') as f:
+            response = requests.post(
+                target["url"],
+                data=form,
+                files={"file": (os.path.basename(path), f, "text/jsonl")},
+                timeout=client.timeout
+            )
+    except requests.RequestException as e:
+        logging.error(f"Error uploading {path}: {e}")
+        return None
+    if response.status_code >= 300:
+        logging.error(f"Error uploading {path}: HTTP {response.status_code} {response.text[:200]}")
+        return None
+    return form["key"]
+
+def start_bulk_mutation(mutation, staged_upload_path):
+    """Submit a bulkOperationRunMutation and return the bulk operation ID"""
+    run_mutation = """
+    mutation bulkOperationRunMutation($mutation: String!, $stagedUploadPath: String!) {
+        bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $stagedUploadPath) {
+            bulkOperation {
+                id
+                status
+            }
+            userErrors {
+                field
+                message
+            }
+        }
+    }
+    """
+    
+    variables = {
+        "mutation": mutation,
+        "stagedUploadPath": staged_upload_path
+    }
+    
+    try:
+        data = client.execute(run_mutation, variables)
+    except ShopifyAPIError as e:
+        logging.error(f"Error starting bulk mutation: {e}")
+        return None
+    
+    user_errors = data["bulkOperationRunMutation"]["userErrors"]
+    if user_errors:
+        logging.error(f"User errors starting bulk mutation: {user_errors}")
+        return None
+    
+    return data["bulkOperationRunMutation"]["bulkOperation"]["id"]
+
+def run_variant_updates_bulk(operation, product_updates, mock=None):
+    """Send variant price updates for many products as one bulk mutation
+    
+    product_updates yields (product_id, variants_data). They are written to a
+    JSONL variables file in LOG_DIR, uploaded through stagedUploadsCreate and
+    run as a single productVariantsBulkUpdate bulkOperationRunMutation.
+    Returns {product_id: error message or None}, or None if the bulk
+    operation could not be submitted, in which case no prices were changed.
+    Once it is submitted, products without a result line, because the
+    operation failed, was cancelled or its results could not be read, are
+    reported as failed so a resume sends them again.
+    """
+    if mock is None:
+        mock = MOCK_MODE
+    
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    variables_path = os.path.join(LOG_DIR, f"{operation}_{timestamp}.variables.jsonl")
+    
+    # Line N of the variables file holds the updates for line_products[N]
+    line_products = []
+    with open(variables_path, 'w') as f:
+        for product_id, variants_data in product_updates:
+            if not variants_data:
+                continue
+            f.write(json.dumps({"productId": product_id, "variants": variants_data}, separators=(",", ":")) + "\n")
+            line_products.append(product_id)
+    
+    logging.info(f"Wrote variant updates for {len(line_products)} products to {variables_path}")
+    
+    if not line_products:
+        return {}
+    
+    if mock:
+        logging.info(f"MOCK: Would run a bulk mutation updating {len(line_products)} products")
+        return {product_id: None for product_id in line_products}
+    
+    target = create_staged_upload(os.path.basename(variables_path))
+    if not target:
+        return None
+    
+    staged_upload_path = upload_staged_file(target, variables_path)
+    if not staged_upload_path:
+        return None
+    
+    operation_id = start_bulk_mutation(PRODUCT_VARIANTS_BULK_UPDATE_MUTATION, staged_upload_path)
+    if not operation_id:
+        return None
+    
+    # Every product without a result line is treated as failed
+    results = {product_id: "no result returned" for product_id in line_products}
+    
+    bulk_operation = wait_for_bulk_operation(operation_id)
+    if not bulk_operation:
+        logging.error(f"Outcome of bulk mutation {operation_id} is unknown; prices may be partly changed. "
+                      f"Check it in Shopify before resuming.")
+        return {product_id: "bulk mutation outcome unknown" for product_id in line_products}
+    
+    results_url = bulk_operation["url"]
+    if bulk_operation["status"] != "COMPLETED":
+        results_url = bulk_operation.get("partialDataUrl")
+        logging.error(f"Bulk mutation {operation_id} did not complete; prices may be partly changed. "
+                      f"{'Reading its partial results' if results_url else 'It returned no partial results'}.")
+    
+    try:
+        for record in iter_bulk_results(results_url):
+            product_id = line_products[record["__lineNumber"]]
+            if record.get("errors"):
+                results[product_id] = str(record["errors"])
+                continue
+            user_errors = record["data"]["productVariantsBulkUpdate"]["userErrors"]
+            results[product_id] = str(user_errors) if user_errors else None
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"Error reading bulk mutation results: {e}; prices may be partly changed, "
+                      f"products without a result are counted as failed")
+    
+    failed = sum(1 for error in results.values() if error)
+    logging.info(f"Bulk mutation finished: {len(results) - failed} products updated, {failed} failed")
+    return results
+
+def same_amount(a, b):
+    """Compare two money amounts exactly, treating missing values as equal only to each other"""
+    if a is None or b is None:
+        return a is None and b is None
+    return decimal.Decimal(str(a)) == decimal.Decimal(str(b))
+
+class LivePriceSnapshot:
+    """Current store prices for the products in a backup, used to skip unchanged rows
+    
+    Variant prices come from one productVariants sweep and market prices from
+    one sweep per price list, instead of a read per product.
+    """
+    
+    def __init__(self, variant_prices, market_price_index):
+        self.variant_prices = variant_prices
+        self.market_price_index = market_price_index
+        self.lock = threading.Lock()
+        self.sent_variants = 0
+        self.skipped_variants = 0
+        self.sent_market_prices = 0
+        self.skipped_market_prices = 0
+    
+    @classmethod
+    def fetch(cls, backup_file):
+        """Fetch live prices for every variant and price list in a backup, or None on failure"""
+        product_ids = []
+        variant_ids = []
+        price_lists = {}
+        for product_id, product_data in iter_backup(backup_file):
+            product_ids.append(product_id)
+            variant_ids.extend(edge["node"]["id"] for edge in product_data["product"]["variants"]["edges"])
+            for price_list_id, price_list_data in product_data.get("market_prices", {}).items():
+                price_lists[price_list_id] = {"id": price_list_id, "name": price_list_data["name"], "currency": price_list_data["currency"]}
+        
+        logging.info(f"Fetching live prices for {len(variant_ids)} variants in {len(price_lists)} price lists...")
+        
+        # Small scopes are looked up by product ID, large ones swept whole
+        query_strings = [None]
+        if len(variant_ids) <= PRICE_FILTER_MAX_VARIANTS:
+            query_strings = id_filter_query_strings("product_id", product_ids)
+        
+        variant_prices = {}
+        for _, prices, error in run_in_workers(fetch_variant_prices, query_strings, "Fetching live variant prices",
+                                               async_func=fetch_variant_prices_async):
+            if error or prices is None:
+                logging.error(f"Failed to fetch live variant prices: {error or 'request failed'}")
+                return None
+            variant_prices.update(prices)
+        
+        market_price_index = build_market_price_index(list(price_lists.values()), variant_ids)
+        if market_price_index is None:
+            return None
+        
+        return cls(variant_prices, market_price_index)
+    
+    def filter_variant_updates(self, variants_data):
+        """Drop variant updates whose price and compare-at price already match the store"""
+        changed = []
+        for variant_update in variants_data:
+            live = self.variant_prices.get(variant_update["id"])
+            if (live is not None
+                    and same_amount(variant_update["price"], live["price"])
+                    and ("compareAtPrice" not in variant_update
+                         or same_amount(variant_update["compareAtPrice"], live["compareAtPrice"]))):
+                continue
+            changed.append(variant_update)
+        
+        with self.lock:
+            self.sent_variants += len(changed)
+            self.skipped_variants += len(variants_data) - len(changed)
+        return changed
+    
+    def filter_market_updates(self, market_updates):
+        """Drop market price rows that already match the store"""
+        filtered = {}
+        sent = skipped = 0
+        for price_list_id, market_update in market_updates.items():
+            changed = []
+            for variant_price in market_update["prices"]:
+                live = self.market_price_index.get(variant_price["variant_id"], {}).get(price_list_id)
+                target_compare_at = (variant_price.get("compare_at_price") or {}).get("amount")
+                live_compare_at = ((live or {}).get("compare_at_price") or {}).get("amount")
+                if (live is not None
+                        and same_amount(variant_price["price"]["amount"], live["price"]["amount"])
+                        and same_amount(target_compare_at, live_compare_at)):
+                    skipped += 1
+                    continue
+                changed.append(variant_price)
+                sent += 1
+            filtered[price_list_id] = dict(market_update, prices=changed)
+        
+        with self.lock:
+            self.sent_market_prices += sent
+            self.skipped_market_prices += skipped
+        return filtered
+    
+    def log_summary(self):
+        logging.info(f"Differential apply: sent {self.sent_variants} variant prices, skipped {self.skipped_variants} unchanged")
+        logging.info(f"Differential apply: sent {self.sent_market_prices} market prices, skipped {self.skipped_market_prices} unchanged")
+
+# Source name standing for the store's current prices in a diff
+LIVE_PRICES = "live"
+
+# Price rows are sorted in chunks of this many rows; larger inputs are
+# spilled to temporary files and merged, so a diff's memory stays bounded
+DIFF_SORT_CHUNK_ROWS = 200000
+
+DIFF_FIELDS = (
+    "change", "product_id", "variant_id", "sku", "market", "currency",
+    "old_price", "new_price", "old_compare_at_price", "new_compare_at_price"
+)
+
+def price_row_key(variant_id, price_list_id):
+    """Sort key of a price row: numeric variant ID first, so rows sort the way IDs were assigned"""
+    number = encode_gid(variant_id, VARIANT_GID_PREFIX)
+    return [number if number is not None else -1, variant_id, price_list_id]
+
+def backup_price_rows(backup_file):
+    """Yield one row per variant price and market price in a backup
+    
+    Rows are lists: sort key (3 fields), product ID, SKU, market, currency,
+    price and compare-at price. The variant's own price has price list "".
+    """
+    for product_id, product_data in iter_backup(backup_file):
+        skus = {}
+        for edge in product_data["product"]["variants"]["edges"]:
+            variant = edge["node"]
+            skus[variant["id"]] = variant.get("sku")
+            yield price_row_key(variant["id"], "") + [
+                product_id, variant.get("sku"), "base", None, variant.get("price"), variant.get("compareAtPrice")
+            ]
+        
+        for price_list_id, price_list_data in product_data.get("market_prices", {}).items():
+            for price_data in price_list_data["prices"]:
+                compare_at_price = price_data.get("compare_at_price")
+                yield price_row_key(price_data["variant_id"], price_list_id) + [
+                    product_id, skus.get(price_data["variant_id"]), price_list_data["name"],
+                    price_data["price"]["currencyCode"], price_data["price"]["amount"],
+                    compare_at_price["amount"] if compare_at_price else None
+                ]
+
+# The live side of a diff reads each price's product ID and SKU along with
+# it, so pages can be filtered to a backup's products as they stream in
+LIVE_VARIANT_PRICES_QUERY = """
+query GetLiveVariantPrices($cursor: String, $batchSize: Int!, $queryString: String) {
+    productVariants(first: $batchSize, after: $cursor, query: $queryString) {
+        pageInfo {
+            hasNextPage
+            endCursor
+        }
+        nodes {
+            id
+            sku
+            price
+            compareAtPrice
+            product {
+                id
+            }
+        }
+    }
+}
+"""
+
+LIVE_PRICE_LIST_PRICES_QUERY = """
+query GetLivePriceListPrices($priceListId: ID!, $cursor: String, $batchSize: Int!, $queryString: String) {
+    priceList(id: $priceListId) {
+        prices(first: $batchSize, after: $cursor, query: $queryString) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            nodes {
+                price {
+                    amount
+                    currencyCode
+                }
+                compareAtPrice {
+                    amount
+                    currencyCode
+                }
+                variant {
+                    id
+                    sku
+                    product {
+                        id
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+def live_price_rows(backup_file):
+    """Price rows with the store's current prices for the products in a backup, or None on failure
+    
+    Variant prices and every price list in the store are paged through and
+    filtered to the backup's product IDs as they stream in, so only those
+    IDs are held in memory; small scopes are looked up by ID instead. Prices
+    in price lists created after the backup show up as added rows. The rows
+    raise ShopifyAPIError if a page can't be fetched.
+    """
+    product_ids = set()
+    variant_ids = []
+    for product_id, product_data in iter_backup(backup_file):
+        product_ids.add(product_id)
+        if len(variant_ids) <= PRICE_FILTER_MAX_VARIANTS:
+            variant_ids.extend(edge["node"]["id"] for edge in product_data["product"]["variants"]["edges"])
+    
+    price_lists = fetch_price_lists()
+    if price_lists is None:
+        return None
+    price_lists = [price_list for price_list in price_lists if price_list.get("fixedPricesCount") != 0]
+    
+    variant_queries = [None]
+    price_queries = [None]
+    if len(variant_ids) <= PRICE_FILTER_MAX_VARIANTS:
+        variant_queries = id_filter_query_strings("product_id", product_ids)
+        price_queries = id_filter_query_strings("variant_id", variant_ids)
+    logging.info(f"Streaming live prices for {len(product_ids)} products from {len(price_lists)} price lists...")
+    
+    def rows():
+        for query_string in variant_queries:
+            variables = {"queryString": query_string} if query_string else {}
+            for node in paginate(LIVE_VARIANT_PRICES_QUERY, variables, ["productVariants"]):
+                product_id = node["product"]["id"]
+                if product_id in product_ids:
+                    yield price_row_key(node["id"], "") + [
+                        product_id, node.get("sku"), "base", None, node["price"], node.get("compareAtPrice")
+                    ]
+        
+        for price_list in price_lists:
+            for query_string in price_queries:
+                variables = price_list_prices_variables(price_list["id"], query_string)
+                for node in paginate(LIVE_PRICE_LIST_PRICES_QUERY, variables, ["priceList", "prices"]):
+                    variant = node["variant"]
+                    if variant["product"]["id"] not in product_ids:
+                        continue
+                    compare_at_price = node.get("compareAtPrice")
+                    yield price_row_key(variant["id"], price_list["id"]) + [
+                        variant["product"]["id"], variant.get("sku"), price_list["name"], node["price"]["currencyCode"],
+                        node["price"]["amount"], compare_at_price["amount"] if compare_at_price else None
+                    ]
+    
+    return rows()
+
+def sorted_price_rows(rows, chunk_rows=None):
+    """Yield price rows sorted by key, sorting in memory a chunk at a time
+    
+    Inputs of more than one chunk are written to temporary files as sorted
+    runs and merged back with heapq.merge.
+    """
+    chunk_rows = chunk_rows or DIFF_SORT_CHUNK_ROWS
+    runs = []
+    chunk = []
+    try:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                chunk.sort(key=lambda row: row[:3])
+                run = tempfile.TemporaryFile('w+')
+                for sorted_row in chunk:
+                    run.write(json.dumps(sorted_row, separators=(",", ":")) + "\n")
+                run.seek(0)
+                runs.append(run)
+                chunk = []
+        
+        chunk.sort(key=lambda row: row[:3])
+        if not runs:
+            yield from chunk
+            return
+        
+        streams = [(json.loads(line) for line in run) for run in runs] + [iter(chunk)]
+        yield from heapq.merge(*streams, key=lambda row: row[:3])
+    finally:
+        for run in runs:
+            run.close()
+
+def diff_price_rows(old_rows, new_rows):
+    """Merge two sorted price row streams, yielding (change, old_row, new_row) for rows that differ"""
+    old_row = next(old_rows, None)
+    new_row = next(new_rows, None)
+    while old_row is not None or new_row is not None:
+        if new_row is None or (old_row is not None and old_row[:3] < new_row[:3]):
+            yield "removed", old_row, None
+            old_row = next(old_rows, None)
+        elif old_row is None or new_row[:3] < old_row[:3]:
+            yield "added", None, new_row
+            new_row = next(new_rows, None)
+        else:
+            if not ((old_row[7] == new_row[7] or same_amount(old_row[7], new_row[7]))
+                    and (old_row[8] == new_row[8] or same_amount(old_row[8], new_row[8]))):
+                yield "changed", old_row, new_row
+            old_row = next(old_rows, None)
+            new_row = next(new_rows, None)
+
+def diff_backups(old_source, new_source=LIVE_PRICES, output_format="csv", output_path=None):
+    """Compare prices in two backups, or a backup and the live store, at variant and market price level
+    
+    Either source may be LIVE_PRICES, in which case the current prices of
+    the other backup's products are streamed from the store. Both sides are
+    read in sorted variant order and every added, removed or changed row
+    is written to a CSV or JSON Lines file in the log directory. Returns a
+    summary dict with the counts and the output path, or None on failure.
+    """
+    if old_source == LIVE_PRICES and new_source == LIVE_PRICES:
+        logging.error("At least one side of a diff must be a backup")
+        return None
+    
+    sides = []
+    for source, other in ((old_source, new_source), (new_source, old_source)):
+        rows = live_price_rows(other) if source == LIVE_PRICES else backup_price_rows(source)
+        if rows is None:
+            logging.error("Diff aborted: live prices could not be fetched")
+            return None
+        sides.append(sorted_price_rows(rows))
+    
+    if not output_path:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = os.path.join(LOG_DIR, f"diff_{timestamp}.{'jsonl' if output_format == 'jsonl' else 'csv'}")
+    
+    summary = {"added": 0, "removed": 0, "changed": 0, "markets": {}, "output": output_path}
+    products = set()
+    try:
+        with open(output_path, 'w', newline="") as f:
+            writer = None if output_format == "jsonl" else csv.writer(f)
+            if writer:
+                writer.writerow(DIFF_FIELDS)
+            
+            for change, old_row, new_row in diff_price_rows(*sides):
+                row = new_row or old_row
+                record = (
+                    change, row[3], row[1], row[4], row[5], row[6],
+                    old_row[7] if old_row else None, new_row[7] if new_row else None,
+                    old_row[8] if old_row else None, new_row[8] if new_row else None
+                )
+                if writer:
+                    writer.writerow(record)
+                else:
+                    f.write(json.dumps(dict(zip(DIFF_FIELDS, record))) + "\n")
+                
+                summary[change] += 1
+                summary["markets"][row[5]] = summary["markets"].get(row[5], 0) + 1
+                products.add(row[3])
+    except ShopifyAPIError as e:
+        # Live prices are read while the diff is written
+        logging.error(f"Diff aborted: live prices could not be fetched: {e}")
+        os.remove(output_path)
+        return None
+    
+    summary["products"] = len(products)
+    logging.info(f"Diff: {summary['changed']} price rows changed, {summary['added']} added, {summary['removed']} removed "
+                 f"across {summary['products']} products")
+    for market, count in sorted(summary["markets"].items()):
+        logging.info(f"  {market}: {count} rows")
+    logging.info(f"Changed rows written to {output_path}")
+    return summary
+
+def product_update_summary(product_title, variants_data, market_updates):
+    """One log line summarising the prices sent or queued for a product"""
+    variants = "variant prices in the bulk mutation" if variants_data is None else f"{len(variants_data)} variant prices"
+    market_count = sum(len(market_update["prices"]) for market_update in market_updates.values())
+    return f"{product_title}: {variants}, {market_count} market prices in {len(market_updates)} price lists"
+
+def run_price_updates(operation, backup_file, params, build_variant_updates, build_market_updates, label, desc,
+                      action="update", workers=None, resume_journal=None, use_bulk_mutation=False, differential=False,
+                      products=None, products_failed=None):
+    """Send computed price updates for every product in a backup
+    
+    Shared by discounts and restores. Products are streamed from the backup
+    and processed on the worker pool, with progress checkpointed in a journal.
+    With use_bulk_mutation the variant updates for all products go out as one
+    bulk mutation first, and only market prices are sent per product. With
+    differential, live prices are fetched up front and rows that already
+    match the store are not sent. products is an iterable of (product_id,
+    product_data) to use instead of reading backup_file, for a backup that
+    is still being written; it can't be combined with either option.
+    products_failed is called once products is used up; if it returns True
+    the source stopped early, which counts as one error and leaves the
+    journal resumable.
+    
+    Returns (success_count, error_count), or None if the run could not start
+    because the live prices or the bulk mutation failed up front.
+    """
+    # Products are streamed from the backup rather than loaded up front
+    total_products = count_backup_products(backup_file) if products is None else None
+    success_count = 0
+    error_count = 0
+    
+    journal = open_checkpoint_journal(operation, backup_file, params, resume_journal)
+    if journal and total_products is not None:
+        total_products -= journal.completed_product_count()
+    
+    if total_products is None and products is None:
+        logging.warning(f"Backup {backup_file} is incomplete (no footer); using the products it contains")
+    logging.info(f"Starting {label} for {total_products if total_products is not None else 'all'} products...")
+    if engine is not None:
+        logging.info(f"Engine: asyncio, up to {engine.concurrency} requests in flight")
+    else:
+        logging.info(f"Workers: {workers or MAX_WORKERS}")
+    logging.info(f"Bulk mutation for variant prices: {use_bulk_mutation}")
+    logging.info(f"Only send changed prices: {differential}")
+    
+    if differential:
+        snapshot = LivePriceSnapshot.fetch(backup_file)
+        if snapshot is None:
+            logging.error("Could not fetch live prices; no prices were changed")
+            if journal:
+                journal.close()
+            return None
+        
+        # Compare every computed row against the live store before sending
+        unfiltered_variant_updates = build_variant_updates
+        unfiltered_market_updates = build_market_updates
+        build_variant_updates = lambda product_data: snapshot.filter_variant_updates(unfiltered_variant_updates(product_data))
+        build_market_updates = lambda product_data: snapshot.filter_market_updates(unfiltered_market_updates(product_data))
+    
+    def pending_products():
+        for product_id, product_data in iter_backup(backup_file) if products is None else products:
+            # Skip products a previous run already finished
+            if journal and journal.is_done(product_id):
+                continue
+            yield product_id, product_data
+    
+    variant_errors = None
+    if use_bulk_mutation:
+        variant_errors = run_variant_updates_bulk(operation, (
+            (product_id, build_variant_updates(product_data))
+            for product_id, product_data in pending_products()
+            if not (journal and journal.is_done(product_id, "variants"))
+        ))
+        if variant_errors is None:
+            logging.error("Bulk mutation failed; no prices were changed")
+            if journal:
+                journal.close()
+            return None
+        if journal:
+            for product_id, error in variant_errors.items():
+                if not error:
+                    journal.record(product_id, "variants")
+    
+    # Market prices from all products are pooled per price list and sent in
+    # large chunks; a product's outcome is only final once its chunks are sent
+    batcher = PriceListBatcher(journal, action)
+    
+    def update_product(item):
+        product_id, product_data = item
+        product_title = product_data["product"]["title"]
+        
+        variants_data = None
+        if variant_errors is None:
+            variants_data = build_variant_updates(product_data)
+            if not send_variant_updates(product_data, variants_data, journal, action):
+                return False
+        elif variant_errors.get(product_id):
+            logging.error(f"Failed to {action} regular prices for {product_title}: {variant_errors[product_id]}")
+            return False
+        
+        market_updates = build_market_updates(product_data)
+        batcher.add_product(product_id, product_title, market_updates)
+        logging.info(product_update_summary(product_title, variants_data, market_updates))
+        return True
+    
+    async def update_product_async(item):
+        product_id, product_data = item
+        product_title = product_data["product"]["title"]
+        
+        variants_data = None
+        if variant_errors is None:
+            variants_data = build_variant_updates(product_data)
+            if not await send_variant_updates_async(product_data, variants_data, journal, action):
+                return False
+        elif variant_errors.get(product_id):
+            logging.error(f"Failed to {action} regular prices for {product_title}: {variant_errors[product_id]}")
+            return False
+        
+        market_updates = build_market_updates(product_data)
+        await batcher.add_product_async(product_id, product_title, market_updates)
+        logging.info(product_update_summary(product_title, variants_data, market_updates))
+        return True
+    
+    # The journal is only marked complete if the run finished without errors,
+    # otherwise it stays resumable
+    finished = False
+    sent_products = {}
+    try:
+        # Process products in parallel; the shared rate limiter paces the requests
+        results = run_in_workers(update_product, pending_products(), desc, total=total_products, workers=workers,
+                                 async_func=update_product_async)
+        for (product_id, product_data), success, error in results:
+            product_title = product_data.get("product", {}).get("title", "Unknown")
+            if error:
+                logging.error(f"Error processing product {product_id}: {error}")
+                error_count += 1
+            elif success:
+                sent_products[product_id] = product_title
+            else:
+                error_count += 1
+                logging.error(f"✗ Failed to process {product_title}")
+        
+        batcher.flush(workers)
+        logging.info(f"Sent {batcher.sent_count} market prices in {batcher.chunk_count} price list mutations")
+        
+        for product_id, product_title in sent_products.items():
+            if product_id in batcher.failed_products:
+                error_count += 1
+                logging.error(f"✗ Failed to {action} market prices for {product_title}")
+            else:
+                success_count += 1
+        
+        if products_failed and products_failed():
+            error_count += 1
+        finished = True
+    finally:
+        if journal:
+            journal.close(complete=finished and error_count == 0)
+    
+    if differential:
+        snapshot.log_summary()
+    
+    return success_count, error_count
+
+def apply_bulk_discount(backup_file, discount_percentage=20, set_compare_at_price=True, workers=None, resume_journal=None,
+                        use_bulk_mutation=False, differential=False, rules_file=None):
+    """Apply a discount to all products in a backup file
+    
+    With rules_file, prices come from a PricingRules file instead of a flat
+    discount_percentage, and the file decides set_compare_at_price. Returns
+    (success_count, error_count), or None if the discount could not run.
+    """
+    client.reset_stats()
+    
+    params = {
+        "discount_percentage": discount_percentage,
+        "set_compare_at_price": set_compare_at_price,
+        "use_bulk_mutation": use_bulk_mutation,
+        "differential": differential,
+        "rules_file": rules_file
+    }
+    
+    # Every price in the backup is priced up front in one pass
+    if rules_file:
+        rules = PricingRules.load(rules_file)
+        if rules is None or not rules.compile():
+            logging.error("Pricing rules could not be loaded; no prices were changed")
+            return None
+        set_compare_at_price = rules.set_compare_at_price
+        logging.info(f"Pricing rules: {rules_file} ({len(rules.rules)} rules)")
+        plan = DiscountPlan.from_rules(backup_file, rules)
+    else:
+        logging.info(f"Discount: {discount_percentage}%")
+        plan = DiscountPlan.from_backup(backup_file, discount_percentage)
+    logging.info(f"Set compare-at prices: {set_compare_at_price}")
+    
+    result = run_price_updates(
+        "apply_discount", backup_file, params,
+        lambda product_data: build_discount_variant_updates(product_data, discount_percentage, set_compare_at_price, plan),
+        lambda product_data: build_discount_market_updates(product_data, discount_percentage, set_compare_at_price, plan),
+        "discount application", "Applying discounts", "update",
+        workers, resume_journal, use_bulk_mutation, differential
+    )
+    if result is None:
+        return None
+    success_count, error_count = result
+    
+    logging.info(f"\nDiscount application completed: {success_count} successful, {error_count} errors")
+    client.log_summary("apply_discount")
+    return success_count, error_count
+
+def restore_bulk_prices(backup_file, workers=None, resume_journal=None, use_bulk_mutation=False, differential=False):
+    """Restore all products' prices from a backup file; returns (success_count, error_count) or None"""
+    client.reset_stats()
+    
+    params = {
+        "use_bulk_mutation": use_bulk_mutation,
+        "differential": differential
+    }
+    
+    result = run_price_updates(
+        "restore_prices", backup_file, params,
+        build_restore_variant_updates,
+        build_restore_market_updates,
+        "price restoration", "Restoring prices", "restore",
+        workers, resume_journal, use_bulk_mutation, differential
+    )
+    if result is None:
+        return None
+    success_count, error_count = result
+    
+    logging.info(f"\nPrice restoration completed: {success_count} successful, {error_count} errors")
+    client.log_summary("restore_prices")
+    return success_count, error_count
+
+# Products buffered between the backup and discount stages of a pipelined sale
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '500'))
+
+def backup_and_discount(discount_percentage=20, set_compare_at_price=True, collection_id=None, backup_name=None, workers=None):
+    """Back up products and apply a discount to them in one pipelined pass
+    
+    A producer thread fetches product pages (all products, or one
+    collection's), writes each product to a new backup and fsyncs it, then
+    queues the products. The discount is sent from the queue on the worker
+    pool while later pages are still being fetched, so a product's prices
+    only change once its pre-image is on disk. The queue is bounded, so a
+    slow discount stage holds back fetching. Market prices are read per page
+    with a MarketPriceLookup, so the first products are discounted without
+    waiting for every price list to be swept.
+    
+    Returns (backup_file, success_count, error_count); backup_file is None
+    if the backup couldn't be started.
+    """
+    client.reset_stats()
+    snapshot_at = utc_timestamp()
+    if not backup_name:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_name = f"sale_backup_{timestamp}"
+    backup_path = os.path.join(BACKUP_DIR, f"{backup_name}{BACKUP_EXTENSION}")
+    
+    price_lists = fetch_price_lists()
+    if price_lists is None:
+        logging.error("Sale aborted: price lists could not be fetched; no prices were changed")
+        return None, 0, 0
+    
+    logging.info(f"Discount: {discount_percentage}%")
+    logging.info(f"Set compare-at prices: {set_compare_at_price}")
+    
+    product_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stopped = threading.Event()
+    done = object()
+    producer_errors = []
+    
+    def put(item):
+        while not stopped.is_set():
+            try:
+                product_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            lookup = MarketPriceLookup.fetch(price_lists)
+            if lookup is None:
+                raise ShopifyAPIError("market prices could not be fetched")
+            
+            scope = f"collection: {collection_id}" if collection_id else "all products"
+            with BackupWriter(backup_path, backup_name, scope=scope, snapshot_at=snapshot_at, price_lists=price_lists) as writer:
+                for products in iter_product_pages(collection_id):
+                    if stopped.is_set():
+                        break
+                    
+                    page = write_backup_page(writer, products, lookup)
+                    
+                    # A product's pre-image is on disk before its prices can change
+                    writer.sync()
+                    for item in page:
+                        if not put(item):
+                            break
+                if stopped.is_set():
+                    raise RuntimeError("discount stage stopped")
+            logging.info(f"Backup stage finished: {writer.product_count} products written to {backup_path}")
+        except Exception as e:
+            producer_errors.append(e)
+        finally:
+            put(done)
+    
+    def queued_products():
+        while True:
+            item = product_queue.get()
+            if item is done:
+                return
+            yield item
+    
+    # Recorded like a regular discount's, so a resumed run discounts the rest
+    # of the backup with apply_bulk_discount
+    params = {
+        "discount_percentage": discount_percentage,
+        "set_compare_at_price": set_compare_at_price,
+        "use_bulk_mutation": False,
+        "differential": False,
+        "rules_file": None
+    }
+    
+    producer = threading.Thread(target=produce, name="sale-backup", daemon=True)
+    producer.start()
+    try:
+        success_count, error_count = run_price_updates(
+            "apply_discount", backup_path, params,
+            lambda product_data: build_discount_variant_updates(product_data, discount_percentage, set_compare_at_price),
+            lambda product_data: build_discount_market_updates(product_data, discount_percentage, set_compare_at_price),
+            "pipelined backup and discount", "Backing up and discounting", "update",
+            workers, products=queued_products(), products_failed=lambda: bool(producer_errors)
+        )
+    finally:
+        stopped.set()
+        producer.join()
+    
+    if producer_errors:
+        logging.error(f"Backup stage failed: {producer_errors[0]}")
+        logging.error(f"The backup {backup_path} is incomplete; it holds every product that was discounted")
+    elif error_count and COMPACT_BACKUPS:
+        # The journal refers to the JSON Lines file, so keep it for resuming
+        index_backup(backup_path)
+    else:
+        backup_path = finish_backup(backup_path)
+    
+    logging.info(f"\nPipelined backup and discount completed: {success_count} successful, {error_count} errors")
+    client.log_summary("backup_and_discount")
+    return backup_path, success_count, error_count
+
+def backup_collection(collection, backup_name=None):
+    """Back up every product in a collection ({"id", "title"}); returns the backup path or None"""
+    collection_id = collection["id"]
+    logging.info(f"Starting backup of collection: {collection['title']} (ID: {collection_id})")
+    client.reset_stats()
+    snapshot_at = utc_timestamp()
+    
+    # Create backup name with collection name
+    if not backup_name:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        collection_name = collection["title"].lower().replace(" ", "_")
+        backup_name = f"collection_{collection_name}_{timestamp}"
+    
+    backup_file = backup_product_pages(iter_product_pages(collection_id), backup_name,
+                                       f"collection: {collection['title']}", snapshot_at)
+    if backup_file:
+        logging.info(f"Collection backup completed. Backup file: {backup_file}")
+    return backup_file
+
+def backup_all_products(backup_name, keep_fetching=None):
+    """Back up all products page by page; returns the backup path or None
+    
+    keep_fetching is called with the running product count after each page;
+    when it returns False fetching stops and the backup is scoped as a
+    partial catalog.
+    """
+    client.reset_stats()
+    snapshot_at = utc_timestamp()
+    backup_file = backup_product_pages(iter_product_pages(), backup_name, "all products", snapshot_at, keep_fetching)
+    if backup_file:
+        logging.info(f"Full catalog backup completed. Backup file: {backup_file}")
+    return backup_file
+
+def list_backups(include_snapshots=False):
+    """List all available price backups
+    
+    With include_snapshots, snapshots in the snapshot store are listed after
+    the backup files and returned as "snapshot:<id>" references.
+    """
+    logging.info("Listing available price backups")
+    print("Available price backups:")
+    backup_files = [
+        f for f in (os.listdir(BACKUP_DIR) if os.path.isdir(BACKUP_DIR) else [])
+        if f.endswith((".json", BACKUP_EXTENSION, COLUMNAR_EXTENSION)) and f != os.path.basename(BACKUP_INDEX_FILE)
+    ]
+    
+    snapshots = []
+    if include_snapshots and os.path.exists(SNAPSHOT_DB):
+        try:
+            with SnapshotStore() as store:
+                snapshots = store.snapshots()
+        except sqlite3.Error as e:
+            logging.warning(f"Couldn't read the snapshot store: {e}")
+    
+    if not backup_files and not snapshots:
+        logging.warning("No backups found.")
+        print("No backups found.")
+        return []
+    
+    # Sort by date (newest first)
+    backup_files.sort(reverse=True)
+    
+    # Details come from the backup index; only new or changed files are read
+    entries = backup_index_entries(backup_files)
+    
+    for i, file in enumerate(backup_files):
+        # Get file creation time
+        file_path = os.path.join(BACKUP_DIR, file)
+        creation_time = os.path.getctime(file_path)
+        creation_date = datetime.datetime.fromtimestamp(creation_time).strftime("%Y-%m-%d %H:%M:%S")
+        
+        entry = entries.get(file)
+        print(f"{i+1}. {file} - Created: {creation_date}")
+        if not entry:
+            continue
+        
+        product_count = entry["products"] if entry["complete"] else f"{entry['products']} (incomplete backup)"
+        size_mb = entry["size"] / (1024 * 1024)
+        print(f"   Products: {product_count}, variants: {entry['variants']}, market prices: {entry['market_prices']} in {entry['price_lists']} price lists")
+        print(f"   Scope: {entry['scope'] or 'unknown'}, shop: {entry['shop'] or 'unknown'}, size: {size_mb:.1f} MB")
+        logging.info(f"Backup {i+1}: {file} - Created: {creation_date} - Products: {product_count}")
+    
+    if snapshots:
+        print("Snapshots in the snapshot store:")
+    for snapshot in reversed(snapshots):
+        backup_files.append(f"{SNAPSHOT_PREFIX}{snapshot['id']}")
+        print(f"{len(backup_files)}. {SNAPSHOT_PREFIX}{snapshot['id']} ({snapshot['name']}) - Created: {snapshot['created']}")
+        print(f"   Products: {snapshot['products']}, variants: {snapshot['variants']}")
+    
+    return backup_files
+
+def snapshot_store_menu():
+    """Interactive menu for the SQLite snapshot store"""
+    print("\n1. Ingest a backup into the snapshot store")
+    print("2. List snapshots")
+    print("3. Price history of a SKU or variant")
+    print("4. Compare two snapshots")
+    print("5. Export a snapshot to a backup file")
+    choice = prompt("\nEnter your choice (1-5, or 0 to cancel): ")
+    
+    if choice == "1":
+        backup_files = list_backups()
+        if not backup_files:
+            return
+        try:
+            backup_index = int(prompt("\nEnter backup number to ingest (or 0 to cancel): ")) - 1
+        except ValueError:
+            logging.error("Invalid input. Please enter a number.")
+            return
+        if 0 <= backup_index < len(backup_files):
+            snapshot_id = ingest_backup(os.path.join(BACKUP_DIR, backup_files[backup_index]))
+            if snapshot_id is not None:
+                print(f"Snapshot {snapshot_id} is available as {SNAPSHOT_PREFIX}{snapshot_id}")
+        elif backup_index >= 0:
+            logging.warning(f"Invalid backup number: {backup_index + 1}")
+        return
+    
+    if choice not in ("2", "3", "4", "5"):
+        return
+    
+    with SnapshotStore() as store:
+        if choice == "2":
+            snapshots = store.snapshots()
+            if not snapshots:
+                print("No snapshots yet. Ingest a backup first.")
+            for snapshot in snapshots:
+                print(f"{snapshot['id']}. {snapshot['name']} - Created: {snapshot['created']} - "
+                      f"Scope: {snapshot['scope'] or 'unknown'} - Products: {snapshot['products']}, variants: {snapshot['variants']}")
+        
+        elif choice == "3":
+            key = prompt("SKU or variant ID: ").strip()
+            market = prompt("Market (price list name, ID or currency; 'base' for the variant price; blank for all): ").strip() or None
+            if key.startswith(VARIANT_GID_PREFIX):
+                rows = store.history(variant_id=key, market=market)
+            else:
+                rows = store.history(sku=key, market=market)
+            if not rows:
+                print("No prices found.")
+            print_price_rows(rows, limit=100)
+        
+        elif choice == "4":
+            try:
+                old_snapshot_id = int(prompt("Older snapshot ID: "))
+                new_snapshot_id = int(prompt("Newer snapshot ID: "))
+            except ValueError:
+                logging.error("Invalid input. Please enter a number.")
+                return
+            rows = store.diff(old_snapshot_id, new_snapshot_id)
+            counts = {}
+            for row in rows:
+                counts[row["change"]] = counts.get(row["change"], 0) + 1
+            print(f"{len(rows)} price rows differ: {counts.get('changed', 0)} changed, "
+                  f"{counts.get('added', 0)} added, {counts.get('removed', 0)} removed")
+            print_price_rows(rows)
+        
+        elif choice == "5":
+            try:
+                snapshot_id = int(prompt("Snapshot ID: "))
+                header, _ = store.info(snapshot_id)
+            except ValueError as e:
+                logging.error(f"Invalid snapshot: {e}")
+                return
+            backup_path = os.path.join(BACKUP_DIR, f"{header.get('name') or f'snapshot_{snapshot_id}'}{BACKUP_EXTENSION}")
+            if os.path.exists(backup_path):
+                logging.error(f"Not exporting: {backup_path} already exists")
+                return
+            store.export(snapshot_id, backup_path)
+            index_backup(backup_path)
+
+def main():
+    """Main function with interactive menu"""
+    global MOCK_MODE
+    
+    # Set up initial logging to console only
+    setup_logging()
+    
+    while True:
+        # Let the previous operation's log lines print before the menu
+        flush_logs()
+        print("\n===== Shopify Bulk Price Manager =====")
+        print(f"Mock Mode: {'ENABLED (no actual updates)' if MOCK_MODE else 'DISABLED (real updates)'}")
+        print("\n1. Create backup for a collection")
+        print("2. Create backup for all products")
+        print("3. Apply discount using backup")
+        print("4. Restore prices from backup")
+        print("5. List available backups")
+        print("6. Toggle mock mode")
+        print("7. Exit")
+        print("8. Convert a backup between JSON Lines and compact format")
+        print("9. Snapshot store: ingest, history, compare and export")
+        print("10. Compare two backups, or a backup with live prices")
+        print("11. Back up and apply a discount in one pass")
+        print("12. Resume an interrupted discount or restore")
+        
+        choice = prompt("\nEnter your choice (1-12): ")
+        
+        if choice == "1":
+            # Set up logging for this operation
+            log_file = setup_logging("collection_backup")
+            logging.info("Starting collection backup operation")
+            
+            # Fetch collections
+            collections = fetch_all_collections()
+            if not collections:
+                logging.warning("No collections found.")
+                continue
+            
+            logging.info(f"Found {len(collections)} collections")
+            print("\nAvailable collections:")
+            for i, collection in enumerate(collections):
+                print(f"{i+1}. {collection['title']} ({collection['productsCount']} products)")
+            
+            collection_index = prompt("\nEnter collection number to backup (or 0 to cancel): ")
+            try:
+                collection_index = int(collection_index) - 1
+                if collection_index < 0:
+                    logging.info("Operation cancelled by user.")
+                    continue
+                if 0 <= collection_index < len(collections):
+                    backup_collection(collections[collection_index])
+                else:
+                    logging.warning(f"Invalid collection number: {collection_index + 1}")
+            except ValueError:
+                logging.error("Invalid input. Please enter a number.")
+            
+        elif choice == "2":
+            # Set up logging for this operation
+            log_file = setup_logging("all_products_backup")
+            logging.info("Starting backup of all products")
+            
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_name = f"all_products_{timestamp}"
+            
+            use_incremental = prompt("Incremental backup? Only products changed since the last full backup are fetched (yes/no, default: no): ")
+            if use_incremental.lower() == "yes":
+                reuse = prompt("Keep market prices of price lists that look unchanged instead of re-reading them? "
+                               "Faster, but misses edited fixed prices (yes/no, default: no): ")
+                backup_file = backup_all_products_incremental(f"incremental_{timestamp}", reuse.lower() != "yes")
+                if backup_file:
+                    logging.info(f"Incremental backup completed. Backup file: {backup_file}")
+                continue
+            
+            use_bulk = prompt("Use the Bulk Operations API? Recommended for large catalogs (yes/no, default: no): ")
+            if use_bulk.lower() == "yes":
+                logging.info("Using the Bulk Operations API")
+                backup_file = backup_all_products_bulk(backup_name)
+                if backup_file:
+                    logging.info(f"Full catalog backup completed. Backup file: {backup_file}")
+                continue
+            
+            # Ask if user wants to continue after each 200 products
+            def keep_fetching(total):
+                if total % 200:
+                    return True
+                continue_fetch = prompt(f"Continue fetching products? (total so far: {total}) (yes/no): ")
+                if continue_fetch.lower() != "yes":
+                    logging.info("User chose to stop fetching more products")
+                    return False
+                return True
+            
+            backup_all_products(backup_name, keep_fetching)
+            
+        elif choice == "3":
+            # Set up logging for this operation
+            log_file = setup_logging("apply_discount")
+            logging.info("Starting discount application process")
+            
+            # List backups
+            backup_files = list_backups(include_snapshots=True)
+            if not backup_files:
+                logging.warning("No backups found")
+                continue
+            
+            backup_index = prompt("\nEnter backup number to use for discount (or 0 to cancel): ")
+            try:
+                backup_index = int(backup_index) - 1
+                if backup_index < 0:
+                    logging.info("Operation cancelled by user")
+                    continue
+                if 0 <= backup_index < len(backup_files):
+                    backup_file = backup_files[backup_index]
+                    if not is_snapshot_ref(backup_file):
+                        backup_file = os.path.join(BACKUP_DIR, backup_file)
+                    logging.info(f"Selected backup file: {backup_files[backup_index]}")
+                    
+                    # Get discount parameters
+                    rules_file = prompt("Pricing rule file (leave empty for a flat discount): ").strip() or None
+                    discount = 20
+                    set_compare_at_price = True
+                    if rules_file:
+                        if not os.path.exists(rules_file):
+                            logging.error(f"Rule file not found: {rules_file}")
+                            continue
+                        logging.info(f"Pricing rule file: {rules_file}")
+                    else:
+                        discount = prompt("Enter discount percentage (default: 20): ")
+                        try:
+                            discount = float(discount) if discount else 20
+                        except:
+                            discount = 20
+                        logging.info(f"Discount percentage: {discount}%")
+                        
+                        set_compare = prompt("Set original price as compare-at price if none exists? (yes/no, default: yes): ")
+                        set_compare_at_price = set_compare.lower() != "no"
+                        logging.info(f"Set compare-at prices: {set_compare_at_price}")
+                    
+                    use_bulk = prompt("Send variant prices as a single bulk mutation? Recommended for storewide sales (yes/no, default: no): ")
+                    use_bulk_mutation = use_bulk.lower() == "yes"
+                    
+                    only_changed = prompt("Only send prices that differ from the live store? (yes/no, default: no): ")
+                    differential = only_changed.lower() == "yes"
+                    
+                    # Confirm action
+                    description = f"pricing rules from {rules_file}" if rules_file else f"{discount}% discount"
+                    if MOCK_MODE:
+                        confirm = prompt(f"\nApply {description} using {backup_files[backup_index]} in MOCK mode? (yes/no): ")
+                    else:
+                        confirm = prompt(f"\nWARNING: This will apply real price changes to your store.\nApply {description} using {backup_files[backup_index]}? (yes/no): ")
+                    
+                    if confirm.lower() == "yes":
+                        logging.info("User confirmed discount application")
+                        result = apply_bulk_discount(backup_file, discount, set_compare_at_price, use_bulk_mutation=use_bulk_mutation,
+                                                     differential=differential, rules_file=rules_file)
+                        if result is not None:
+                            logging.info(f"Discount application completed: {result[0]} successful, {result[1]} errors")
+                    else:
+                        logging.info("Operation cancelled by user")
+                else:
+                    logging.warning(f"Invalid backup number: {backup_index + 1}")
+            except ValueError:
+                logging.error("Invalid input. Please enter a number.")
+            
+        elif choice == "4":
+            # Set up logging for this operation
+            log_file = setup_logging("restore_prices")
+            logging.info("Starting price restoration process")
+            
+            # List backups
+            backup_files = list_backups(include_snapshots=True)
+            if not backup_files:
+                logging.warning("No backups found")
+                continue
+            
+            backup_index = prompt("\nEnter backup number to restore prices from (or 0 to cancel): ")
+            try:
+                backup_index = int(backup_index) - 1
+                if backup_index < 0:
+                    logging.info("Operation cancelled by user")
+                    continue
+                if 0 <= backup_index < len(backup_files):
+                    backup_file = backup_files[backup_index]
+                    if not is_snapshot_ref(backup_file):
+                        backup_file = os.path.join(BACKUP_DIR, backup_file)
+                    logging.info(f"Selected backup file: {backup_files[backup_index]}")
+                    
+                    preview = prompt("Compare the backup with live prices first to see what will change? (yes/no, default: no): ")
+                    if preview.lower() == "yes":
+                        summary = diff_backups(LIVE_PRICES, backup_file)
+                        if summary:
+                            print(f"Restoring would change {summary['changed']} price rows and add {summary['added']} "
+                                  f"across {summary['products']} products. Details: {summary['output']}")
+                    
+                    use_bulk = prompt("Send variant prices as a single bulk mutation? (yes/no, default: no): ")
+                    use_bulk_mutation = use_bulk.lower() == "yes"
+                    
+                    only_changed = prompt("Only send prices that differ from the live store? Recommended when re-running a restore (yes/no, default: no): ")
+                    differential = only_changed.lower() == "yes"
+                    
+                    # Confirm action
+                    if MOCK_MODE:
+                        confirm = prompt(f"\nRestore prices from {backup_files[backup_index]} in MOCK mode? (yes/no): ")
+                    else:
+                        confirm = prompt(f"\nWARNING: This will apply real price changes to your store.\nRestore prices from {backup_files[backup_index]}? (yes/no): ")
+                    
+                    if confirm.lower() == "yes":
+                        logging.info("User confirmed price restoration")
+                        result = restore_bulk_prices(backup_file, use_bulk_mutation=use_bulk_mutation, differential=differential)
+                        if result is not None:
+                            logging.info(f"Price restoration completed: {result[0]} successful, {result[1]} errors")
+                    else:
+                        logging.info("Operation cancelled by user")
+                else:
+                    logging.warning(f"Invalid backup number: {backup_index + 1}")
+            except ValueError:
+                logging.error("Invalid input. Please enter a number.")
+            
+        elif choice == "5":
+            # Set up logging for this operation
+            log_file = setup_logging("list_backups")
+            logging.info("Listing available backups")
+            list_backups()
+            
+        elif choice == "6":
+            MOCK_MODE = not MOCK_MODE
+            status = "ENABLED (no actual updates)" if MOCK_MODE else "DISABLED (real updates)"
+            print(f"Mock Mode: {status}")
+            logging.info(f"Mock mode changed to: {status}")
+            
+        elif choice == "7":
+            logging.info("Exiting application")
+            print("Exiting. Goodbye!")
+            break
+            
+        elif choice == "8":
+            backup_files = list_backups()
+            if not backup_files:
+                continue
+            
+            backup_index = prompt("\nEnter backup number to convert (or 0 to cancel): ")
+            try:
+                backup_index = int(backup_index) - 1
+                if backup_index < 0:
+                    logging.info("Operation cancelled by user")
+                    continue
+                if 0 <= backup_index < len(backup_files):
+                    convert_backup(os.path.join(BACKUP_DIR, backup_files[backup_index]))
+                else:
+                    logging.warning(f"Invalid backup number: {backup_index + 1}")
+            except ValueError:
+                logging.error("Invalid input. Please enter a number.")
+            
+        elif choice == "9":
+            try:
+                snapshot_store_menu()
+            except sqlite3.Error as e:
+                logging.error(f"Snapshot store error: {e}")
+            
+        elif choice == "10":
+            log_file = setup_logging("diff")
+            backup_files = list_backups(include_snapshots=True)
+            if not backup_files:
+                continue
+            
+            try:
+                old_index = int(prompt("\nEnter the older backup number (or 0 to cancel): ")) - 1
+                if old_index < 0:
+                    logging.info("Operation cancelled by user")
+                    continue
+                new_index = int(prompt("Enter the newer backup number (or 0 to compare with live prices): ")) - 1
+            except ValueError:
+                logging.error("Invalid input. Please enter a number.")
+                continue
+            if old_index >= len(backup_files) or new_index >= len(backup_files):
+                logging.warning("Invalid backup number")
+                continue
+            
+            sources = []
+            for index in (old_index, new_index):
+                if index < 0:
+                    sources.append(LIVE_PRICES)
+                elif is_snapshot_ref(backup_files[index]):
+                    sources.append(backup_files[index])
+                else:
+                    sources.append(os.path.join(BACKUP_DIR, backup_files[index]))
+            
+            output_format = prompt("Write changed rows as csv or jsonl? (default: csv): ").strip().lower() or "csv"
+            diff_backups(sources[0], sources[1], output_format)
+            
+        elif choice == "11":
+            log_file = setup_logging("backup_and_discount")
+            logging.info("Starting pipelined backup and discount")
+            
+            collection_id = None
+            scope = prompt("Back up and discount a collection instead of all products? (yes/no, default: no): ")
+            if scope.lower() == "yes":
+                collections = fetch_all_collections()
+                if not collections:
+                    logging.warning("No collections found.")
+                    continue
+                print("\nAvailable collections:")
+                for i, collection in enumerate(collections):
+                    print(f"{i+1}. {collection['title']} ({collection['productsCount']} products)")
+                try:
+                    collection_index = int(prompt("\nEnter collection number (or 0 to cancel): ")) - 1
+                except ValueError:
+                    logging.error("Invalid input. Please enter a number.")
+                    continue
+                if not 0 <= collection_index < len(collections):
+                    logging.info("Operation cancelled by user")
+                    continue
+                collection_id = collections[collection_index]["id"]
+                logging.info(f"Collection: {collections[collection_index]['title']}")
+            
+            discount = prompt("Enter discount percentage (default: 20): ")
+            try:
+                discount = float(discount) if discount else 20
+            except ValueError:
+                discount = 20
+            
+            set_compare = prompt("Set original price as compare-at price if none exists? (yes/no, default: yes): ")
+            set_compare_at_price = set_compare.lower() != "no"
+            
+            if MOCK_MODE:
+                confirm = prompt(f"\nBack up and apply a {discount}% discount in MOCK mode? (yes/no): ")
+            else:
+                confirm = prompt(f"\nWARNING: This will apply real price changes to your store as soon as each product is backed up.\n"
+                                f"Back up and apply a {discount}% discount? (yes/no): ")
+            if confirm.lower() != "yes":
+                logging.info("Operation cancelled by user")
+                continue
+            
+            backup_file, success_count, error_count = backup_and_discount(discount, set_compare_at_price, collection_id)
+            if backup_file:
+                logging.info(f"Backup file: {backup_file}")
+            
+        elif choice == "12":
+            # Set up logging for this operation
+            log_file = setup_logging("resume_operation")
+            logging.info("Starting resume of an interrupted operation")
+            
+            # Journals only record real updates, so there is nothing to resume in mock mode
+            if MOCK_MODE:
+                logging.warning("Resuming is not available in mock mode. Turn mock mode off first (option 6).")
+                continue
+            
+            journals = list_incomplete_journals()
+            if not journals:
+                logging.warning("No interrupted operations found")
+                continue
+            
+            print("\nInterrupted operations:")
+            for i, (journal_path, header) in enumerate(journals):
+                print(f"{i+1}. {os.path.basename(journal_path)} - {header['operation']} using {os.path.basename(header['backup_file'])}")
+            
+            journal_index = prompt("\nEnter operation number to resume (or 0 to cancel): ")
+            try:
+                journal_index = int(journal_index) - 1
+                if journal_index < 0:
+                    logging.info("Operation cancelled by user")
+                    continue
+                if 0 <= journal_index < len(journals):
+                    journal_path = journals[journal_index][0]
+                    confirm = prompt(f"\nWARNING: This will apply real price changes to your store.\nResume {os.path.basename(journal_path)}? (yes/no): ")
+                    if confirm.lower() == "yes":
+                        logging.info(f"User confirmed resume of {journal_path}")
+                        result = resume_operation(journal_path)
+                        if result is not None:
+                            logging.info(f"Resumed operation completed: {result[0]} successful, {result[1]} errors")
+                    else:
+                        logging.info("Operation cancelled by user")
+                else:
+                    logging.warning(f"Invalid operation number: {journal_index + 1}")
+            except ValueError:
+                logging.error("Invalid input. Please enter a number.")
+            
+        else:
+            logging.warning(f"Invalid choice: {choice}")
+            print("Invalid choice. Please try again.")
+
+# Exit codes of the headless subcommands, for cron and CI
+EXIT_OK = 0
+EXIT_PRODUCT_ERRORS = 1
+EXIT_USAGE = 2
+EXIT_FAILED = 3
+
+def price_update_exit_code(result):
+    """Exit code for a (success_count, error_count) result, or None if the operation couldn't run"""
+    if result is None:
+        return EXIT_FAILED
+    return EXIT_PRODUCT_ERRORS if result[1] else EXIT_OK
+
+def resolve_backup(ref):
+    """Resolve a backup given as a path, a file name in BACKUP_DIR or snapshot:<id>"""
+    if is_snapshot_ref(ref) or os.path.exists(ref):
+        return ref
+    candidate = os.path.join(BACKUP_DIR, ref)
+    if os.path.exists(candidate):
+        return candidate
+    logging.error(f"Backup not found: {ref}")
+    return None
+
+def find_collection(ref):
+    """Find a collection by ID, numeric ID or exact title"""
+    collections = fetch_all_collections()
+    for collection in collections:
+        if ref in (collection["id"], collection["id"].rsplit("/", 1)[-1], collection["title"]):
+            return collection
+    logging.error(f"Collection not found: {ref}")
+    return None
+
+def confirm_headless(question, assume_yes):
+    """Confirm a price change; without --yes only an interactive terminal can confirm"""
+    if assume_yes:
+        return True
+    if not sys.stdin.isatty():
+        logging.error("Refusing to change prices without --yes when stdin is not a terminal")
+        return False
+    if not MOCK_MODE:
+        question = f"WARNING: This will apply real price changes to your store.\n{question}"
+    return prompt(f"{question} (yes/no): ").lower() == "yes"
+
+def command_backup(args):
+    setup_logging("collection_backup" if args.collection else "all_products_backup")
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    if args.collection:
+        collection = find_collection(args.collection)
+        if not collection:
+            return EXIT_FAILED
+        backup_file = backup_collection(collection, args.name)
+    elif args.incremental:
+        backup_file = backup_all_products_incremental(args.name or f"incremental_{timestamp}", not args.reuse_price_lists)
+        if backup_file:
+            logging.info(f"Incremental backup completed. Backup file: {backup_file}")
+    elif args.bulk:
+        logging.info("Using the Bulk Operations API")
+        backup_file = backup_all_products_bulk(args.name or f"all_products_{timestamp}")
+        if backup_file:
+            logging.info(f"Full catalog backup completed. Backup file: {backup_file}")
+    else:
+        keep_fetching = (lambda total: total < args.max_products) if args.max_products else None
+        backup_file = backup_all_products(args.name or f"all_products_{timestamp}", keep_fetching)
+    
+    if not backup_file:
+        return EXIT_FAILED
+    print(backup_file)
+    return EXIT_OK
+
+def command_discount(args):
+    setup_logging("backup_and_discount" if args.with_backup else "apply_discount")
+    if args.rules and not os.path.exists(args.rules):
+        logging.error(f"Rule file not found: {args.rules}")
+        return EXIT_FAILED
+    
+    if args.with_backup:
+        collection_id = None
+        if args.collection:
+            collection = find_collection(args.collection)
+            if not collection:
+                return EXIT_FAILED
+            collection_id = collection["id"]
+        if not confirm_headless(f"Back up and apply a {args.percent}% discount?", args.yes):
+            return EXIT_FAILED
+        backup_file, success_count, error_count = backup_and_discount(
+            args.percent, not args.no_compare_at, collection_id, workers=args.workers
+        )
+        if not backup_file:
+            return EXIT_FAILED
+        print(backup_file)
+        return price_update_exit_code((success_count, error_count))
+    
+    backup_file = resolve_backup(args.backup)
+    if not backup_file:
+        return EXIT_FAILED
+    description = f"pricing rules from {args.rules}" if args.rules else f"{args.percent}% discount"
+    if not confirm_headless(f"Apply {description} using {args.backup}?", args.yes):
+        return EXIT_FAILED
+    result = apply_bulk_discount(
+        backup_file, args.percent, not args.no_compare_at, workers=args.workers,
+        use_bulk_mutation=args.bulk_mutation, differential=args.only_changed, rules_file=args.rules
+    )
+    return price_update_exit_code(result)
+
+def command_restore(args):
+    setup_logging("restore_prices")
+    backup_file = resolve_backup(args.backup)
+    if not backup_file:
+        return EXIT_FAILED
+    
+    if args.preview:
+        summary = diff_backups(LIVE_PRICES, backup_file)
+        if summary is None:
+            return EXIT_FAILED
+        print(f"Restoring would change {summary['changed']} price rows and add {summary['added']} "
+              f"across {summary['products']} products. Details: {summary['output']}")
+        if not args.yes:
+            return EXIT_OK
+    
+    if not confirm_headless(f"Restore prices from {args.backup}?", args.yes):
+        return EXIT_FAILED
+    result = restore_bulk_prices(
+        backup_file, workers=args.workers, use_bulk_mutation=args.bulk_mutation, differential=args.only_changed
+    )
+    return price_update_exit_code(result)
+
+def command_list(args):
+    # Console logging only; listing doesn't need a log file
+    setup_logging()
+    list_backups(include_snapshots=args.snapshots)
+    return EXIT_OK
+
+def command_diff(args):
+    setup_logging("diff")
+    sources = []
+    for ref in (args.old, args.new):
+        if ref == LIVE_PRICES:
+            sources.append(ref)
+            continue
+        backup_file = resolve_backup(ref)
+        if not backup_file:
+            return EXIT_FAILED
+        sources.append(backup_file)
+    
+    summary = diff_backups(sources[0], sources[1], args.format, args.output)
+    return EXIT_OK if summary else EXIT_FAILED
+
+def command_resume(args):
+    setup_logging("resume_operation")
+    try:
+        result = resume_operation(args.resume)
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not resume {args.resume}: {e}")
+        return EXIT_FAILED
+    if result is not None:
+        logging.info(f"Resumed operation completed: {result[0]} successful, {result[1]} errors")
+    return price_update_exit_code(result)
+
+def build_parser():
+    """Command line parser; with no subcommand the interactive menu runs"""
+    parser = argparse.ArgumentParser(
+        description="Backup, discount and restore Shopify prices",
+        epilog="Exit codes: 0 success, 1 some products failed, 2 usage error, 3 operation failed or not confirmed"
+    )
+    parser.add_argument("--resume", metavar="JOURNAL", help="resume an interrupted discount or restore from its checkpoint journal in price_logs/")
+    parser.add_argument("--mock", action="store_true", help="log price changes instead of sending them")
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    
+    backup = subparsers.add_parser("backup", help="back up all products or one collection")
+    backup.add_argument("--collection", metavar="ID_OR_TITLE", help="back up one collection instead of all products")
+    backup.add_argument("--incremental", action="store_true", help="only fetch products changed since the last full backup")
+    backup.add_argument("--reuse-price-lists", action="store_true",
+                        help="with --incremental, keep market prices of price lists that look unchanged (misses edited fixed prices)")
+    backup.add_argument("--bulk", action="store_true", help="use the Bulk Operations API")
+    backup.add_argument("--max-products", type=int, metavar="N", help="stop after about N products (a partial catalog backup)")
+    backup.add_argument("--name", help="backup name (default: generated from the scope and time)")
+    backup.set_defaults(handler=command_backup)
+    
+    discount = subparsers.add_parser("discount", help="apply a discount using a backup")
+    discount.add_argument("backup", nargs="?", help="backup path, file name in price_backups/ or snapshot:<id>")
+    discount.add_argument("--percent", type=float, default=20, help="discount percentage (default: 20)")
+    discount.add_argument("--rules", metavar="FILE", help="pricing rule file instead of a flat discount")
+    discount.add_argument("--no-compare-at", action="store_true", help="don't set the original price as compare-at price")
+    discount.add_argument("--bulk-mutation", action="store_true", help="send variant prices as a single bulk mutation")
+    discount.add_argument("--only-changed", action="store_true", help="only send prices that differ from the live store")
+    discount.add_argument("--with-backup", action="store_true", help="back up and discount in one pipelined pass instead of using a backup")
+    discount.add_argument("--collection", metavar="ID_OR_TITLE", help="with --with-backup, only back up and discount this collection")
+    discount.add_argument("--workers", type=int, help=f"parallel workers (default: {MAX_WORKERS})")
+    discount.add_argument("--yes", action="store_true", help="don't ask for confirmation")
+    discount.set_defaults(handler=command_discount)
+    
+    restore = subparsers.add_parser("restore", help="restore prices from a backup")
+    restore.add_argument("backup", help="backup path, file name in price_backups/ or snapshot:<id>")
+    restore.add_argument("--bulk-mutation", action="store_true", help="send variant prices as a single bulk mutation")
+    restore.add_argument("--only-changed", action="store_true", help="only send prices that differ from the live store")
+    restore.add_argument("--preview", action="store_true", help="compare with live prices first; only restores with --yes")
+    restore.add_argument("--workers", type=int, help=f"parallel workers (default: {MAX_WORKERS})")
+    restore.add_argument("--yes", action="store_true", help="don't ask for confirmation")
+    restore.set_defaults(handler=command_restore)
+    
+    list_parser = subparsers.add_parser("list", help="list available backups")
+    list_parser.add_argument("--snapshots", action="store_true", help="also list snapshots in the snapshot store")
+    list_parser.set_defaults(handler=command_list)
+    
+    diff = subparsers.add_parser("diff", help="compare two backups, or a backup with live prices")
+    diff.add_argument("old", help=f"older backup, or '{LIVE_PRICES}'")
+    diff.add_argument("new", nargs="?", default=LIVE_PRICES, help=f"newer backup, or '{LIVE_PRICES}' (default)")
+    diff.add_argument("--format", choices=("csv", "jsonl"), default="csv", help="output format (default: csv)")
+    diff.add_argument("--output", metavar="FILE", help="output file (default: a diff file in price_logs/)")
+    diff.set_defaults(handler=command_diff)
+    
+    return parser
+
+def run(argv=None):
+    """Run a subcommand, or the interactive menu without one, and return the exit code"""
+    global MOCK_MODE
+    
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    MOCK_MODE = args.mock
+    
+    if args.command == "discount" and not args.backup and not args.with_backup:
+        parser.error("discount needs a BACKUP or --with-backup")
+    if args.command == "discount" and args.with_backup and (args.backup or args.rules or args.bulk_mutation or args.only_changed):
+        parser.error("--with-backup can't be combined with a BACKUP, --rules, --bulk-mutation or --only-changed")
+    
+    if args.resume:
+        return command_resume(args)
+    if args.command:
+        return args.handler(args)
+    main()
+    return EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,18 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """Point the backup, log and snapshot locations at a temporary directory"""
+    import shopify_price_manager as spm
+    monkeypatch.setattr(spm, "BACKUP_DIR", str(tmp_path / "price_backups"))
+    monkeypatch.setattr(spm, "BACKUP_INDEX_FILE", str(tmp_path / "price_backups" / "index.json"))
+    monkeypatch.setattr(spm, "LOG_DIR", str(tmp_path / "price_logs"))
+    monkeypatch.setattr(spm, "SNAPSHOT_DB", str(tmp_path / "price_backups" / "snapshots.sqlite3"))
+    spm.ensure_directories()
+    return tmp_path
@@ -0,0 +1,128 @@
+"""Mapping bulk mutation result lines back to the products that were sent"""
+
+import glob
+import json
+import os
+
+import pytest
+import requests
+
+import shopify_price_manager as spm
+
+
+def product(number):
+    return f"gid://shopify/Product/{number}"
+
+
+def variants(number):
+    return [{"id": f"gid://shopify/ProductVariant/{number}", "price": "8.00"}]
+
+
+def result_line(line_number, user_errors=None, errors=None):
+    if errors:
+        return {"errors": errors, "__lineNumber": line_number}
+    return {"data": {"productVariantsBulkUpdate": {"userErrors": user_errors or []}}, "__lineNumber": line_number}
+
+
+class BulkOperation:
+    """Stands in for requests.get, serving hand-written JSONL result files by URL
+
+    operation is what polling the bulk operation returns.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.operation = {"status": "COMPLETED", "url": "https://results/full.jsonl"}
+
+    def add(self, url, records):
+        self.files[url] = "\n".join(json.dumps(record) for record in records).encode() + b"\n"
+
+    def __call__(self, url, stream=False, timeout=None):
+        if url not in self.files:
+            raise requests.ConnectionError(f"cannot reach {url}")
+        return FakeResponse(self.files[url])
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        return iter(self.body.split(b"\n"))
+
+
+@pytest.fixture
+def bulk(storage, monkeypatch):
+    """Submit bulk mutations successfully and serve their results from a BulkOperation"""
+    results = BulkOperation()
+    monkeypatch.setattr(spm, "create_staged_upload", lambda filename: {"url": "https://upload", "parameters": []})
+    monkeypatch.setattr(spm, "upload_staged_file", lambda target, path: "tmp/variables.jsonl")
+    monkeypatch.setattr(spm, "start_bulk_mutation", lambda mutation, path: "gid://shopify/BulkOperation/1")
+    monkeypatch.setattr(spm, "wait_for_bulk_operation", lambda operation_id: results.operation)
+    monkeypatch.setattr(spm.requests, "get", results)
+    return results
+
+
+UPDATES = [(product(1), variants(1)), (product(2), []), (product(3), variants(3)), (product(4), variants(4)), (product(5), variants(5))]
+
+
+def test_result_lines_map_to_products(bulk):
+    bulk.add("https://results/full.jsonl", [
+        result_line(2, user_errors=[{"field": ["variants", "0", "price"], "message": "too low"}]),
+        result_line(0),
+        result_line(3, errors=[{"message": "internal error"}]),
+    ])
+    results = spm.run_variant_updates_bulk("apply_discount", iter(UPDATES))
+
+    # Products without variant updates are not sent, so line N is the Nth product sent
+    [variables_path] = glob.glob(os.path.join(spm.LOG_DIR, "apply_discount_*.variables.jsonl"))
+    with open(variables_path) as f:
+        assert [json.loads(line)["productId"] for line in f] == [product(1), product(3), product(4), product(5)]
+
+    assert results[product(1)] is None
+    assert product(2) not in results
+    assert results[product(3)] == "no result returned"
+    assert "too low" in results[product(4)]
+    assert "internal error" in results[product(5)]
+
+
+def test_partial_results_of_a_failed_operation(bulk):
+    bulk.operation = {"status": "FAILED", "url": None, "partialDataUrl": "https://results/partial.jsonl"}
+    bulk.add("https://results/partial.jsonl", [result_line(0), result_line(1)])
+    results = spm.run_variant_updates_bulk("apply_discount", iter(UPDATES))
+    assert results == {product(1): None, product(3): None, product(4): "no result returned", product(5): "no result returned"}
+
+
+def test_unreadable_results_count_as_failed(bulk):
+    bulk.operation = {"status": "COMPLETED", "url": "https://results/missing.jsonl"}
+    results = spm.run_variant_updates_bulk("restore_prices", iter(UPDATES))
+    assert set(results) == {product(1), product(3), product(4), product(5)}
+    assert all(error == "no result returned" for error in results.values())
+
+
+def test_unknown_outcome_fails_every_product(bulk):
+    bulk.operation = None
+    results = spm.run_variant_updates_bulk("apply_discount", iter(UPDATES))
+    assert set(results.values()) == {"bulk mutation outcome unknown"}
+    assert len(results) == 4
+
+
+def test_nothing_is_changed_if_the_mutation_cannot_start(bulk, monkeypatch):
+    monkeypatch.setattr(spm, "start_bulk_mutation", lambda mutation, path: None)
+    assert spm.run_variant_updates_bulk("apply_discount", iter(UPDATES)) is None
+
+
+def test_mock_mode_sends_nothing(bulk, monkeypatch):
+    monkeypatch.setattr(spm, "create_staged_upload", lambda filename: pytest.fail("uploaded in mock mode"))
+    results = spm.run_variant_updates_bulk("apply_discount", iter(UPDATES), mock=True)
+    assert results == {product(1): None, product(3): None, product(4): None, product(5): None}
+    assert spm.run_variant_updates_bulk("apply_discount", iter([(product(2), [])]), mock=True) == {}
@@ -0,0 +1,136 @@
+"""Columnar backups: decimal encoding and a write/read round trip"""
+
+import json
+
+import pytest
+
+import shopify_price_manager as spm
+
+
+def make_product(number, variants, market_prices=None, tags=("sale",)):
+    product_id = f"gid://shopify/Product/{number}"
+    product = {
+        "id": product_id,
+        "title": f"Product {number}",
+        "handle": f"product-{number}",
+        "tags": list(tags),
+        "variants": {"edges": [
+            {"node": {
+                "id": f"gid://shopify/ProductVariant/{variant_id}",
+                "title": f"Variant {variant_id}",
+                "sku": f"SKU-{variant_id}",
+                "price": price,
+                "compareAtPrice": compare_at
+            }}
+            for variant_id, price, compare_at in variants
+        ]}
+    }
+    return product_id, {
+        "metadata": {
+            "timestamp": "2026-01-01T00:00:00",
+            "shop": "test-shop",
+            "product_id": product_id,
+            "product_title": product["title"]
+        },
+        "product": product,
+        "market_prices": market_prices or {}
+    }
+
+
+def market_price(variant_id, amount, compare_at=None, currency="EUR"):
+    return {
+        "variant_id": f"gid://shopify/ProductVariant/{variant_id}",
+        "price": {"amount": amount, "currencyCode": currency},
+        "compare_at_price": {"amount": compare_at, "currencyCode": currency} if compare_at is not None else None
+    }
+
+
+def price_list(name, currency, prices):
+    # Same key order as the backup writer, so records compare equal as JSON
+    return {"prices": prices, "currency": currency, "name": name}
+
+
+@pytest.mark.parametrize("amount", ["19.99", "5", "0.05", "-0.50", "-0.05", "-12", "1.000", "123456789.123456789"])
+def test_encode_decimal_round_trips(amount):
+    assert spm.decode_decimal(*spm.encode_decimal(amount)) == amount
+
+
+def test_encode_decimal_null_and_unsupported():
+    assert spm.encode_decimal(None) == (0, spm.NULL_SCALE)
+    assert spm.decode_decimal(0, spm.NULL_SCALE) is None
+    for amount in ("1e5", "1.", ".5", "abc", 19.99, "1." + "0" * 19, "12345678901.123456789", "-9223372036854775809"):
+        assert spm.encode_decimal(amount) is None
+
+
+def write_and_read(tmp_path, products):
+    writer = spm.ColumnarBackupWriter()
+    for product_id, product_data in products:
+        writer.add_product(product_id, product_data)
+    path = str(tmp_path / f"backup{spm.COLUMNAR_EXTENSION}")
+    header = {"type": "header", "name": "test"}
+    footer = {"type": "footer", "product_count": len(products)}
+    writer.write(path, header, footer)
+    with spm.ColumnarBackup(path) as backup:
+        assert backup.header == header
+        assert backup.footer == footer
+        assert len(backup) == len(products)
+        return writer, list(backup)
+
+
+def test_round_trip_is_exact(tmp_path):
+    products = [
+        make_product(1, [(11, "19.99", None), (12, "-0.50", "10.00")], {
+            "gid://shopify/PriceList/1": price_list(
+                "Europe", "EUR", [market_price(11, "18.50"), market_price(12, "-0.50", "9.95")]
+            ),
+            "gid://shopify/PriceList/2": price_list("UK", "GBP", [market_price(11, "15", currency="GBP")])
+        }),
+        make_product(2, [(21, "0.00", None)], tags=()),
+        make_product(3, [])
+    ]
+    writer, read_back = write_and_read(tmp_path, products)
+    assert writer.raw_count == 0
+    assert json.dumps(read_back) == json.dumps(products)
+
+
+def test_null_compare_at_prices_stay_null(tmp_path):
+    products = [make_product(1, [(11, "10.00", None)], {
+        "gid://shopify/PriceList/1": price_list("Europe", "EUR", [market_price(11, "9.00")])
+    })]
+    writer, [(_, product_data)] = write_and_read(tmp_path, products)
+    assert writer.raw_count == 0
+    assert product_data["product"]["variants"]["edges"][0]["node"]["compareAtPrice"] is None
+    assert product_data["market_prices"]["gid://shopify/PriceList/1"]["prices"][0]["compare_at_price"] is None
+
+
+def test_products_the_columns_cannot_hold_are_kept_verbatim(tmp_path):
+    products = [
+        # "-0.00" would decode as "0.00", and a float price can't be stored as a decimal string
+        make_product(1, [(11, "-0.00", None)]),
+        make_product(2, [(21, 19.99, None)]),
+        ("not-a-gid", {"metadata": {}, "product": {}, "market_prices": {}}),
+        make_product(4, [(41, "7.25", "8.00")])
+    ]
+    writer, read_back = write_and_read(tmp_path, products)
+    assert writer.raw_count == 3
+    assert json.dumps(read_back) == json.dumps(products)
+
+
+def test_amounts_past_int64_are_kept_verbatim(tmp_path):
+    products = [
+        make_product(1, [(11, "12345678901.123456789", None)]),
+        make_product(2, [(21, "1.00", None)], {
+            "gid://shopify/PriceList/1": price_list("Europe", "EUR", [market_price(21, "9.00", "-9223372036854775809")])
+        }),
+        make_product(3, [(31, "9223372036854775807", "-9223372036854775808")])
+    ]
+    writer, read_back = write_and_read(tmp_path, products)
+    assert writer.raw_count == 2
+    assert json.dumps(read_back) == json.dumps(products)
+
+
+def test_rejects_files_that_are_not_columnar(tmp_path):
+    path = tmp_path / f"backup{spm.COLUMNAR_EXTENSION}"
+    path.write_text('{"type": "header"}\n')
+    with pytest.raises(ValueError):
+        spm.ColumnarBackup(str(path))
@@ -0,0 +1,64 @@
+"""Sorted price rows and the merge-join behind the diff command"""
+
+import random
+
+import shopify_price_manager as spm
+
+
+def row(variant, price_list_id="", price="10.00", compare_at=None):
+    variant_id = f"gid://shopify/ProductVariant/{variant}"
+    return spm.price_row_key(variant_id, price_list_id) + [
+        "gid://shopify/Product/1", f"SKU-{variant}", "base" if not price_list_id else "Europe",
+        None if not price_list_id else "EUR", price, compare_at
+    ]
+
+
+def diff(old, new, chunk_rows=None):
+    return [
+        (change, old_row and old_row[:3], new_row and new_row[:3])
+        for change, old_row, new_row in spm.diff_price_rows(
+            spm.sorted_price_rows(old, chunk_rows), spm.sorted_price_rows(new, chunk_rows)
+        )
+    ]
+
+
+def test_rows_sort_by_numeric_variant_id():
+    rows = [row(10), row(9, "gid://shopify/PriceList/1"), row(9), row(100)]
+    assert [r[0] for r in spm.sorted_price_rows(rows)] == [9, 9, 10, 100]
+    assert [r[2] for r in spm.sorted_price_rows(rows)][:2] == ["", "gid://shopify/PriceList/1"]
+
+
+def test_spilled_runs_merge_in_order():
+    rows = [row(variant, price_list_id) for variant in range(200) for price_list_id in ("", "gid://shopify/PriceList/1")]
+    random.Random(1).shuffle(rows)
+    expected = sorted(rows, key=lambda r: r[:3])
+    assert list(spm.sorted_price_rows(iter(rows), chunk_rows=7)) == expected
+
+
+def test_added_removed_and_changed_rows():
+    old = [row(1), row(2), row(3, price="5.00"), row(4, "gid://shopify/PriceList/1")]
+    new = [row(2), row(3, price="4.50"), row(4, "gid://shopify/PriceList/1"), row(5)]
+    assert diff(old, new) == [
+        ("removed", row(1)[:3], None),
+        ("changed", row(3)[:3], row(3)[:3]),
+        ("added", None, row(5)[:3])
+    ]
+
+
+def test_equal_amounts_in_different_notation_are_unchanged():
+    old = [row(1, price="10.0"), row(2, compare_at="12")]
+    new = [row(1, price="10.00"), row(2, compare_at="12.00")]
+    assert diff(old, new) == []
+
+
+def test_compare_at_price_set_or_cleared_is_a_change():
+    old = [row(1), row(2, compare_at="15.00")]
+    new = [row(1, compare_at="15.00"), row(2)]
+    assert [change for change, _, _ in diff(old, new)] == ["changed", "changed"]
+
+
+def test_spilled_and_in_memory_diffs_agree():
+    rng = random.Random(2)
+    old = [row(variant, price=f"{rng.randint(1, 3)}.00") for variant in range(0, 300, 2)]
+    new = [row(variant, price=f"{rng.randint(1, 3)}.00") for variant in range(0, 300, 3)]
+    assert diff(list(old), list(new), chunk_rows=16) == diff(old, new)
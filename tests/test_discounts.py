@@ -0,0 +1,98 @@
+"""Integer-cent discounts: half-up rounding and the NumPy/int64 fallback"""
+
+import pytest
+
+import shopify_price_manager as spm
+
+
+@pytest.mark.parametrize("amount, cents", [
+    ("19.99", 1999),
+    ("5", 500),
+    ("0.5", 50),
+    ("-0.50", -50),
+    ("20.000", 2000),
+    (19.99, 1999),
+])
+def test_parse_cents(amount, cents):
+    assert spm.parse_cents(amount) == cents
+
+
+@pytest.mark.parametrize("amount", [None, "", "1.005", "19.999", "-1.005", "abc", "NaN", "Infinity"])
+def test_parse_cents_rejects_missing_and_sub_cent_amounts(amount):
+    with pytest.raises(ValueError):
+        spm.parse_cents(amount)
+
+
+@pytest.mark.parametrize("cents, amount", [(1999, "19.99"), (5, "0.05"), (0, "0.00"), (-50, "-0.50"), (-1999, "-19.99")])
+def test_format_cents(cents, amount):
+    assert spm.format_cents(cents) == amount
+
+
+@pytest.mark.parametrize("value, denominator, result", [
+    (5, 10, 1),
+    (4, 10, 0),
+    (15, 10, 2),
+    (25, 10, 3),
+    (-5, 10, -1),
+    (-15, 10, -2),
+    (-4, 10, 0),
+    (0, 7, 0),
+])
+def test_divide_half_up_rounds_halves_away_from_zero(value, denominator, result):
+    assert spm.divide_half_up(value, denominator) == result
+
+
+def test_discount_cents_rounds_half_up():
+    # 10% off 0.05 is 0.045 and 10% off 0.15 is 0.135; float rounding would give 0.04 and 0.13
+    assert spm.discount_cents([5, 15, 1999], 10) == [5, 14, 1799]
+    assert spm.discount_cents([1001], "12.5") == [876]
+    assert spm.discount_cents([-5], 10) == [-5]
+    assert spm.discount_cents([], 10) == []
+
+
+def test_discount_amount_matches_discount_cents():
+    for amount in ("0.05", "0.15", "19.99", "1234.56"):
+        assert spm.discount_amount(amount, 15) == spm.format_cents(spm.discount_cents([spm.parse_cents(amount)], 15)[0])
+
+
+def test_discount_amount_leaves_unusable_amounts_unchanged():
+    assert spm.discount_amount("19.999", 10) is None
+    assert spm.discount_amount("", 10) is None
+    assert spm.discount_amount(None, 10) is None
+
+
+def test_discount_plan_skips_unusable_amounts():
+    product = {
+        "product": {"variants": {"edges": [
+            {"node": {"id": "v1", "price": "10.00"}},
+            {"node": {"id": "v2", "price": "12.345"}}
+        ]}},
+        "market_prices": {"pl1": {"prices": [
+            {"variant_id": "v1", "price": {"amount": "8.500"}},
+            {"variant_id": "v2", "price": {"amount": "9.999"}}
+        ]}}
+    }
+    plan = spm.DiscountPlan.build([product], 10)
+    assert plan.variant_price("v1", "10.00") == "9.00"
+    assert plan.variant_price("v2", "12.345") is None
+    assert plan.market_price("pl1", "v1", "8.500") == "7.65"
+    assert plan.market_price("pl1", "v2", "9.999") is None
+
+
+@pytest.mark.skipif(spm.np is None, reason="NumPy is not installed")
+def test_numpy_and_integer_paths_agree(monkeypatch):
+    cents = list(range(-2000, 2000, 7)) + [999999999]
+    for percentage in (10, "12.5", "33.33", 99):
+        vectorized = spm.discount_cents(cents, percentage)
+        monkeypatch.setattr(spm, "np", None)
+        assert spm.discount_cents(cents, percentage) == vectorized
+        monkeypatch.undo()
+
+
+def test_values_too_large_for_int64_fall_back_to_integers():
+    huge = 2 ** 62
+    assert spm.discount_cents([huge, -huge, 5], 10) == [
+        spm.divide_half_up(huge * 9, 10), -spm.divide_half_up(huge * 9, 10), 5
+    ]
+    # Amounts past int64 must not overflow or raise
+    assert spm.discount_cents([2 ** 70], 50) == [2 ** 69]
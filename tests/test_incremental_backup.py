@@ -0,0 +1,117 @@
+"""Carrying market prices over from a base backup in incremental backups"""
+
+import os
+
+import pytest
+
+import shopify_price_manager as spm
+
+SWEPT = {"id": "gid://shopify/PriceList/1", "name": "Europe", "currency": "EUR", "fixedPricesCount": 3}
+KEPT = {"id": "gid://shopify/PriceList/2", "name": "UK", "currency": "GBP", "fixedPricesCount": 2}
+DELETED = {"id": "gid://shopify/PriceList/3", "name": "Canada", "currency": "CAD", "fixedPricesCount": 1}
+
+
+def variant_id(number):
+    return f"gid://shopify/ProductVariant/{number}"
+
+
+def market_price(variant, amount, currency):
+    return {"variant_id": variant_id(variant), "price": {"amount": amount, "currencyCode": currency}, "compare_at_price": None}
+
+
+def product_node(number, variants, price="10.00"):
+    return {
+        "id": f"gid://shopify/Product/{number}",
+        "title": f"Product {number}",
+        "variants": {"edges": [{"node": {"id": variant_id(variant), "price": price, "compareAtPrice": None}} for variant in variants]}
+    }
+
+
+def backup_data(number, variants, market_prices):
+    """A base backup record; market_prices maps a price list to its [(variant, amount)]"""
+    return {
+        "metadata": {"timestamp": "2026-01-01T00:00:00", "shop": "test-shop"},
+        "product": product_node(number, variants),
+        "market_prices": {
+            price_list["id"]: {
+                "prices": [market_price(variant, amount, price_list["currency"]) for variant, amount in prices],
+                "currency": price_list["currency"],
+                "name": price_list["name"]
+            }
+            for price_list, prices in market_prices
+        }
+    }
+
+
+def test_merge_market_prices():
+    product_data = backup_data(1, [11, 12], [
+        (SWEPT, [(11, "9.00"), (12, "9.50")]),
+        (KEPT, [(11, "8.00")]),
+        (DELETED, [(11, "13.00")]),
+    ])
+    renamed = dict(KEPT, name="United Kingdom")
+    added = {"id": "gid://shopify/PriceList/4", "name": "Japan", "currency": "JPY", "fixedPricesCount": 1}
+    index = {
+        variant_id(11): {SWEPT["id"]: market_price(11, "7.00", "EUR"), added["id"]: market_price(11, "1000", "JPY")},
+        # Prices of other products in the index are not picked up
+        variant_id(99): {SWEPT["id"]: market_price(99, "1.00", "EUR")},
+    }
+
+    merged = spm.merge_market_prices(product_data, [SWEPT, renamed, added], {SWEPT["id"], added["id"]}, index)
+
+    # Variant 12 no longer has a price in the swept list, and the deleted list is dropped
+    assert merged == {
+        SWEPT["id"]: {"prices": [market_price(11, "7.00", "EUR")], "currency": "EUR", "name": "Europe"},
+        KEPT["id"]: {"prices": [market_price(11, "8.00", "GBP")], "currency": "GBP", "name": "United Kingdom"},
+        added["id"]: {"prices": [market_price(11, "1000", "JPY")], "currency": "JPY", "name": "Japan"},
+    }
+
+
+@pytest.fixture
+def base_backup(storage, monkeypatch):
+    monkeypatch.setattr(spm, "SHOP_NAME", "test-shop")
+    monkeypatch.setattr(spm, "COMPACT_BACKUPS", False)
+    monkeypatch.setattr(spm, "SNAPSHOT_STORE", False)
+    path = os.path.join(spm.BACKUP_DIR, f"base{spm.BACKUP_EXTENSION}")
+    with spm.BackupWriter(path, "base", scope="all products", snapshot_at="2026-01-01T00:00:00Z",
+                          price_lists=[SWEPT, KEPT, DELETED]) as writer:
+        writer.write_product("gid://shopify/Product/1", backup_data(1, [11], [(SWEPT, [(11, "9.00")]), (KEPT, [(11, "8.00")])]))
+        writer.write_product("gid://shopify/Product/2", backup_data(2, [21], [(SWEPT, [(21, "9.00")]), (KEPT, [(21, "8.00")])]))
+        writer.write_product("gid://shopify/Product/3", backup_data(3, [31], [(DELETED, [(31, "13.00")])]))
+    spm.index_backup(path)
+    return path
+
+
+def test_incremental_backup_merges_with_the_base(base_backup, monkeypatch):
+    index_calls = []
+
+    def build_market_price_index(price_lists, variant_ids=None, **kwargs):
+        index_calls.append(([price_list["id"] for price_list in price_lists], variant_ids))
+        if variant_ids is None:
+            return {variant_id(11): {SWEPT["id"]: market_price(11, "7.00", "EUR")},
+                    variant_id(21): {SWEPT["id"]: market_price(21, "7.50", "EUR")}}
+        return {variant_id(21): {KEPT["id"]: market_price(21, "6.00", "GBP")}}
+
+    # Product 3 was deleted and product 2 changed; the swept list has new prices
+    monkeypatch.setattr(spm, "fetch_product_ids", lambda: ["gid://shopify/Product/1", "gid://shopify/Product/2"])
+    monkeypatch.setattr(spm, "iter_product_pages", lambda query_string=None, **kwargs: iter([[product_node(2, [21], "12.00")]]))
+    monkeypatch.setattr(spm, "fetch_price_lists", lambda: [dict(SWEPT, fixedPricesCount=4), KEPT])
+    monkeypatch.setattr(spm, "build_market_price_index", build_market_price_index)
+
+    path = spm.backup_all_products_incremental("incremental", sweep_all_price_lists=False)
+
+    assert index_calls == [([SWEPT["id"]], None), ([KEPT["id"]], [variant_id(21)])]
+    header, footer = spm.read_backup_info(path)
+    assert header["base"] == os.path.basename(base_backup)
+    assert footer["product_count"] == 2
+    products = dict(spm.iter_backup(path))
+    assert list(products) == ["gid://shopify/Product/1", "gid://shopify/Product/2"]
+
+    carried_over = products["gid://shopify/Product/1"]["market_prices"]
+    assert carried_over[SWEPT["id"]]["prices"] == [market_price(11, "7.00", "EUR")]
+    assert carried_over[KEPT["id"]]["prices"] == [market_price(11, "8.00", "GBP")]
+
+    refreshed = products["gid://shopify/Product/2"]
+    assert refreshed["product"]["variants"]["edges"][0]["node"]["price"] == "12.00"
+    assert refreshed["market_prices"][SWEPT["id"]]["prices"] == [market_price(21, "7.50", "EUR")]
+    assert refreshed["market_prices"][KEPT["id"]]["prices"] == [market_price(21, "6.00", "GBP")]
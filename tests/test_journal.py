@@ -0,0 +1,81 @@
+"""Checkpoint journals and resuming interrupted operations"""
+
+import pytest
+
+import shopify_price_manager as spm
+
+
+def test_recorded_work_survives_a_reload(storage):
+    journal = spm.CheckpointJournal.create("apply_discount", "sale.jsonl", {"discount_percentage": 20})
+    journal.record("gid://shopify/Product/1", "variants")
+    journal.record("gid://shopify/Product/1", "gid://shopify/PriceList/1")
+    journal.record("gid://shopify/Product/1")
+    journal.record("gid://shopify/Product/2", "variants")
+    journal.close()
+
+    reloaded = spm.CheckpointJournal.load(journal.path)
+    assert reloaded.header["operation"] == "apply_discount"
+    assert reloaded.header["params"] == {"discount_percentage": 20}
+    assert reloaded.is_done("gid://shopify/Product/1")
+    assert reloaded.is_done("gid://shopify/Product/2", "variants")
+    assert not reloaded.is_done("gid://shopify/Product/2")
+    assert not reloaded.is_done("gid://shopify/Product/2", "gid://shopify/PriceList/1")
+    assert reloaded.completed_product_count() == 1
+    reloaded.close()
+
+
+def test_cut_off_last_line_is_ignored(storage):
+    journal = spm.CheckpointJournal.create("restore_prices", "sale.jsonl", {})
+    journal.record("gid://shopify/Product/1")
+    journal.close()
+    with open(journal.path, 'a') as f:
+        f.write('{"type":"done","product_id":"gid://shop')
+
+    header, completed, is_complete = spm.CheckpointJournal.read(journal.path)
+    assert header["operation"] == "restore_prices"
+    assert completed == {("gid://shopify/Product/1", None)}
+    assert not is_complete
+
+
+def test_file_without_header_is_rejected(storage):
+    path = storage / "price_logs" / f"broken{spm.CheckpointJournal.JOURNAL_SUFFIX}"
+    path.write_text('{"type":"done","product_id":"gid://shopify/Product/1","target":null}\n')
+    with pytest.raises(ValueError):
+        spm.CheckpointJournal.read(str(path))
+    assert spm.list_incomplete_journals() == []
+
+
+def test_only_incomplete_journals_are_listed(storage):
+    finished = spm.CheckpointJournal.create("apply_discount", "a.jsonl", {})
+    finished.close(complete=True)
+    interrupted = spm.CheckpointJournal.create("restore_prices", "b.jsonl", {})
+    interrupted.close()
+
+    assert [path for path, _ in spm.list_incomplete_journals()] == [interrupted.path]
+    assert spm.CheckpointJournal.read(finished.path)[2]
+
+
+def test_resume_refuses_a_completed_journal(storage, monkeypatch):
+    journal = spm.CheckpointJournal.create("apply_discount", "sale.jsonl", {"discount_percentage": 20})
+    journal.close(complete=True)
+    monkeypatch.setattr(spm, "apply_bulk_discount", lambda *args, **kwargs: pytest.fail("completed journal was resumed"))
+
+    assert spm.resume_operation(journal.path) == (0, 0)
+
+
+def test_resume_reruns_the_operation_with_its_parameters(storage, monkeypatch):
+    journal = spm.CheckpointJournal.create("apply_discount", "sale.jsonl", {"discount_percentage": 15})
+    journal.close()
+    calls = []
+    monkeypatch.setattr(spm, "apply_bulk_discount", lambda *args, **kwargs: calls.append((args, kwargs)) or (3, 0))
+
+    assert spm.resume_operation(journal.path, workers=2) == (3, 0)
+    assert calls == [(("sale.jsonl",), {"workers": 2, "resume_journal": journal.path, "discount_percentage": 15})]
+
+
+def test_resume_is_not_available_in_mock_mode(storage, monkeypatch):
+    journal = spm.CheckpointJournal.create("restore_prices", "sale.jsonl", {})
+    journal.close()
+    monkeypatch.setattr(spm, "MOCK_MODE", True)
+    with pytest.raises(ValueError):
+        spm.resume_operation(journal.path)
@@ -0,0 +1,123 @@
+"""Chunked market price updates and mapping chunk failures back to products"""
+
+import pytest
+
+import shopify_price_manager as spm
+
+PRICE_LIST = "gid://shopify/PriceList/1"
+
+
+def product(number):
+    return f"gid://shopify/Product/{number}"
+
+
+def market_updates(number, rows):
+    return {PRICE_LIST: {"name": "Europe", "prices": [
+        {"variant_id": f"gid://shopify/ProductVariant/{number}{row}", "price": {"amount": "9.00", "currencyCode": "EUR"}}
+        for row in range(rows)
+    ]}}
+
+
+class SentChunks:
+    """Stands in for send_price_list_prices, answering with queued responses (default: no errors)"""
+
+    def __init__(self):
+        self.chunks = []
+        self.responses = []
+
+    def __call__(self, price_list_id, prices):
+        self.chunks.append([price["variant_id"] for price in prices])
+        response = self.responses.pop(0) if self.responses else []
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = SentChunks()
+    monkeypatch.setattr(spm, "send_price_list_prices", sent)
+    return sent
+
+
+@pytest.fixture
+def journal(storage):
+    journal = spm.CheckpointJournal.create("apply_discount", "sale.jsonl", {})
+    yield journal
+    journal.close()
+
+
+def test_failed_price_indexes():
+    assert spm.failed_price_indexes([]) == set()
+    assert spm.failed_price_indexes([
+        {"field": ["prices", "2", "price"], "message": "too low"},
+        {"field": ["prices", "0"], "message": "unknown variant"},
+    ]) == {0, 2}
+    # Errors that don't point at a row can't be tied to a product
+    assert spm.failed_price_indexes([{"field": ["priceListId"], "message": "not found"}]) is None
+    assert spm.failed_price_indexes([{"field": None, "message": "failed"}]) is None
+
+
+def test_rows_from_several_products_share_a_chunk(sent, journal):
+    batcher = spm.PriceListBatcher(journal, chunk_size=3)
+    batcher.add_product(product(1), "One", market_updates(1, 2))
+    batcher.add_product(product(2), "Two", market_updates(2, 2))
+
+    assert sent.chunks == [["gid://shopify/ProductVariant/10", "gid://shopify/ProductVariant/11", "gid://shopify/ProductVariant/20"]]
+    assert journal.is_done(product(1))
+    assert not journal.is_done(product(2), PRICE_LIST)
+
+    batcher.flush()
+    assert sent.chunks[1:] == [["gid://shopify/ProductVariant/21"]]
+    assert journal.is_done(product(2), PRICE_LIST)
+    assert journal.is_done(product(2))
+    assert (batcher.sent_count, batcher.chunk_count, batcher.failed_products) == (4, 2, set())
+
+
+def test_failed_rows_are_mapped_to_their_products(sent, journal):
+    sent.responses.append([{"field": ["prices", "2", "price"], "message": "too low"}])
+    batcher = spm.PriceListBatcher(journal, chunk_size=4)
+    batcher.add_product(product(1), "One", market_updates(1, 2))
+    batcher.add_product(product(2), "Two", market_updates(2, 2))
+
+    # The rest of the chunk is sent again without the failed row
+    assert sent.chunks[1] == ["gid://shopify/ProductVariant/10", "gid://shopify/ProductVariant/11", "gid://shopify/ProductVariant/21"]
+    assert batcher.failed_products == {product(2)}
+    assert journal.is_done(product(1))
+    assert not journal.is_done(product(2), PRICE_LIST)
+    assert not journal.is_done(product(2))
+
+
+def test_failed_retry_fails_the_whole_chunk(sent, journal):
+    sent.responses.extend([
+        [{"field": ["prices", "0", "price"], "message": "too low"}],
+        [{"field": ["prices", "0"], "message": "throttled"}],
+    ])
+    batcher = spm.PriceListBatcher(journal, chunk_size=2)
+    batcher.add_product(product(1), "One", market_updates(1, 1))
+    batcher.add_product(product(2), "Two", market_updates(2, 1))
+
+    assert len(sent.chunks) == 2
+    assert batcher.failed_products == {product(1), product(2)}
+    assert not journal.is_done(product(1)) and not journal.is_done(product(2))
+
+
+def test_errors_without_a_row_fail_every_product_in_the_chunk(sent, journal):
+    sent.responses.append(spm.ShopifyAPIError("connection reset"))
+    batcher = spm.PriceListBatcher(journal, chunk_size=10)
+    batcher.add_product(product(1), "One", market_updates(1, 1))
+    batcher.add_product(product(2), "Two", market_updates(2, 1))
+    batcher.flush()
+
+    assert len(sent.chunks) == 1
+    assert batcher.failed_products == {product(1), product(2)}
+    assert journal.completed == set()
+
+
+def test_products_without_market_prices_are_journaled_at_once(sent, journal):
+    batcher = spm.PriceListBatcher(journal)
+    batcher.add_product(product(1), "One", {PRICE_LIST: {"name": "Europe", "prices": []}})
+
+    assert sent.chunks == []
+    assert journal.is_done(product(1), PRICE_LIST)
+    assert journal.is_done(product(1))
@@ -0,0 +1,144 @@
+"""Pricing rule files: validation, rule precedence, floors and charm endings"""
+
+import json
+
+import pytest
+
+import shopify_price_manager as spm
+
+EUROPE = "gid://shopify/PriceList/1"
+
+
+def make_product(number, prices, tags=(), skus=None, market=None):
+    """Backed up product with one variant per price; market is an optional {variant index: EUR price}"""
+    product_id = f"gid://shopify/Product/{number}"
+    variant_ids = [f"gid://shopify/ProductVariant/{number}{index}" for index in range(len(prices))]
+    product_data = {
+        "product": {
+            "id": product_id,
+            "handle": f"product-{number}",
+            "tags": list(tags),
+            "variants": {"edges": [
+                {"node": {"id": variant_id, "sku": (skus or {}).get(index, f"SKU-{number}{index}"), "price": price}}
+                for index, (variant_id, price) in enumerate(zip(variant_ids, prices))
+            ]}
+        },
+        "market_prices": {}
+    }
+    if market:
+        product_data["market_prices"][EUROPE] = {"name": "Europe", "currency": "EUR", "prices": [
+            {"variant_id": variant_ids[index], "price": {"amount": amount, "currencyCode": "EUR"}}
+            for index, amount in market.items()
+        ]}
+    return product_data
+
+
+def load(tmp_path, config):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(config))
+    return spm.PricingRules.load(str(path))
+
+
+def evaluate(tmp_path, config, products):
+    rules = load(tmp_path, config)
+    assert rules.compile()
+    return rules.evaluate(products)
+
+
+@pytest.mark.parametrize("cents, original, charm, floor, expected", [
+    (1640, 2050, 99, None, 1599),
+    (1650, 2050, 99, None, 1599),
+    (1699, 2050, 99, None, 1699),
+    (1640, 2050, 0, None, 1600),
+    # Charm rounding never takes a price to zero or below
+    (50, 100, 99, None, 50),
+    # The floor lifts a price, but never above the original
+    (50, 500, None, 100, 100),
+    (50, 80, None, 100, 80),
+    (0, 100, None, None, None),
+    (-150, 100, None, None, None),
+])
+def test_limit_price(cents, original, charm, floor, expected):
+    assert spm.limit_price(cents, original, charm, floor) == expected
+
+
+def test_first_matching_rule_wins(tmp_path):
+    products = [
+        make_product(1, ["10.00"]),
+        make_product(2, ["10.00"], tags=["clearance"]),
+        make_product(3, ["10.00"], tags=["clearance"]),
+    ]
+    variant_prices, _ = evaluate(tmp_path, {"rules": [
+        {"match": {"product_id": "gid://shopify/Product/3"}, "skip": True},
+        {"match": {"tag": ["clearance", "outlet"]}, "percent_off": 50},
+        {"percent_off": 20},
+        {"match": {"tag": "clearance"}, "percent_off": 90},
+    ]}, products)
+
+    assert variant_prices == {"gid://shopify/ProductVariant/10": "8.00", "gid://shopify/ProductVariant/20": "5.00"}
+
+
+def test_markets_and_sku_prefixes(tmp_path):
+    products = [make_product(1, ["20.00", "30.00"], skus={0: "ACC-1"}, market={0: "18.00", 1: "27.00"})]
+    variant_prices, market_prices = evaluate(tmp_path, {"rules": [
+        {"match": {"sku_prefix": ["ACC-", "GIFT-"], "market": "EUR"}, "amount_off": "5.00"},
+        {"match": {"market": "base"}, "percent_off": 25},
+        {"match": {"market": "Europe"}, "percent_off": 10},
+    ]}, products)
+
+    assert variant_prices == {"gid://shopify/ProductVariant/10": "15.00", "gid://shopify/ProductVariant/11": "22.50"}
+    assert market_prices == {(EUROPE, "gid://shopify/ProductVariant/10"): "13.00",
+                             (EUROPE, "gid://shopify/ProductVariant/11"): "24.30"}
+
+
+def test_rule_floor_and_charm_override_the_file(tmp_path):
+    products = [make_product(1, ["16.40"], tags=["clearance"]), make_product(2, ["20.50"]), make_product(3, ["1.50"])]
+    variant_prices, _ = evaluate(tmp_path, {"floor": "1.00", "charm": "0.99", "rules": [
+        {"match": {"tag": "clearance"}, "percent_off": 50, "charm": None, "floor": "9.00"},
+        {"percent_off": 20},
+    ]}, products)
+
+    assert variant_prices == {
+        "gid://shopify/ProductVariant/10": "9.00",
+        "gid://shopify/ProductVariant/20": "15.99",
+        "gid://shopify/ProductVariant/30": "1.00",
+    }
+
+
+def test_prices_that_would_be_free_are_left_unchanged(tmp_path):
+    products = [make_product(1, ["4.00", "12.00"])]
+    variant_prices, _ = evaluate(tmp_path, {"rules": [{"amount_off": "5.00"}]}, products)
+    assert variant_prices == {"gid://shopify/ProductVariant/11": "7.00"}
+
+
+def test_invalid_amounts_are_left_unchanged(tmp_path):
+    products = [make_product(1, ["19.999", "10.00"], market={0: "", 1: "9.00"})]
+    variant_prices, market_prices = evaluate(tmp_path, {"rules": [{"percent_off": 10}]}, products)
+    assert variant_prices == {"gid://shopify/ProductVariant/11": "9.00"}
+    assert market_prices == {(EUROPE, "gid://shopify/ProductVariant/11"): "8.10"}
+
+
+def test_rules_must_be_compiled_first(tmp_path):
+    rules = load(tmp_path, {"rules": [{"percent_off": 10}]})
+    with pytest.raises(RuntimeError):
+        rules.evaluate([make_product(1, ["10.00"])])
+
+
+@pytest.mark.parametrize("config", [
+    {"rules": []},
+    {"rules": [{"percent_off": 10, "skip": True}]},
+    {"rules": [{"match": {"vendor": "Acme"}, "percent_off": 10}]},
+    {"rules": [{"percent_off": 120}]},
+    {"rules": [{"percent_off": "lots"}]},
+    {"rules": [{"amount_off": "0.00"}]},
+    {"rules": [{"amount_off": "1.005"}]},
+    {"charm": "1.50", "rules": [{"percent_off": 10}]},
+    {"floor": "cheap", "rules": [{"percent_off": 10}]},
+])
+def test_invalid_rule_files_are_rejected(tmp_path, config):
+    assert load(tmp_path, config) is None
+
+
+def test_zero_percent_is_an_action(tmp_path):
+    rules = load(tmp_path, {"rules": [{"percent_off": 0, "skip": False}]})
+    assert rules.rules[0]["action"] == "percent_off"
@@ -0,0 +1,103 @@
+"""The SQLite snapshot store: ingest, export, price history and snapshot diffs"""
+
+import os
+
+import shopify_price_manager as spm
+
+EUROPE = "gid://shopify/PriceList/1"
+
+
+def backup_data(number, variants, market=None):
+    """A backed up product; variants are (variant number, sku, price, compare-at), market is {variant number: EUR price}"""
+    product_id = f"gid://shopify/Product/{number}"
+    return product_id, {
+        "metadata": {"timestamp": "2026-01-01T00:00:00", "shop": "test-shop", "product_id": product_id},
+        "product": {
+            "id": product_id,
+            "title": f"Product {number}",
+            "variants": {"edges": [
+                {"node": {"id": f"gid://shopify/ProductVariant/{variant}", "sku": sku, "price": price, "compareAtPrice": compare_at}}
+                for variant, sku, price, compare_at in variants
+            ]}
+        },
+        "market_prices": {EUROPE: {"name": "Europe", "currency": "EUR", "prices": [
+            {"variant_id": f"gid://shopify/ProductVariant/{variant}",
+             "price": {"amount": amount, "currencyCode": "EUR"}, "compare_at_price": None}
+            for variant, amount in market.items()
+        ]}} if market else {}
+    }
+
+
+def write_backup(name, products):
+    path = os.path.join(spm.BACKUP_DIR, f"{name}{spm.BACKUP_EXTENSION}")
+    with spm.BackupWriter(path, name, scope="all products") as writer:
+        for product_id, product_data in products:
+            writer.write_product(product_id, product_data)
+    return path
+
+
+def test_export_reproduces_the_backup(storage):
+    path = write_backup("before", [
+        backup_data(1, [(11, "A", "10.00", "12.00"), (12, "B", "20.00", None)], {11: "9.00"}),
+        backup_data(2, [(21, "C", "5.00", None)]),
+    ])
+    with spm.SnapshotStore() as store:
+        snapshot_id = store.ingest(path)
+        # The same file is only ingested once
+        assert store.ingest(path) == snapshot_id
+        [snapshot] = store.snapshots()
+        assert (snapshot["id"], snapshot["name"], snapshot["scope"]) == (snapshot_id, "before", "all products")
+        assert (snapshot["products"], snapshot["variants"]) == (2, 3)
+
+        exported = str(storage / "exported.jsonl")
+        store.export(snapshot_id, exported)
+
+    with open(path, 'rb') as original, open(exported, 'rb') as copy:
+        assert original.read() == copy.read()
+
+
+def test_history_and_diff(storage):
+    before = write_backup("before", [
+        backup_data(1, [(11, "A", "10.00", None), (12, "B", "20.00", None), (13, "C", "30.00", None)], {11: "9.00", 12: "18.00"}),
+    ])
+    after = write_backup("after", [
+        backup_data(1, [(11, "A", "8.00", "10.00"), (12, "B", "20.00", None), (14, "D", "40.00", None)], {11: "7.20", 14: "36.00"}),
+    ])
+    with spm.SnapshotStore() as store:
+        old = store.ingest(before)
+        new = store.ingest(after)
+
+        history = store.history(sku="A")
+        assert [(row["snapshot_id"], row["market"], row["price_cents"], row["compare_at_cents"]) for row in history] == [
+            (old, "base", 1000, None), (old, "Europe", 900, None),
+            (new, "base", 800, 1000), (new, "Europe", 720, None),
+        ]
+        assert [row["price_cents"] for row in store.history(variant_id="gid://shopify/ProductVariant/11", market="EUR")] == [900, 720]
+
+        changes = {(row["variant_id"][-2:], row["market"]): row for row in store.diff(old, new)}
+
+    assert {key: row["change"] for key, row in changes.items()} == {
+        ("11", "base"): "changed",
+        ("11", "Europe"): "changed",
+        ("12", "Europe"): "removed",
+        ("13", "base"): "removed",
+        ("14", "base"): "added",
+        ("14", "Europe"): "added",
+    }
+    changed = changes[("11", "base")]
+    assert (changed["old_price_cents"], changed["new_price_cents"]) == (1000, 800)
+    assert (changed["old_compare_at_cents"], changed["new_compare_at_cents"]) == (None, 1000)
+    assert changes[("12", "Europe")]["sku"] == "B"
+    assert changes[("14", "base")]["old_price_cents"] is None
+    assert (changes[("14", "Europe")]["sku"], changes[("14", "Europe")]["new_price_cents"]) == ("D", 3600)
+
+
+def test_invalid_amounts_leave_no_snapshot_behind(storage):
+    path = write_backup("broken", [
+        backup_data(1, [(11, "A", "10.00", None)]),
+        backup_data(2, [(21, "B", "10.005", None)]),
+    ])
+    assert spm.ingest_backup(path) is None
+    with spm.SnapshotStore() as store:
+        assert store.snapshots() == []
+        assert store.connection.execute("SELECT COUNT(*) FROM variant_prices").fetchone()[0] == 0